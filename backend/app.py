@@ -8,7 +8,20 @@ import numpy as np
 import io
 import os
 import json
+import threading
+import queue
+import random
+import time
+import hmac
+from collections import OrderedDict, deque
 from datetime import datetime
+from sampling_profiler import SamplingProfiler, native_section, request_started, request_finished
+from feedback_index import FeedbackSpatialIndex, FeedbackRollups, parse_bbox
+from asset_manifest import AssetManifest
+from image_variants import ImageVariantCache, negotiate_format, snap_width
+from server_tuning import load_tuning
+from werkzeug.security import safe_join
+from image_quality import ImageQualityValidator
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
@@ -22,57 +35,669 @@ else:
         os.path.join(BASE_DIR, '..', 'galerias'))  # Local
 app.static_folder = GALERIAS_DIR
 
-# Carregar o modelo
-model_path = os.path.join(
-    BASE_DIR, 'models', 'insect_classifier.tflite')
-# Para TFLite, usaremos o interpretador
-interpreter = tf.lite.Interpreter(model_path=model_path)
-interpreter.allocate_tensors()
-
-# Obter detalhes de entrada e saída
-input_details = interpreter.get_input_details()
-output_details = interpreter.get_output_details()
+MODELS_DIR = os.path.join(BASE_DIR, 'models')
+MODEL_REGISTRY_FILE = os.path.join(MODELS_DIR, 'model_registry.json')
+DEFAULT_MODEL = os.environ.get('DEFAULT_MODEL', 'default')
+# Quantos interpretadores TFLite podem ficar carregados ao mesmo tempo
+MAX_LOADED_MODELS = int(os.environ.get('MAX_LOADED_MODELS', 2))
+# Threads do TFLite: variável de ambiente ou server_tuning.json (server_tuning.py)
+TFLITE_NUM_THREADS = int(os.environ.get('TFLITE_NUM_THREADS', 0)) or \
+    load_tuning().get('tflite_threads')
 
+# Rótulos usados quando o modelo não tem um model_info com as categorias
 categories = ['aranhas', 'besouro_carabideo', 'crisopideo', 'joaninhas', 'libelulas',
               'mosca_asilidea', 'mosca_dolicopodidea', 'mosca_sirfidea', 'mosca_taquinidea',
               'percevejo_geocoris', 'percevejo_orius', 'percevejo_pentatomideo',
               'percevejo_reduviideo', 'tesourinha', 'vespa_parasitoide', 'vespa_predadora']
 
 
+class LoadedModel:
+    """Interpretador TFLite carregado com seus rótulos"""
+
+    def __init__(self, name, path, labels):
+        self.name = name
+        self.path = path
+        self.labels = labels
+        self.interpreter = tf.lite.Interpreter(
+            model_path=path, num_threads=TFLITE_NUM_THREADS)
+        self.interpreter.allocate_tensors()
+        self.input_details = self.interpreter.get_input_details()
+        self.output_details = self.interpreter.get_output_details()
+        # Modelos exportados por export_tflite.py recebem a imagem uint8 crua:
+        # conversão, resize e normalização acontecem dentro do grafo
+        self.fused = self.input_details[0]['dtype'] == np.uint8
+        signature = list(self.input_details[0].get(
+            'shape_signature', self.input_details[0]['shape']))
+        self.dynamic_input = -1 in signature[1:3]
+        # Lote variável (export_tflite.py com batch None): a TTA roda em um invoke
+        self.dynamic_batch = signature[0] == -1
+        # O interpretador não é thread-safe
+        self.lock = threading.Lock()
+        self.loaded_at = datetime.now().isoformat()
+        self.requests = 0
+        # Memória medida quando os tensores são (re)alocados, para que /models
+        # não percorra o interpretador enquanto uma inferência o redimensiona
+        self.model_bytes = os.path.getsize(path)
+        self.tensor_bytes = self._tensor_bytes()
+
+    @property
+    def input_size(self):
+        """Lado da imagem de entrada (modelos com entrada variável usam 224)"""
+        if self.fused and not self.dynamic_input:
+            return int(self.input_details[0]['shape'][1])
+        return 224
+
+    def prepare_batch(self, views):
+        """Converte um lote uint8 (N, H, W, 3) na entrada do modelo"""
+        return views if self.fused else normalize_batch(views)
+
+    def prepare(self, image):
+        """Converte a imagem PIL (RGB) na entrada esperada por este modelo"""
+        if not self.fused:
+            return preprocess_image(image)
+        if not self.dynamic_input:
+            height, width = self.input_details[0]['shape'][1:3]
+            image = image.resize((int(width), int(height)))
+        return np.expand_dims(np.asarray(image, dtype=np.uint8), axis=0)
+
+    def _resize_input(self, shape):
+        self.interpreter.resize_tensor_input(self.input_details[0]['index'], shape)
+        self.interpreter.allocate_tensors()
+        self.input_details = self.interpreter.get_input_details()
+        self.output_details = self.interpreter.get_output_details()
+        self.tensor_bytes = self._tensor_bytes()
+
+    def _tensor_bytes(self):
+        """Bytes dos tensores alocados (chamar com self.lock ou antes de publicar o modelo)"""
+        return sum(int(np.prod(detail['shape'])) * np.dtype(detail['dtype']).itemsize
+                   for detail in self.interpreter.get_tensor_details())
+
+    def _invoke(self, array):
+        """Executa o interpretador (chamar com self.lock)"""
+        if tuple(self.input_details[0]['shape']) != array.shape:
+            self._resize_input(array.shape)
+        self.interpreter.set_tensor(self.input_details[0]['index'], array)
+        with native_section('interpreter.invoke'):
+            self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.output_details[0]['index'])
+
+    def predict(self, image_array):
+        """Executa a inferência e retorna o vetor de probabilidades"""
+        with self.lock:
+            self.requests += 1
+            return self._invoke(image_array)
+
+    def predict_batch(self, batch):
+        """
+        Inferência de um lote (N, H, W, 3). Modelos com lote variável usam uma
+        única chamada a invoke; os de lote fixo em 1, uma chamada por vista
+        """
+        with self.lock:
+            self.requests += 1
+            if self.dynamic_batch:
+                try:
+                    return self._invoke(batch)
+                except (RuntimeError, ValueError) as e:
+                    print(f"Lote não suportado por {self.name}, usando invokes sequenciais: {e}")
+                    self.dynamic_batch = False
+                    self._resize_input(batch[:1].shape)
+            return np.concatenate([self._invoke(batch[i:i + 1]) for i in range(len(batch))])
+
+    def memory_bytes(self):
+        """Estimativa de memória: arquivo do modelo + tensores alocados (valores em cache)"""
+        return {
+            'model_bytes': self.model_bytes,
+            'tensor_bytes': self.tensor_bytes
+        }
+
+
+class ModelRegistry:
+    """
+    Registro de modelos TFLite com carregamento sob demanda.
+    Mantém no máximo `max_loaded` interpretadores em memória (LRU).
+    """
+
+    def __init__(self, models_dir, registry_file=None, max_loaded=2):
+        self.models_dir = models_dir
+        self.registry_file = registry_file
+        self.max_loaded = max(1, max_loaded)
+        self.loaded = OrderedDict()
+        self.lock = threading.Lock()
+        # Um lock por modelo em carregamento
+        self.load_locks = {}
+        self.stats = {}
+        self.available = self._discover()
+
+    def _discover(self):
+        """
+        Descobre os modelos disponíveis: todo .tflite em models/ e as
+        entradas de models/model_registry.json (variantes regionais etc.)
+        """
+        available = {}
+        if os.path.isdir(self.models_dir):
+            for filename in sorted(os.listdir(self.models_dir)):
+                if not filename.endswith('.tflite'):
+                    continue
+                stem = filename[:-len('.tflite')]
+                # insect_classifier_optimized.tflite -> optimized
+                suffix = stem[len('insect_classifier'):] \
+                    if stem.startswith('insect_classifier') else None
+                name = (suffix.lstrip('_') or 'default') \
+                    if suffix is not None else stem
+                info_file = os.path.join(
+                    self.models_dir, f'model_info{suffix}.json') \
+                    if suffix is not None else None
+                available[name] = {
+                    'path': os.path.join(self.models_dir, filename),
+                    'labels': info_file
+                }
+
+        if self.registry_file and os.path.exists(self.registry_file):
+            with open(self.registry_file, 'r', encoding='utf-8') as f:
+                for name, entry in json.load(f).items():
+                    if isinstance(entry, str):
+                        entry = {'path': entry}
+                    path = os.path.join(self.models_dir, entry['path'])
+                    labels = entry.get('labels')
+                    if isinstance(labels, str):
+                        labels = os.path.join(self.models_dir, labels)
+                    available[name] = {'path': path, 'labels': labels}
+
+        return available
+
+    def _load_labels(self, labels):
+        """Lê os rótulos (lista ou arquivo model_info/json de rótulos)"""
+        if isinstance(labels, list):
+            return labels
+        if labels and os.path.exists(labels):
+            with open(labels, 'r', encoding='utf-8') as f:
+                info = json.load(f)
+            if isinstance(info, list):
+                return info
+            for key in ('categories', 'classes', 'labels'):
+                if key in info:
+                    return info[key]
+        return categories
+
+    def _stats_for(self, name):
+        return self.stats.setdefault(
+            name, {'loads': 0, 'evictions': 0, 'last_used': None})
+
+    def load(self, name):
+        """Carrega um novo interpretador do modelo, fora do LRU"""
+        entry = self.available[name]
+        return LoadedModel(name, entry['path'], self._load_labels(entry['labels']))
+
+    def _touch(self, name):
+        """Marca o modelo como o mais recente do LRU (chamar com self.lock)"""
+        model = self.loaded.get(name)
+        if model is not None:
+            self.loaded.move_to_end(name)
+            self._stats_for(name)['last_used'] = datetime.now().isoformat()
+        return model
+
+    def get(self, name=None):
+        """Retorna o modelo carregado, carregando-o (e descartando o menos usado) se preciso"""
+        name = name or DEFAULT_MODEL
+        if name not in self.available:
+            raise KeyError(name)
+
+        with self.lock:
+            model = self._touch(name)
+            if model is not None:
+                return model
+            load_lock = self.load_locks.setdefault(name, threading.Lock())
+
+        # A carga acontece fora do lock global, para não bloquear as requisições
+        # de modelos já carregados; o lock por modelo evita cargas duplicadas
+        with load_lock:
+            with self.lock:
+                model = self._touch(name)
+                if model is not None:
+                    return model
+
+            model = self.load(name)
+
+            with self.lock:
+                self.loaded[name] = model
+                self._stats_for(name)['loads'] += 1
+                while len(self.loaded) > self.max_loaded:
+                    evicted, _ = self.loaded.popitem(last=False)
+                    self._stats_for(evicted)['evictions'] += 1
+                return self._touch(name)
+
+    def describe(self):
+        """Estatísticas de carga/descarte e memória por modelo"""
+        with self.lock:
+            models = {}
+            for name, entry in self.available.items():
+                stats = dict(self._stats_for(name))
+                model = self.loaded.get(name)
+                stats['path'] = os.path.relpath(entry['path'], BASE_DIR)
+                stats['loaded'] = model is not None
+                if model is not None:
+                    stats['labels'] = len(model.labels)
+                    stats['requests'] = model.requests
+                    stats['memory'] = model.memory_bytes()
+                models[name] = stats
+
+            return {
+                'default_model': DEFAULT_MODEL,
+                'max_loaded': self.max_loaded,
+                'loaded': list(self.loaded.keys()),
+                'models': models
+            }
+
+
+registry = ModelRegistry(MODELS_DIR, MODEL_REGISTRY_FILE, MAX_LOADED_MODELS)
+# Carregar o modelo padrão na inicialização
+registry.get(DEFAULT_MODEL)
+
+
+# Modo sombra: uma fração das entradas de /classify também passa pelo modelo candidato
+SHADOW_MODEL = os.environ.get('SHADOW_MODEL')
+SHADOW_SAMPLE_RATE = float(os.environ.get('SHADOW_SAMPLE_RATE', 0.1))
+SHADOW_QUEUE_SIZE = int(os.environ.get('SHADOW_QUEUE_SIZE', 64))
+
+
+class ShadowEvaluator:
+    """
+    Avalia um modelo candidato sobre o tráfego real em uma thread de fundo.
+    A requisição só enfileira a entrada (sem bloquear); as métricas de
+    concordância e latência são mantidas como agregados incrementais.
+    O candidato tem um interpretador próprio, fora do LRU do registro, para
+    não descartar nem recarregar os modelos usados pelas requisições.
+    """
+
+    def __init__(self, registry, candidate, sample_rate, queue_size=64, window=1000):
+        self.registry = registry
+        self.candidate = candidate
+        self.model = None
+        self.sample_rate = sample_rate
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.stats = {
+            'sampled': 0,
+            'dropped': 0,
+            'evaluated': 0,
+            'errors': 0,
+            'agreements': 0,
+            'confidence_delta_sum': 0.0,
+            'primary_latency_sum': 0.0,
+            'candidate_latency_sum': 0.0,
+            'candidate_latency_max': 0.0
+        }
+        self.class_stats = {}
+        self.recent_latencies = deque(maxlen=window)
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def submit(self, image, primary_model, primary_labels, predictions, primary_latency):
+        """Enfileira uma amostra para avaliação; descarta se a fila estiver cheia"""
+        if primary_model == self.candidate or random.random() >= self.sample_rate:
+            return
+        try:
+            self.queue.put_nowait(
+                (image, primary_labels, predictions[0], primary_latency))
+            with self.lock:
+                self.stats['sampled'] += 1
+        except queue.Full:
+            with self.lock:
+                self.stats['dropped'] += 1
+
+    def _run(self):
+        while True:
+            image, primary_labels, primary_probs, primary_latency = self.queue.get()
+            try:
+                if self.model is None:
+                    self.model = self.registry.load(self.candidate)
+                model = self.model
+                start = time.perf_counter()
+                candidate_probs = model.predict(model.prepare(image))[0]
+                latency = time.perf_counter() - start
+                self._record(primary_labels, primary_probs, model.labels,
+                             candidate_probs, primary_latency, latency)
+            except Exception as e:
+                print(f"Erro na avaliação sombra: {e}")
+                with self.lock:
+                    self.stats['errors'] += 1
+            finally:
+                self.queue.task_done()
+
+    def _record(self, primary_labels, primary_probs, candidate_labels,
+                candidate_probs, primary_latency, latency):
+        primary_class = primary_labels[int(np.argmax(primary_probs))]
+        candidate_class = candidate_labels[int(np.argmax(candidate_probs))]
+        agree = primary_class == candidate_class
+
+        with self.lock:
+            self.stats['evaluated'] += 1
+            self.stats['agreements'] += int(agree)
+            self.stats['confidence_delta_sum'] += float(
+                np.max(candidate_probs) - np.max(primary_probs))
+            self.stats['primary_latency_sum'] += primary_latency
+            self.stats['candidate_latency_sum'] += latency
+            self.stats['candidate_latency_max'] = max(
+                self.stats['candidate_latency_max'], latency)
+            self.recent_latencies.append(latency)
+
+            class_stats = self.class_stats.setdefault(
+                primary_class, {'total': 0, 'agreements': 0, 'candidate_classes': {}})
+            class_stats['total'] += 1
+            class_stats['agreements'] += int(agree)
+            if not agree:
+                class_stats['candidate_classes'][candidate_class] = \
+                    class_stats['candidate_classes'].get(candidate_class, 0) + 1
+
+    def summary(self):
+        """Resumo dos agregados acumulados"""
+        with self.lock:
+            stats = dict(self.stats)
+            evaluated = stats['evaluated']
+            latencies = sorted(self.recent_latencies)
+            class_agreement = {
+                name: {
+                    'total': c['total'],
+                    'agreement_rate': round(c['agreements'] / c['total'] * 100, 2),
+                    'candidate_classes': dict(c['candidate_classes'])
+                }
+                for name, c in self.class_stats.items()
+            }
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000 \
+                if latencies else 0
+
+        return {
+            'candidate': self.candidate,
+            'sample_rate': self.sample_rate,
+            'queue_size': self.queue.qsize(),
+            'sampled': stats['sampled'],
+            'dropped': stats['dropped'],
+            'evaluated': evaluated,
+            'errors': stats['errors'],
+            'agreement_rate': round(stats['agreements'] / evaluated * 100, 2) if evaluated else 0,
+            'mean_confidence_delta': round(stats['confidence_delta_sum'] / evaluated, 4) if evaluated else 0,
+            'primary_latency_ms': round(stats['primary_latency_sum'] / evaluated * 1000, 2) if evaluated else 0,
+            'candidate_latency_ms': {
+                'mean': round(stats['candidate_latency_sum'] / evaluated * 1000, 2) if evaluated else 0,
+                'p50': round(percentile(0.5), 2),
+                'p95': round(percentile(0.95), 2),
+                'max': round(stats['candidate_latency_max'] * 1000, 2)
+            },
+            'class_agreement': class_agreement,
+            # Agregados só deste processo do gunicorn, não do serviço inteiro
+            'scope': 'worker',
+            'worker': {'pid': os.getpid(), 'sampled': stats['sampled'], 'evaluated': evaluated}
+        }
+
+
+shadow = None
+if SHADOW_MODEL:
+    if SHADOW_MODEL in registry.available:
+        shadow = ShadowEvaluator(
+            registry, SHADOW_MODEL, SHADOW_SAMPLE_RATE, SHADOW_QUEUE_SIZE)
+    else:
+        print(f"Modelo sombra não encontrado: {SHADOW_MODEL}")
+
+
+# Filtro de qualidade antes da inferência (blur/brilho em versão reduzida da imagem).
+# Os limiares valem para a imagem reduzida a QUALITY_GATE_SIZE px, não para a original.
+QUALITY_GATE_ENABLED = os.environ.get('QUALITY_GATE_ENABLED', '1') == '1'
+QUALITY_GATE_SIZE = 256
+quality_gate = ImageQualityValidator(
+    min_size=(64, 64),
+    max_blur_threshold=float(os.environ.get('QUALITY_GATE_MIN_BLUR', 30.0)),
+    min_brightness=float(os.environ.get('QUALITY_GATE_MIN_BRIGHTNESS', 0.08)),
+    max_brightness=float(os.environ.get('QUALITY_GATE_MAX_BRIGHTNESS', 0.95)))
+
+QUALITY_MESSAGES = {
+    'too_small': 'Image too small',
+    'too_blurry': 'Image too blurry',
+    'too_dark': 'Image too dark',
+    'too_bright': 'Image too bright'
+}
+
+
+# Decodificação JPEG reduzida (escala DCT) antes do resize; altera levemente os
+# pixels entregues ao modelo, por isso só é usada quando ativada
+JPEG_DRAFT_DECODE = os.environ.get('JPEG_DRAFT_DECODE', '0') == '1'
+
+
+def decode_image(image_bytes):
+    """
+    Decodifica a imagem em RGB e retorna a imagem e o tamanho original.
+    Com JPEG_DRAFT_DECODE=1, JPEGs já saem reduzidos a no mínimo 448 px.
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    original_size = image.size
+    if JPEG_DRAFT_DECODE:
+        image.draft('RGB', (448, 448))
+    return image.convert('RGB'), original_size
+
+
+def check_image_quality(image, original_size):
+    """Avalia blur e brilho numa versão em cinza de até 256 px"""
+    small = image.copy()
+    small.thumbnail((QUALITY_GATE_SIZE, QUALITY_GATE_SIZE))
+    gray = np.asarray(small.convert('L'))
+    return quality_gate.assess_gray(gray, original_size)
+
+
+IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+IMAGENET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+
+def normalize_batch(batch):
+    """Normalização ImageNet de um lote (N, H, W, 3)"""
+    return (batch.astype(np.float32) / 255.0 - IMAGENET_MEAN) / IMAGENET_STD
+
+
+def preprocess_image(image):
+    """Aplica redimensionamento e normalização ImageNet (modelos sem pré-processamento embutido)"""
+    image = image.resize((224, 224))
+    image_array = img_to_array(image)
+    image_array = np.expand_dims(image_array, axis=0)
+    return normalize_batch(image_array)
+
+
+# Test-time augmentation: ativado automaticamente abaixo deste nível de confiança
+TTA_CONFIDENCE_THRESHOLD = float(
+    os.environ.get('TTA_CONFIDENCE_THRESHOLD', 0.6))
+
+
+def build_tta_views(image, size=224):
+    """
+    Monta as 7 vistas aumentadas da TTA em um único array uint8 (7, size, size, 3):
+    imagem espelhada na horizontal e na vertical, recorte central e os quatro
+    recortes dos cantos (a partir da imagem em 256/224 da escala). A vista
+    original não entra: a predição normal já a avaliou
+    """
+    full = np.asarray(image.resize((size, size)), dtype=np.uint8)
+    scaled = size * 256 // 224
+    base = np.asarray(image.resize((scaled, scaled)), dtype=np.uint8)
+
+    # Os cinco recortes saem de uma única indexação avançada
+    margin = scaled - size
+    center = margin // 2
+    offsets = np.array([(center, center), (0, 0), (0, margin),
+                        (margin, 0), (margin, margin)])
+    index = np.arange(size)
+    rows = offsets[:, 0, None] + index
+    cols = offsets[:, 1, None] + index
+    crops = base[rows[:, :, None], cols[:, None, :]]
+
+    return np.concatenate([full[None, :, ::-1], full[None, ::-1], crops])
+
+
 @app.route('/classify', methods=['POST'])
 def classify_insect():
     if 'image' not in request.files:
         return jsonify({'error': 'No image provided'}), 400
 
+    model_name = request.args.get('model') or request.form.get('model')
     try:
-        image = request.files['image'].read()
-        image = Image.open(io.BytesIO(image)).convert('RGB')
-        image = image.resize((224, 224))
-        image_array = img_to_array(image)
-        image_array = np.expand_dims(image_array, axis=0)
-
-        # Normalização ImageNet
-        image_array = image_array.astype(np.float32) / 255.0
-        mean = np.array([0.485, 0.456, 0.406])
-        std = np.array([0.229, 0.224, 0.225])
-        image_array = (image_array - mean) / std
-
-        # Usar TFLite interpreter
-        interpreter.set_tensor(input_details[0]['index'], image_array)
-        interpreter.invoke()
-
-        predictions = interpreter.get_tensor(output_details[0]['index'])
-        predicted_class = categories[np.argmax(predictions[0])]
+        model = registry.get(model_name)
+    except KeyError:
+        return jsonify({'error': f'Unknown model: {model_name}'}), 404
+
+    try:
+        image, original_size = decode_image(request.files['image'].read())
+
+        if QUALITY_GATE_ENABLED:
+            quality = check_image_quality(image, original_size)
+            if not quality['valid']:
+                return jsonify({
+                    'error': QUALITY_MESSAGES[quality['reasons'][0]],
+                    'rejected': True,
+                    'reasons': quality['reasons'],
+                    'blur_score': round(quality['blur_score'], 2),
+                    'brightness': round(quality['brightness'], 3),
+                    'model': model.name
+                }), 422
+
+        start = time.perf_counter()
+        image_array = model.prepare(image)
+        predictions = model.predict(image_array)
+        latency = time.perf_counter() - start
         confidence = float(np.max(predictions[0]))
 
-        return jsonify({
+        if shadow is not None:
+            shadow.submit(image, model.name, model.labels, predictions, latency)
+
+        # tta=auto (padrão): só abaixo do limiar; tta=on: sempre; tta=off: nunca
+        tta_mode = request.args.get('tta', 'auto')
+        single_view_confidence = confidence
+        use_tta = tta_mode == 'on' or (
+            tta_mode == 'auto' and confidence < TTA_CONFIDENCE_THRESHOLD)
+        if use_tta:
+            views = build_tta_views(image, model.input_size)
+            batch_predictions = model.predict_batch(model.prepare_batch(views))
+            # Média com a predição da imagem original, já calculada acima
+            predictions = np.concatenate([predictions, batch_predictions]).mean(
+                axis=0, keepdims=True)
+            confidence = float(np.max(predictions[0]))
+
+        predicted_class = model.labels[np.argmax(predictions[0])]
+
+        result = {
             'predicted_class': predicted_class,
-            'confidence': confidence
-        })
+            'confidence': confidence,
+            'model': model.name
+        }
+        if use_tta:
+            result['tta'] = True
+            result['tta_views'] = len(views) + 1
+            result['single_view_confidence'] = single_view_confidence
+        return jsonify(result)
     except Exception as e:
         return jsonify({'error': f'Classification failed: {str(e)}'}), 500
 
 
+@app.route('/models', methods=['GET'])
+def get_models():
+    """
+    Lista os modelos disponíveis, os carregados e as estatísticas de cada um
+    """
+    return jsonify(registry.describe())
+
+
+@app.route('/shadow/stats', methods=['GET'])
+def get_shadow_stats():
+    """
+    Retorna a concordância e a latência do modelo candidato (modo sombra),
+    medidas pelo processo que atendeu a requisição
+    """
+    if shadow is None:
+        return jsonify({'enabled': False, 'scope': 'worker', 'worker': {'pid': os.getpid()}})
+    return jsonify(dict(shadow.summary(), enabled=True))
+
+
+# Profiler sob demanda (somente admin, via cabeçalho X-Admin-Token)
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+PROFILES_DIR = os.path.join(BASE_DIR, 'profiles')
+PROFILE_MAX_SECONDS = int(os.environ.get('PROFILE_MAX_SECONDS', 120))
+# Intervalo mínimo entre amostras: abaixo disso o amostrador vira um loop ocupado
+PROFILE_MIN_INTERVAL_MS = 1
+active_profiler = None
+
+
+@app.before_request
+def mark_request_thread():
+    request_started()
+
+
+@app.teardown_request
+def unmark_request_thread(exc):
+    request_finished()
+
+
+def is_admin():
+    token = request.headers.get('X-Admin-Token', '')
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+@app.route('/admin/profile', methods=['POST'])
+def start_profile():
+    """
+    Inicia o profiler por amostragem neste worker por N segundos.
+    O resultado (collapsed stacks) fica disponível em /admin/profile/<id>
+    """
+    global active_profiler
+    if not is_admin():
+        return jsonify({'error': 'Acesso negado'}), 403
+
+    if active_profiler is not None and active_profiler.running:
+        return jsonify({'error': 'Profiler já em execução neste worker'}), 409
+
+    try:
+        seconds = float(request.args.get('seconds', 10))
+        interval = float(request.args.get('interval_ms', 5)) / 1000.0
+        all_threads = request.args.get('all_threads') == '1'
+    except ValueError:
+        return jsonify({'error': 'Parâmetros inválidos'}), 400
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        return jsonify({'error': f'seconds deve estar entre 0 e {PROFILE_MAX_SECONDS}'}), 400
+    if interval < PROFILE_MIN_INTERVAL_MS / 1000.0:
+        return jsonify({'error': f'interval_ms deve ser no mínimo {PROFILE_MIN_INTERVAL_MS}'}), 400
+
+    os.makedirs(PROFILES_DIR, exist_ok=True)
+    profile_id = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{os.getpid()}"
+    output_path = os.path.join(PROFILES_DIR, f'{profile_id}.collapsed')
+    active_profiler = SamplingProfiler(
+        seconds, interval, output_path, all_threads=all_threads).start()
+
+    return jsonify({
+        'profile_id': profile_id,
+        'pid': os.getpid(),
+        'seconds': seconds,
+        'result_url': f'/admin/profile/{profile_id}',
+        'summary_url': f'/admin/profile/{profile_id}?format=summary'
+    }), 202
+
+
+@app.route('/admin/profile/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """
+    Baixa o arquivo collapsed stacks (compatível com flamegraph.pl e speedscope).
+    Com ?format=summary retorna o resumo (amostras totais, ociosas e nativas)
+    """
+    if not is_admin():
+        return jsonify({'error': 'Acesso negado'}), 403
+
+    filename = f'{os.path.basename(profile_id)}.collapsed'
+    if not os.path.exists(os.path.join(PROFILES_DIR, filename)):
+        return jsonify({'status': 'running or not found'}), 404
+    if request.args.get('format') == 'summary':
+        summary_file = os.path.join(PROFILES_DIR, f'{filename}.json')
+        if not os.path.exists(summary_file):
+            return jsonify({'status': 'summary not found'}), 404
+        with open(summary_file, 'r', encoding='utf-8') as f:
+            return jsonify(json.load(f))
+    return send_from_directory(PROFILES_DIR, filename, mimetype='text/plain',
+                               as_attachment=True)
+
+
 @app.route('/images/<species>', methods=['GET'])
 def get_images(species):
     image_dir = os.path.join(GALERIAS_DIR, species)  # Usa o caminho absoluto
@@ -84,18 +709,163 @@ def get_images(species):
     # Ordena numericamente
     images.sort(key=lambda x: int(''.join(filter(str.isdigit, x))))
     image_urls = [f'/galerias/{species}/{img}' for img in images]
-    return jsonify(image_urls)
+    if request.args.get('srcset') != '1':
+        return jsonify(image_urls)
+
+    # Miniaturas pré-geradas por generate_thumbnails.py (<especie>/thumbs/)
+    thumbs_index = {}
+    thumbs_index_file = os.path.join(image_dir, 'thumbs', 'index.json')
+    if os.path.exists(thumbs_index_file):
+        with open(thumbs_index_file, 'r', encoding='utf-8') as f:
+            thumbs_index = json.load(f)
+
+    result = []
+    for img, url in zip(images, image_urls):
+        thumbnails = [
+            {
+                'url': f"/galerias/{species}/thumbs/{thumb['file']}",
+                'width': thumb['width'],
+                'height': thumb['height']
+            }
+            for _, thumb in sorted(thumbs_index.get(img, {}).get('thumbnails', {}).items(),
+                                   key=lambda item: int(item[0]))
+        ]
+        result.append({
+            'url': url,
+            'thumbnails': thumbnails,
+            'srcset': ', '.join(f"{t['url']} {t['width']}w" for t in thumbnails)
+        })
+    return jsonify(result)
+
+
+# Cache em disco das variantes redimensionadas (?w=320&fmt=webp)
+IMAGE_CACHE_DIR = os.environ.get(
+    'IMAGE_CACHE_DIR', os.path.join(BASE_DIR, 'image_cache'))
+IMAGE_CACHE_MAX_BYTES = int(
+    os.environ.get('IMAGE_CACHE_MAX_MB', 512)) * 1024 * 1024
+image_variants = ImageVariantCache(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES)
 
 
 @app.route('/galerias/<path:filename>')
 def serve_image(filename):
     print(f"Tentando acessar: {os.path.join(GALERIAS_DIR, filename)}")  # Debug
-    return send_from_directory(GALERIAS_DIR, filename)
+    width = request.args.get('w')
+    fmt = request.args.get('fmt')
+    if not width and not fmt:
+        return send_from_directory(GALERIAS_DIR, filename)
+
+    source_path = safe_join(GALERIAS_DIR, filename)
+    if source_path is None or not os.path.isfile(source_path):
+        return jsonify({'error': 'Image not found'}), 404
+
+    try:
+        width = snap_width(int(width)) if width else snap_width(10 ** 6)
+        fmt = negotiate_format(
+            fmt, request.headers.get('Accept', ''), source_path)
+    except ValueError as e:
+        return jsonify({'error': f'Parâmetro inválido: {str(e)}'}), 400
+
+    # O LRU (de qualquer worker) pode remover a variante entre get e send_file:
+    # nesse caso ela é gerada de novo
+    for attempt in range(3):
+        try:
+            variant_path, mimetype = image_variants.get(source_path, width, fmt)
+        except ValueError as e:
+            return jsonify({'error': f'Imagem inválida: {str(e)}'}), 400
+        try:
+            # send_file usa o file_wrapper do servidor (sendfile no gunicorn)
+            response = send_file(variant_path, mimetype=mimetype,
+                                 conditional=True, max_age=86400)
+            break
+        except FileNotFoundError:
+            if attempt == 2:
+                raise
+    response.headers['Vary'] = 'Accept'
+    return response
+
+
+# Manifesto de assets (galerias + modelos) para sincronização incremental do app
+MODEL_ASSET_EXTENSIONS = ('.tflite', '.json')
+asset_manifest = AssetManifest(
+    [
+        {'dir': GALERIAS_DIR, 'url_prefix': '/galerias',
+         'extensions': ('.jpg', '.jpeg', '.png', '.webp', '.json'),
+         'exclude_dirs': ('thumbs',)},
+        {'dir': MODELS_DIR, 'url_prefix': '/assets/models',
+         'extensions': MODEL_ASSET_EXTENSIONS}
+    ],
+    state_dir=os.path.join(BASE_DIR, 'asset_manifests'),
+    refresh_interval=float(os.environ.get('MANIFEST_REFRESH_INTERVAL', 30)))
+
+
+@app.route('/assets/manifest', methods=['GET'])
+def get_asset_manifest():
+    """
+    Lista todos os assets com hash SHA-256 e tamanho.
+    A versão do manifesto é usada como ETag
+    """
+    manifest = asset_manifest.current()
+    etag = f'"{manifest["version"]}"'
+    if request.headers.get('If-None-Match') == etag:
+        return '', 304
+
+    response = jsonify(manifest)
+    response.headers['ETag'] = etag
+    return response
+
+
+@app.route('/assets/delta', methods=['GET'])
+def get_asset_delta():
+    """
+    Retorna apenas os assets adicionados, alterados e removidos desde a
+    versão informada (since=<versão do manifesto do cliente>)
+    """
+    since = request.args.get('since')
+    if not since:
+        return jsonify({'error': 'Parâmetro obrigatório ausente: since'}), 400
+
+    delta = asset_manifest.delta(since)
+    if delta is None:
+        # Versão desconhecida: o cliente deve sincronizar o manifesto completo
+        return jsonify({'error': 'Versão desconhecida', 'full_manifest_url': '/assets/manifest'}), 410
+    return jsonify(delta)
+
+
+@app.route('/assets/models/<path:filename>')
+def serve_model_asset(filename):
+    if not filename.lower().endswith(MODEL_ASSET_EXTENSIONS):
+        return jsonify({'error': 'Asset not found'}), 404
+    return send_from_directory(MODELS_DIR, filename)
 
 
 @app.route('/species', methods=['GET'])
 def get_species():
-    return jsonify(categories)
+    return jsonify(registry.get().labels)
+
+
+# Índice espacial dos feedbacks (tiles com contagens por classe e por dia)
+FEEDBACK_FILE = os.path.join(BASE_DIR, 'feedback_data.json')
+feedback_index = FeedbackSpatialIndex(
+    os.path.join(BASE_DIR, 'feedback_spatial_index.json'))
+feedback_index.load(FEEDBACK_FILE)
+
+# Agregados por hora/dia por classe e por modelo, compactados periodicamente
+ROLLUP_COMPACT_INTERVAL = int(os.environ.get('ROLLUP_COMPACT_INTERVAL', 3600))
+feedback_rollups = FeedbackRollups(
+    os.path.join(BASE_DIR, 'feedback_rollups.json'))
+feedback_rollups.load(FEEDBACK_FILE)
+
+
+def compact_rollups_periodically():
+    while True:
+        time.sleep(ROLLUP_COMPACT_INTERVAL)
+        try:
+            feedback_rollups.compact()
+        except Exception as e:
+            print(f"Erro ao compactar agregados de feedback: {e}")
+
+
+threading.Thread(target=compact_rollups_periodically, daemon=True).start()
 
 
 @app.route('/feedback', methods=['POST'])
@@ -121,13 +891,15 @@ def register_feedback():
             # Se incorreto, qual a classe correta
             'correct_class': data.get('correct_class', None),
             'confidence': data['confidence'],
+            # Modelo que gerou a predição (campo 'model' da resposta de /classify)
+            'model': data.get('model'),
             'timestamp': datetime.now().isoformat(),
             'device_info': data.get('device_info', {}),
             'location': data.get('location', {})
         }
 
         # Salvar feedback em arquivo JSON
-        feedback_file = os.path.join(BASE_DIR, 'feedback_data.json')
+        feedback_file = FEEDBACK_FILE
 
         # Carregar feedbacks existentes
         if os.path.exists(feedback_file):
@@ -143,6 +915,10 @@ def register_feedback():
         with open(feedback_file, 'w', encoding='utf-8') as f:
             json.dump(feedbacks, f, indent=2, ensure_ascii=False)
 
+        # Atualizar índice espacial incrementalmente
+        feedback_index.add(feedback_data)
+        feedback_rollups.add(feedback_data)
+
         return jsonify({
             'success': True,
             'message': 'Feedback registrado com sucesso',
@@ -156,10 +932,22 @@ def register_feedback():
 @app.route('/feedback/stats', methods=['GET'])
 def get_feedback_stats():
     """
-    Retorna estatísticas dos feedbacks recebidos
+    Retorna estatísticas dos feedbacks recebidos.
+    Com bbox=min_lon,min_lat,max_lon,max_lat e/ou since=AAAA-MM-DD a resposta
+    vem do índice espacial (tiles=1 inclui a acurácia de cada tile)
     """
+    bbox = request.args.get('bbox')
+    since = request.args.get('since')
+    if bbox or since:
+        try:
+            return jsonify(feedback_index.query(
+                parse_bbox(bbox) if bbox else None, since,
+                per_tile=request.args.get('tiles') == '1'))
+        except ValueError as e:
+            return jsonify({'error': f'Parâmetro inválido: {str(e)}'}), 400
+
     try:
-        feedback_file = os.path.join(BASE_DIR, 'feedback_data.json')
+        feedback_file = FEEDBACK_FILE
 
         if not os.path.exists(feedback_file):
             return jsonify({
@@ -212,6 +1000,27 @@ def get_feedback_stats():
         return jsonify({'error': f'Erro ao obter estatísticas: {str(e)}'}), 500
 
 
+@app.route('/feedback/timeseries', methods=['GET'])
+def get_feedback_timeseries():
+    """
+    Série temporal de volume e acurácia dos feedbacks entre start e end.
+    Parâmetros: start, end (ISO 8601), granularity=hour|day, class, model
+    """
+    start = request.args.get('start')
+    end = request.args.get('end') or datetime.now().isoformat()
+    if not start:
+        return jsonify({'error': 'Parâmetro obrigatório ausente: start'}), 400
+
+    try:
+        return jsonify(feedback_rollups.series(
+            start, end,
+            granularity=request.args.get('granularity'),
+            class_name=request.args.get('class'),
+            model=request.args.get('model')))
+    except ValueError as e:
+        return jsonify({'error': f'Parâmetro inválido: {str(e)}'}), 400
+
+
 # app.config['DEBUG'] = True  # Habilita o modo de depuração
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 5000))
@@ -0,0 +1,154 @@
+"""
+Manifesto de assets para sincronização offline do app
+Lista galerias e modelos com hash de conteúdo e tamanho, e calcula
+o delta entre versões para que o cliente baixe apenas o que mudou
+"""
+
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Hash SHA-256 do conteúdo de um arquivo"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class AssetManifest:
+    """
+    Gera o manifesto dos assets servidos ao app.
+    Os hashes ficam em cache por (tamanho, mtime) para que uma nova varredura
+    só releia arquivos alterados; cada versão publicada é guardada em disco
+    para permitir o cálculo de deltas.
+    """
+
+    def __init__(self, sources: List[Dict], state_dir: str, refresh_interval: float = 30.0):
+        # sources: [{'dir': ..., 'url_prefix': ..., 'extensions': (...)}]
+        self.sources = sources
+        self.state_dir = state_dir
+        self.refresh_interval = refresh_interval
+        self.lock = threading.Lock()
+        self.manifest = None
+        self._scanned_at = 0.0
+        os.makedirs(os.path.join(state_dir, 'versions'), exist_ok=True)
+        self.hash_cache_file = os.path.join(state_dir, 'hash_cache.json')
+        self.hash_cache = self._load_json(self.hash_cache_file) or {}
+
+    @staticmethod
+    def _load_json(path: str):
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    @staticmethod
+    def _write_json(path: str, data):
+        # Temporário único por escrita: vários workers podem gravar o mesmo arquivo
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def _walk(self, source: Dict):
+        base_dir = source['dir']
+        if not os.path.isdir(base_dir):
+            return
+        extensions = source.get('extensions')
+        for root, dirs, files in os.walk(base_dir):
+            dirs[:] = sorted(d for d in dirs if d not in source.get('exclude_dirs', ()))
+            for filename in sorted(files):
+                if extensions and not filename.lower().endswith(extensions):
+                    continue
+                full_path = os.path.join(root, filename)
+                rel_path = os.path.relpath(full_path, base_dir).replace(os.sep, '/')
+                yield full_path, f"{source['url_prefix']}/{rel_path}"
+
+    def _scan(self) -> Dict:
+        assets = {}
+        cache_changed = False
+        for source in self.sources:
+            for full_path, url in self._walk(source):
+                stat = os.stat(full_path)
+                cached = self.hash_cache.get(full_path)
+                if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+                    digest = cached[2]
+                else:
+                    digest = file_sha256(full_path)
+                    self.hash_cache[full_path] = [
+                        stat.st_size, stat.st_mtime_ns, digest]
+                    cache_changed = True
+                assets[url] = {'sha256': digest, 'size': stat.st_size}
+
+        # Remover do cache arquivos que não existem mais
+        for path in [p for p in self.hash_cache if not os.path.exists(p)]:
+            del self.hash_cache[path]
+            cache_changed = True
+        if cache_changed:
+            self._write_json(self.hash_cache_file, self.hash_cache)
+
+        # A versão é derivada do conteúdo: mesmo conjunto de assets, mesma versão
+        digest = hashlib.sha256()
+        for url in sorted(assets):
+            digest.update(f"{url}\0{assets[url]['sha256']}\n".encode('utf-8'))
+        version = digest.hexdigest()[:16]
+
+        return {'version': version, 'assets': assets}
+
+    def current(self) -> Dict:
+        """Manifesto atual (revarre o disco no máximo a cada refresh_interval)"""
+        with self.lock:
+            now = time.monotonic()
+            if self.manifest is None or now - self._scanned_at >= self.refresh_interval:
+                scanned = self._scan()
+                if self.manifest is None or scanned['version'] != self.manifest['version']:
+                    version_file = os.path.join(
+                        self.state_dir, 'versions', f"{scanned['version']}.json")
+                    saved = self._load_json(version_file)
+                    if saved is None:
+                        scanned['generated_at'] = datetime.now().isoformat()
+                        self._write_json(version_file, scanned)
+                    else:
+                        scanned['generated_at'] = saved['generated_at']
+                    self.manifest = scanned
+                self._scanned_at = now
+            return self.manifest
+
+    def delta(self, since_version: str) -> Optional[Dict]:
+        """
+        Diferença entre a versão informada pelo cliente e a atual.
+        Retorna None se a versão do cliente for desconhecida.
+        """
+        current = self.current()
+        version_file = os.path.join(
+            self.state_dir, 'versions', f'{os.path.basename(since_version)}.json')
+        previous = self._load_json(version_file)
+        if previous is None:
+            return None
+
+        old_assets, new_assets = previous['assets'], current['assets']
+        added = {url: new_assets[url]
+                 for url in new_assets if url not in old_assets}
+        changed = {url: new_assets[url] for url in new_assets
+                   if url in old_assets and old_assets[url]['sha256'] != new_assets[url]['sha256']}
+        removed = sorted(url for url in old_assets if url not in new_assets)
+
+        return {
+            'from_version': previous['version'],
+            'to_version': current['version'],
+            'added': added,
+            'changed': changed,
+            'removed': removed
+        }
@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+"""
+Coleta assíncrona do iNaturalist (asyncio + aiohttp)
+Downloads de fotos concorrentes sobre conexões keep-alive reaproveitadas,
+com limites separados para a API e para os hosts de imagens, sem sleeps fixos.
+A taxa é controlada pelo mesmo RateLimiter (token bucket) do coletor síncrono
+"""
+
+import asyncio
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from http_cache import ResponseCache
+from inaturalist_collector import (
+    TARGET_CLASSES, iNaturalistCollector, validate_image_bytes, write_file_atomic)
+
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncHarvester:
+    """
+    Coletor assíncrono que reaproveita a classificação, os nomes de arquivo,
+    as estatísticas e os metadados do iNaturalistCollector
+    """
+
+    def __init__(self, collector: iNaturalistCollector, api_concurrency: int = 2,
+                 download_concurrency: int = 16, per_host_concurrency: int = 8,
+                 max_retries: int = 3):
+        if not AIOHTTP_AVAILABLE:
+            raise ImportError(
+                "aiohttp não instalado: pip install -r requirements_collector.txt")
+
+        self.collector = collector
+        self.api_concurrency = api_concurrency
+        self.download_concurrency = download_concurrency
+        self.per_host_concurrency = per_host_concurrency
+        self.max_retries = max_retries
+
+        # Criados dentro do loop de eventos (em collect)
+        self.api_semaphore = None
+        self.download_semaphore = None
+        self.host_semaphores = {}
+        self.rate_limiter = collector.rate_limiter
+
+    @staticmethod
+    async def _blocking(func, *args):
+        """
+        Executa I/O bloqueante (SQLite, cache em disco, sistema de arquivos) no
+        pool de threads padrão, sem parar os downloads em andamento no loop
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    def _host_semaphore(self, url: str) -> asyncio.Semaphore:
+        host = urlparse(url).netloc
+        if host not in self.host_semaphores:
+            self.host_semaphores[host] = asyncio.Semaphore(
+                self.per_host_concurrency)
+        return self.host_semaphores[host]
+
+    async def _api_request(self, session, endpoint: str, params: Dict) -> Optional[Dict]:
+        url = f"{self.collector.base_url}/{endpoint}"
+        # aiohttp não aceita booleanos em query strings
+        params = {k: str(v).lower() if isinstance(v, bool) else v
+                  for k, v in params.items()}
+
+        cache = self.collector.response_cache
+        cached = await self._blocking(cache.lookup, url, params) if cache else None
+        if cached is not None and (cache.offline or cache.is_fresh(cached)):
+            return cache.hit(cached)
+        if cache and cache.offline:
+            cache.miss()
+            logger.warning(f"Modo offline: resposta não está no cache ({url})")
+            return None
+
+        error = None
+        for attempt in range(self.max_retries):
+            async with self.api_semaphore:
+                await self.rate_limiter.acquire_async('api')
+                try:
+                    async with session.get(
+                            url, params=params,
+                            headers=ResponseCache.conditional_headers(cached)) as response:
+                        if self.rate_limiter.observe('api', response.status,
+                                                     response.headers) is not None:
+                            # Pausa (Retry-After) já aplicada ao balde
+                            error = f"HTTP {response.status}"
+                            continue
+                        if response.status == 304 and cached is not None:
+                            return await self._blocking(
+                                cache.revalidated, url, params, cached)
+                        response.raise_for_status()
+                        data = await response.json()
+                        if cache:
+                            cache.miss()
+                            await self._blocking(
+                                cache.store, url, params, data, response.headers)
+                        return data
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    error = e
+            # Backoff exponencial apenas em caso de falha, se houver nova tentativa
+            if attempt < self.max_retries - 1:
+                await asyncio.sleep(2 ** attempt)
+
+        logger.error(f"Erro na requisição para {url}: {error}")
+        return None
+
+    async def _fetch_page(self, session, taxon_name: str, quality_grade: str,
+                          per_page: int, cursor: Optional[int],
+                          since: Optional[str] = None) -> Optional[Dict]:
+        """Página da busca: do estado salvo (retomada) ou da API"""
+        state = self.collector.state
+        results = await self._blocking(
+            state.get_page, taxon_name, quality_grade, per_page, cursor, since)
+        if results is not None:
+            return {'results': results}
+
+        data = await self._api_request(
+            session, 'observations',
+            self.collector._search_params(taxon_name, quality_grade, per_page,
+                                          cursor, since))
+        if data and 'results' in data:
+            await self._blocking(state.save_page, taxon_name, quality_grade, per_page,
+                                 cursor, data['results'], since)
+        return data
+
+    async def iter_observation_pages(self, session, taxon_name: str,
+                                     quality_grade: str = "research",
+                                     per_page: int = 200, max_pages: Optional[int] = 5,
+                                     since: Optional[str] = None,
+                                     progress: Optional[Dict] = None):
+        """Páginas por cursor (id_below), com a próxima já em andamento"""
+        collector = self.collector
+        request = asyncio.ensure_future(self._fetch_page(
+            session, taxon_name, quality_grade, per_page, None, since))
+
+        try:
+            page = 0
+            while max_pages is None or page < max_pages:
+                page += 1
+                logger.info(f"Buscando página {page} para {taxon_name}...")
+                data = await request
+
+                if not data or 'results' not in data:
+                    logger.warning(
+                        f"Falha ao obter a página {page} de {taxon_name}; busca interrompida")
+                    if progress is not None:
+                        progress['failed'] = True
+                    return
+
+                page_observations = data['results']
+                cursor = collector._next_cursor(page_observations, per_page)
+                if cursor is None and progress is not None:
+                    progress['exhausted'] = True
+                if cursor is not None and (max_pages is None or page < max_pages):
+                    request = asyncio.ensure_future(self._fetch_page(
+                        session, taxon_name, quality_grade, per_page, cursor, since))
+                else:
+                    cursor = None
+
+                yield page_observations
+
+                if cursor is None:
+                    return
+        finally:
+            # Consumidor parou antes do fim: descartar a página adiantada
+            if not request.done():
+                request.cancel()
+
+    async def search_observations(self, session, taxon_name: str,
+                                  quality_grade: str = "research",
+                                  per_page: int = 200, max_pages: int = 5) -> List[Dict]:
+        """Busca observações (mesmos parâmetros da versão síncrona)"""
+        observations = []
+        async for page_observations in self.iter_observation_pages(
+                session, taxon_name, quality_grade, per_page, max_pages):
+            observations.extend(page_observations)
+
+        logger.info(
+            f"Total de {len(observations)} observações encontradas para {taxon_name}")
+        return observations
+
+    async def _download_photo(self, session, photo_url: str, output_path: Path) -> bool:
+        """Baixa, valida em memória e grava uma foto (escrita atômica)"""
+        loop = asyncio.get_running_loop()
+
+        for attempt in range(self.max_retries):
+            try:
+                async with self.download_semaphore, self._host_semaphore(photo_url):
+                    await self.rate_limiter.acquire_async('photos')
+                    async with session.get(photo_url) as response:
+                        if self.rate_limiter.observe('photos', response.status,
+                                                     response.headers) is not None:
+                            continue
+                        response.raise_for_status()
+                        if not response.headers.get('content-type', '').startswith('image/'):
+                            logger.warning(f"URL não é uma imagem: {photo_url}")
+                            return False
+                        content = await response.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt < self.max_retries - 1:
+                    await asyncio.sleep(2 ** attempt)
+                    continue
+                logger.error(
+                    f"Erro ao baixar {photo_url} após {self.max_retries} tentativas: {e}")
+                return False
+
+            # Validação e gravação juntas no pool de threads, fora do loop
+            valid, reason = await loop.run_in_executor(
+                None, self._store_photo, content, output_path)
+            if not valid:
+                logger.warning(f"{reason}: {photo_url}")
+                return False
+            return True
+
+        return False
+
+    @staticmethod
+    def _store_photo(content: bytes, output_path: Path) -> Tuple[bool, str]:
+        """Valida os bytes e grava a foto se aceita (executado em thread)"""
+        valid, reason = validate_image_bytes(content)
+        if not valid:
+            return False, reason
+        try:
+            write_file_atomic(output_path, content)
+        except OSError as e:
+            return False, f"Erro ao salvar {output_path}: {e}"
+        return True, ''
+
+    async def process_observation(self, session, observation: Dict, class_name: str,
+                                  planned: Optional[List] = None) -> Dict:
+        """Baixa concorrentemente as fotos de uma observação (planned: de _plan_photos)"""
+        collector = self.collector
+        if planned is None:
+            planned = collector._plan_photos(observation, class_name)
+        result = collector._observation_record(observation, class_name)
+
+        # Consultas ao estado e ao disco ficam fora do loop de eventos
+        jobs = await self._blocking(
+            collector._photo_jobs, observation, class_name, result, planned)
+        outcomes = await asyncio.gather(
+            *(self._download_photo(session, url, path) for url, path in jobs))
+
+        await self._blocking(self._finish_observation, result, jobs, outcomes)
+        return result
+
+    def _finish_observation(self, result: Dict, jobs: List, outcomes: List[bool]):
+        """Registra as fotos e a observação no estado (executado fora do loop)"""
+        photos = [self.collector._record_photo(result, photo_url, output_path, ok)
+                  for (photo_url, output_path), ok in zip(jobs, outcomes)]
+        self.collector.state.save_observation(result, photos)
+
+    async def collect_class(self, session, class_name: str,
+                            max_observations: int = 1000) -> List[Dict]:
+        """Coleta uma classe: buscas pela API e downloads concorrentes"""
+        collector = self.collector
+        logger.info(f"Coletando dados para classe: {class_name}")
+
+        # Downloads começam assim que cada página chega
+        tasks = []
+        watermarks = []
+        walks = []
+        for term in collector._search_terms(class_name):
+            since, started = collector._search_window(term)
+            progress = {'exhausted': False}
+            walks.append((term, progress))
+            if started:
+                watermarks.append((term, since, started, progress))
+            # Incremental: o delta é percorrido inteiro, sem limite de observações
+            limit = None if since else max_observations
+            pages = self.iter_observation_pages(
+                session, term, max_pages=None if collector.incremental else 5,
+                since=since, progress=progress)
+            async for page_observations in pages:
+                for obs in page_observations:
+                    if (limit is not None and len(tasks) >= limit) or \
+                            collector.prefilter.quota_full(class_name):
+                        break
+                    if not collector._accept_observation(obs, class_name):
+                        continue
+                    # Observação já processada em uma execução anterior
+                    done = await self._blocking(collector.state.get_observation, obs.get('id'))
+                    if done is not None:
+                        future = asyncio.get_running_loop().create_future()
+                        future.set_result(done)
+                        tasks.append(future)
+                        continue
+                    # Fotos repetidas ou descartadas saem antes de criar a tarefa
+                    planned = collector._plan_photos(obs, class_name)
+                    if not planned:
+                        continue
+                    tasks.append(asyncio.ensure_future(
+                        self.process_observation(session, obs, class_name, planned)))
+                if (limit is not None and len(tasks) >= limit) or \
+                        collector.prefilter.quota_full(class_name):
+                    await pages.aclose()
+                    break
+            if (limit is not None and len(tasks) >= limit) or \
+                    collector.prefilter.quota_full(class_name):
+                break
+
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        # Confirmar o último lote de gravações da classe
+        await self._blocking(collector.state.flush)
+        await self._blocking(collector.taxon_resolver.save_ids, collector.taxon_ids_file)
+        await self._blocking(collector._advance_watermarks, watermarks)
+        collector._check_walks(class_name, walks)
+
+        processed_data = []
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Erro ao processar observação: {result}")
+            elif result['images']:
+                processed_data.append(result)
+                with collector.lock:
+                    collector.stats['total_observations'] += 1
+
+        logger.info(
+            f"Coletadas {len(processed_data)} observações com imagens para {class_name}")
+        return processed_data
+
+    async def collect(self, class_names: List[str], max_observations: int = 1000) -> Dict:
+        """Coleta todas as classes em paralelo, compartilhando a sessão HTTP"""
+        self.api_semaphore = asyncio.Semaphore(self.api_concurrency)
+        self.download_semaphore = asyncio.Semaphore(self.download_concurrency)
+        self.host_semaphores = {}
+
+        connector = aiohttp.TCPConnector(
+            limit=self.download_concurrency + self.api_concurrency,
+            limit_per_host=max(self.per_host_concurrency, self.api_concurrency),
+            keepalive_timeout=60)
+        timeout = aiohttp.ClientTimeout(total=60)
+        headers = dict(self.collector.session.headers)
+
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                         headers=headers) as session:
+            state = self.collector.state
+            # Retomada: classes concluídas em uma execução anterior são puladas
+            pending = [name for name in class_names if not state.is_class_complete(name)]
+            results = await asyncio.gather(
+                *(self.collect_class(session, name, max_observations)
+                  for name in pending),
+                return_exceptions=True)
+
+        all_data = {}
+        for class_name in class_names:
+            if class_name not in pending:
+                logger.info(f"Classe já concluída, pulando: {class_name}")
+                all_data[class_name] = [
+                    obs for obs in state.class_observations(class_name)
+                    if obs['images']][:max_observations]
+        for class_name, result in zip(pending, results):
+            if isinstance(result, Exception):
+                logger.error(f"Erro ao coletar dados para {class_name}: {result}")
+                continue
+            all_data[class_name] = result
+        return all_data
+
+    def run(self, class_names: Optional[List[str]] = None, max_observations: int = 1000):
+        """Executa a coleta e salva metadados e estatísticas como o modo síncrono"""
+        class_names = class_names or TARGET_CLASSES
+        # Resolver os taxon_ids antes do loop (chamadas síncronas, com cache):
+        # usados pela busca por táxon e pela classificação pelos ancestrais
+        self.collector.learn_class_taxa()
+        all_data = asyncio.run(self.collect(class_names, max_observations))
+
+        for class_name, data in all_data.items():
+            self.collector.save_metadata(class_name, data)
+            if self.collector.is_class_collected(class_name):
+                self.collector.state.mark_class_complete(class_name)
+        if len(class_names) > 1:
+            self.collector.save_collection_stats(all_data)
+        self.collector.print_stats()
+        return all_data
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+Gerador de Pacotes de Assets Offline
+Converte as galerias e o modelo escolhido em pacotes versionados e compactados
+para o app Flutter, com imagens redimensionadas e codificadas em formato moderno
+"""
+
+import os
+import sys
+import json
+import hashlib
+import zipfile
+import argparse
+import logging
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, features
+from asset_manifest import file_sha256
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# Configurar UTF-8 no Windows
+try:
+    sys.stdout.reconfigure(encoding='utf-8', errors='replace')
+    sys.stderr.reconfigure(encoding='utf-8', errors='replace')
+except Exception:
+    pass
+
+BASE_DIR = Path(__file__).resolve().parent
+
+# Modelo incluído quando --model não é informado (o mesmo 'default' do app.py)
+DEFAULT_MODEL_PATH = BASE_DIR / 'models' / 'insect_classifier.tflite'
+
+# Maior lado da imagem por perfil de dispositivo
+RESOLUTION_TIERS = {
+    'small': 480,   # telas de baixa densidade / economia de espaço
+    'large': 1080   # telas full HD
+}
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+FORMAT_SETTINGS = {
+    'avif': {'pil_format': 'AVIF', 'extension': '.avif'},
+    'webp': {'pil_format': 'WEBP', 'extension': '.webp'},
+    'jpeg': {'pil_format': 'JPEG', 'extension': '.jpg'}
+}
+
+
+def default_galerias_dir() -> Path:
+    """Mesma regra do app.py: galerias dentro do backend (Docker) ou na raiz"""
+    docker_dir = BASE_DIR / 'galerias'
+    return docker_dir if docker_dir.exists() else BASE_DIR.parent / 'galerias'
+
+
+def resolve_format(requested: str) -> str:
+    """Usa o formato pedido se o Pillow o suportar; senão recorre a webp/jpeg"""
+    for fmt in (requested, 'webp', 'jpeg'):
+        if fmt == 'jpeg' or features.check(fmt):
+            if fmt != requested:
+                logger.warning(
+                    f"Formato {requested} não suportado pelo Pillow, usando {fmt}")
+            return fmt
+    return 'jpeg'
+
+
+class AssetPackBuilder:
+    """Construtor incremental de pacotes de assets"""
+
+    def __init__(self, galerias_dir: Path, output_dir: Path, model_path: Optional[Path],
+                 image_format: str = 'webp', quality: int = 80, workers: int = 4):
+        self.galerias_dir = Path(galerias_dir)
+        self.output_dir = Path(output_dir)
+        self.model_path = Path(model_path) if model_path else None
+        self.image_format = resolve_format(image_format)
+        self.quality = quality
+        self.workers = workers
+
+        self.cache_dir = self.output_dir / 'cache'
+        self.packs_dir = self.output_dir / 'packs'
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.packs_dir.mkdir(parents=True, exist_ok=True)
+
+        # Cache de hashes das fontes: caminho -> [tamanho, mtime, sha256]
+        self.hash_cache_file = self.output_dir / 'source_hashes.json'
+        self.hash_cache = {}
+        if self.hash_cache_file.exists():
+            with open(self.hash_cache_file, 'r', encoding='utf-8') as f:
+                self.hash_cache = json.load(f)
+        # Fontes usadas nesta execução (só elas são salvas no cache)
+        self.used_sources = set()
+
+        self.stats = {
+            'source_images': 0,
+            'unique_images': 0,
+            'encoded': 0,
+            'reused': 0,
+            'source_bytes': 0,
+            'packed_bytes': 0
+        }
+
+    def _source_hash(self, path: Path) -> str:
+        stat = path.stat()
+        self.used_sources.add(str(path))
+        cached = self.hash_cache.get(str(path))
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+
+        digest = file_sha256(path)
+        self.hash_cache[str(path)] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest
+
+    def _save_hash_cache(self):
+        cache = {path: entry for path, entry in self.hash_cache.items()
+                 if path in self.used_sources}
+        tmp_file = self.hash_cache_file.with_name(self.hash_cache_file.name + '.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(cache, f)
+        os.replace(tmp_file, self.hash_cache_file)
+
+    def check_inputs(self):
+        """Valida as entradas antes de qualquer codificação"""
+        if not self.galerias_dir.is_dir():
+            raise FileNotFoundError(f"Diretório das galerias não encontrado: {self.galerias_dir}")
+        if self.model_path is not None and not self.model_path.is_file():
+            raise FileNotFoundError(f"Modelo não encontrado: {self.model_path}")
+
+    def _collect_sources(self) -> Dict[str, Path]:
+        """Mapeia caminho lógico (especie/imagemNN.jpg) -> arquivo de origem"""
+        sources = {}
+        for path in sorted(self.galerias_dir.rglob('*')):
+            if path.is_file() and path.suffix.lower() in IMAGE_EXTENSIONS:
+                logical = path.relative_to(self.galerias_dir).as_posix()
+                # Miniaturas de generate_thumbnails.py não entram nos pacotes
+                if 'thumbs' in logical.split('/')[:-1]:
+                    continue
+                sources[logical] = path
+        return sources
+
+    def _encode(self, source: Path, source_hash: str, max_side: int) -> Dict:
+        """Redimensiona e codifica uma imagem, reaproveitando o cache se existir"""
+        settings = FORMAT_SETTINGS[self.image_format]
+        blob_name = f"{source_hash[:16]}_{max_side}_q{self.quality}{settings['extension']}"
+        blob_path = self.cache_dir / blob_name
+        meta_path = self.cache_dir / f'{blob_name}.json'
+
+        if blob_path.exists() and meta_path.exists():
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            meta['reused'] = True
+            return meta
+
+        with Image.open(source) as img:
+            img = img.convert('RGB')
+            img.thumbnail((max_side, max_side), Image.LANCZOS)
+            tmp_path = blob_path.with_name(blob_path.name + '.tmp')
+            img.save(tmp_path, settings['pil_format'], quality=self.quality)
+            width, height = img.size
+        os.replace(tmp_path, blob_path)
+
+        with open(blob_path, 'rb') as f:
+            blob_hash = hashlib.sha256(f.read()).hexdigest()
+        meta = {
+            'blob': blob_name,
+            'width': width,
+            'height': height,
+            'size': blob_path.stat().st_size,
+            'sha256': blob_hash
+        }
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        meta['reused'] = False
+        return meta
+
+    def _write_pack(self, pack_name: str, files: Dict[str, Path],
+                    hashes: Dict[str, str]) -> Dict:
+        """Grava o zip do pacote com nome versionado pelo conteúdo (hashes por arcname)"""
+        digest = hashlib.sha256()
+        for arcname in sorted(files):
+            digest.update(arcname.encode('utf-8'))
+            digest.update(hashes[arcname].encode('ascii'))
+        version = digest.hexdigest()[:12]
+
+        pack_file = self.packs_dir / f'{pack_name}_{version}.zip'
+        if not pack_file.exists():
+            tmp_file = pack_file.with_name(pack_file.name + '.tmp')
+            with zipfile.ZipFile(tmp_file, 'w') as zf:
+                for arcname in sorted(files):
+                    # Imagens já comprimidas vão sem deflate; JSON/modelo com deflate
+                    compress = zipfile.ZIP_STORED \
+                        if arcname.endswith(('.webp', '.avif', '.jpg')) else zipfile.ZIP_DEFLATED
+                    zf.write(files[arcname], arcname, compress_type=compress)
+            os.replace(tmp_file, pack_file)
+            logger.info(f"Pacote gerado: {pack_file.name}")
+        else:
+            logger.info(f"Pacote inalterado: {pack_file.name}")
+
+        size = pack_file.stat().st_size
+        self.stats['packed_bytes'] += size
+        return {
+            'file': pack_file.name,
+            'version': version,
+            'size': size,
+            'sha256': file_sha256(pack_file)
+        }
+
+    def build_gallery_packs(self, tiers: Dict[str, int]) -> Dict:
+        sources = self._collect_sources()
+        self.stats['source_images'] = len(sources)
+        self.stats['source_bytes'] = sum(p.stat().st_size for p in sources.values())
+
+        # Deduplicação por hash de conteúdo: cada imagem única é codificada uma vez
+        hashes = {logical: self._source_hash(path) for logical, path in sources.items()}
+        unique = {}
+        for logical, source_hash in hashes.items():
+            unique.setdefault(source_hash, sources[logical])
+        self.stats['unique_images'] = len(unique)
+        logger.info(
+            f"{len(sources)} imagens encontradas, {len(unique)} únicas por conteúdo")
+
+        packs = {}
+        for tier, max_side in tiers.items():
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = {h: executor.submit(self._encode, path, h, max_side)
+                           for h, path in unique.items()}
+                encoded = {h: future.result() for h, future in futures.items()}
+
+            for meta in encoded.values():
+                self.stats['reused' if meta['reused'] else 'encoded'] += 1
+
+            entries = []
+            files = {}
+            blob_hashes = {}
+            for logical in sorted(sources):
+                meta = encoded[hashes[logical]]
+                entries.append({
+                    'path': logical,
+                    'blob': f"images/{meta['blob']}",
+                    'width': meta['width'],
+                    'height': meta['height'],
+                    'size': meta['size'],
+                    'sha256': meta['sha256']
+                })
+                files[f"images/{meta['blob']}"] = self.cache_dir / meta['blob']
+                blob_hashes[f"images/{meta['blob']}"] = meta['sha256']
+
+            pack = self._write_pack(f'galerias_{tier}', files, blob_hashes)
+            pack.update({'max_side': max_side, 'format': self.image_format,
+                         'entries': entries})
+            packs[tier] = pack
+
+        return packs
+
+    def build_model_pack(self) -> Optional[Dict]:
+        if self.model_path is None:
+            return None
+
+        files = {f'model/{self.model_path.name}': self.model_path}
+        # model_info correspondente (insect_classifier_optimized -> model_info_optimized.json)
+        stem = self.model_path.stem
+        suffix = stem[len('insect_classifier'):] if stem.startswith('insect_classifier') else ''
+        info_path = self.model_path.with_name(f'model_info{suffix}.json')
+        if info_path.exists():
+            files[f'model/{info_path.name}'] = info_path
+
+        hashes = {arcname: self._source_hash(path) for arcname, path in files.items()}
+        pack = self._write_pack('model', files, hashes)
+        pack['files'] = sorted(files)
+        return pack
+
+    def build(self, tiers: Dict[str, int]) -> Dict:
+        """Gera todos os pacotes e o índice pack_index.json"""
+        self.check_inputs()
+        try:
+            index = {
+                'created_at': datetime.now().isoformat(),
+                'image_format': self.image_format,
+                'quality': self.quality,
+                'galleries': self.build_gallery_packs(tiers),
+                'model': self.build_model_pack()
+            }
+        finally:
+            # Mesmo com falha, a próxima execução reaproveita os hashes já calculados
+            self._save_hash_cache()
+
+        digest = hashlib.sha256()
+        for pack in list(index['galleries'].values()) + [index['model'] or {}]:
+            digest.update(pack.get('version', '').encode('ascii'))
+        index['version'] = digest.hexdigest()[:12]
+
+        index_file = self.output_dir / 'pack_index.json'
+        with open(index_file, 'w', encoding='utf-8') as f:
+            json.dump(index, f, indent=2, ensure_ascii=False)
+        logger.info(f"Índice de pacotes salvo em: {index_file}")
+        return index
+
+    def print_stats(self):
+        """Imprime estatísticas da geração"""
+        print("\n" + "="*50)
+        print("ESTATÍSTICAS DOS PACOTES")
+        print("="*50)
+        print(f"Imagens de origem: {self.stats['source_images']}")
+        print(f"Imagens únicas: {self.stats['unique_images']}")
+        print(f"Codificadas nesta execução: {self.stats['encoded']}")
+        print(f"Reaproveitadas do cache: {self.stats['reused']}")
+        print(f"Tamanho das origens: {self.stats['source_bytes'] / 1e6:.1f} MB")
+        print(f"Tamanho dos pacotes: {self.stats['packed_bytes'] / 1e6:.1f} MB")
+        print("="*50)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Gera pacotes de assets offline para o app')
+    parser.add_argument('--galerias-dir', default=str(default_galerias_dir()),
+                        help='Diretório das galerias')
+    parser.add_argument('--model', default=None,
+                        help='Modelo .tflite a incluir (padrão: models/insect_classifier.tflite, '
+                             'se existir; vazio para não incluir)')
+    parser.add_argument('--output-dir', default=str(BASE_DIR / 'asset_packs'),
+                        help='Diretório de saída')
+    parser.add_argument('--format', choices=list(FORMAT_SETTINGS), default='webp',
+                        help='Formato das imagens')
+    parser.add_argument('--quality', type=int, default=80,
+                        help='Qualidade de compressão (0-100)')
+    parser.add_argument('--tiers', default=','.join(f'{k}:{v}' for k, v in RESOLUTION_TIERS.items()),
+                        help='Perfis de resolução, ex.: small:480,large:1080')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4,
+                        help='Threads de codificação')
+
+    args = parser.parse_args()
+
+    tiers = {}
+    for item in args.tiers.split(','):
+        name, max_side = item.split(':')
+        tiers[name] = int(max_side)
+
+    model_path = args.model
+    if model_path is None:
+        if DEFAULT_MODEL_PATH.exists():
+            model_path = str(DEFAULT_MODEL_PATH)
+        else:
+            logger.warning(f"{DEFAULT_MODEL_PATH} não encontrado; pacote do modelo não será gerado")
+
+    builder = AssetPackBuilder(args.galerias_dir, args.output_dir, model_path or None,
+                               args.format, args.quality, args.workers)
+    try:
+        index = builder.build(tiers)
+    except FileNotFoundError as e:
+        logger.error(str(e))
+        sys.exit(1)
+    builder.print_stats()
+    print(f"Versão dos pacotes: {index['version']}")
+
+
+if __name__ == '__main__':
+    main()
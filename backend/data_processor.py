@@ -10,16 +10,14 @@ import json
 import shutil
 import argparse
 from pathlib import Path
-from typing import List, Dict, Tuple, Optional
+from typing import List, Dict, Optional
 import logging
 from datetime import datetime
-import cv2
-import numpy as np
 from PIL import Image, ImageEnhance, ImageFilter
 import hashlib
 from collections import Counter
 import matplotlib.pyplot as plt
-import seaborn as sns
+from image_quality import ImageQualityValidator
 
 # Configurar logging
 logging.basicConfig(
@@ -49,100 +47,6 @@ TARGET_CLASSES = [
 ]
 
 
-class ImageQualityValidator:
-    """Validador de qualidade de imagens"""
-
-    def __init__(self, min_size: Tuple[int, int] = (100, 100),
-                 max_blur_threshold: float = 100.0,
-                 min_brightness: float = 0.1,
-                 max_brightness: float = 0.9):
-        self.min_size = min_size
-        self.max_blur_threshold = max_blur_threshold
-        self.min_brightness = min_brightness
-        self.max_brightness = max_brightness
-
-    def validate_image(self, image_path: Path) -> Dict:
-        """Valida a qualidade de uma imagem"""
-        result = {
-            'path': str(image_path),
-            'valid': True,
-            'issues': [],
-            'quality_score': 0.0,
-            'size': (0, 0),
-            'blur_score': 0.0,
-            'brightness': 0.0
-        }
-
-        try:
-            # Carregar imagem
-            image = cv2.imread(str(image_path))
-            if image is None:
-                result['valid'] = False
-                result['issues'].append('Não foi possível carregar a imagem')
-                return result
-
-            # Converter para RGB
-            image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            height, width = image_rgb.shape[:2]
-            result['size'] = (width, height)
-
-            # Verificar tamanho mínimo
-            if width < self.min_size[0] or height < self.min_size[1]:
-                result['valid'] = False
-                result['issues'].append(
-                    f'Tamanho muito pequeno: {width}x{height}')
-
-            # Verificar blur
-            blur_score = self._calculate_blur_score(image_rgb)
-            result['blur_score'] = blur_score
-            if blur_score < self.max_blur_threshold:
-                result['valid'] = False
-                result['issues'].append(
-                    f'Imagem muito desfocada: {blur_score:.2f}')
-
-            # Verificar brilho
-            brightness = self._calculate_brightness(image_rgb)
-            result['brightness'] = brightness
-            if brightness < self.min_brightness or brightness > self.max_brightness:
-                result['valid'] = False
-                result['issues'].append(f'Brilho inadequado: {brightness:.2f}')
-
-            # Calcular score de qualidade
-            result['quality_score'] = self._calculate_quality_score(
-                blur_score, brightness, width, height)
-
-        except Exception as e:
-            result['valid'] = False
-            result['issues'].append(f'Erro na validação: {str(e)}')
-
-        return result
-
-    def _calculate_blur_score(self, image: np.ndarray) -> float:
-        """Calcula score de blur usando Laplacian"""
-        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-        return cv2.Laplacian(gray, cv2.CV_64F).var()
-
-    def _calculate_brightness(self, image: np.ndarray) -> float:
-        """Calcula brilho médio da imagem"""
-        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-        return np.mean(gray) / 255.0
-
-    def _calculate_quality_score(self, blur_score: float, brightness: float,
-                                 width: int, height: int) -> float:
-        """Calcula score geral de qualidade"""
-        # Normalizar blur score (0-1)
-        blur_norm = min(blur_score / 1000.0, 1.0)
-
-        # Score de brilho (preferir valores médios)
-        brightness_score = 1.0 - abs(brightness - 0.5) * 2
-
-        # Score de tamanho (preferir imagens maiores)
-        size_score = min((width * height) / (500 * 500), 1.0)
-
-        # Score combinado
-        return (blur_norm * 0.4 + brightness_score * 0.3 + size_score * 0.3)
-
-
 class DataProcessor:
     """Processador principal de dados"""
 
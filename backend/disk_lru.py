@@ -0,0 +1,81 @@
+"""
+Base dos caches em disco com tamanho limitado (LRU pelo mtime)
+Usada pelo cache de variantes de imagem (image_variants.py) e pelo cache de
+respostas da API do iNaturalist (http_cache.py)
+"""
+
+import os
+import threading
+
+
+def temp_path(path: str) -> str:
+    """
+    Temporário exclusivo do processo e da thread: workers do gunicorn criados
+    por fork herdam o mesmo ident da thread principal
+    """
+    return f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+
+class DiskLRU:
+    """
+    Diretório de cache com tamanho limitado. O mtime do arquivo marca o último
+    acesso; quando o total passa de max_bytes as entradas menos recentes são
+    removidas até ficar em 90% do limite.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = str(cache_dir)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.total_bytes = self._disk_usage()
+        self.stats = {'evictions': 0}
+
+    def _entries(self):
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                yield entry
+
+    def _disk_usage(self) -> int:
+        return sum(entry.stat().st_size for entry in self._entries())
+
+    @staticmethod
+    def touch(path: str) -> bool:
+        """Marca o acesso para o LRU; False se a entrada já foi removida"""
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _added(self, path: str, size: int, previous: int = 0):
+        """Contabiliza uma entrada gravada (previous = tamanho da que foi substituída)"""
+        with self.lock:
+            self.total_bytes += size - previous
+            if self.total_bytes > self.max_bytes:
+                self._evict(keep=path)
+
+    def _evict(self, keep: str):
+        """Remove as entradas menos acessadas (chamar com self.lock)"""
+        entries = []
+        for entry in self._entries():
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+
+        self.total_bytes = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if self.total_bytes <= target:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                self.total_bytes -= size
+                self.stats['evictions'] += 1
+            except FileNotFoundError:
+                pass
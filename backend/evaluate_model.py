@@ -33,8 +33,12 @@ TARGET_CLASSES = [
 ]
 
 
-def load_and_preprocess_image(image_path, target_size=(224, 224)):
-    """Carrega e pré-processa uma imagem"""
+def load_and_preprocess_image(image_path, target_size=(224, 224), normalize=True):
+    """
+    Carrega e pré-processa uma imagem.
+    Com normalize=False retorna a imagem uint8 redimensionada, para modelos
+    exportados com o pré-processamento embutido (export_tflite.py)
+    """
     try:
         image = cv2.imread(str(image_path))
         if image is None:
@@ -43,6 +47,9 @@ def load_and_preprocess_image(image_path, target_size=(224, 224)):
         image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
         image = cv2.resize(image, target_size)
 
+        if not normalize:
+            return image
+
         # Normalização ImageNet
         image = image.astype(np.float32) / 255.0
         mean = np.array([0.485, 0.456, 0.406])
@@ -78,6 +85,23 @@ def evaluate_tflite_model(model_path, test_data_dir, max_samples_per_class=50):
     if interpreter is None:
         return None
 
+    # Entrada uint8: o modelo já faz resize/normalização no grafo
+    fused = input_details[0]['dtype'] == np.uint8
+    input_dtype = np.uint8 if fused else np.float32
+    target_size = (224, 224)
+    if fused:
+        # O lote é sempre variável (export_tflite.py); só H/W definem a entrada
+        if -1 in input_details[0]['shape_signature'][1:3]:
+            # Entrada de tamanho variável: fixar em 224x224 para a avaliação
+            interpreter.resize_tensor_input(
+                input_details[0]['index'], [1, 224, 224, 3])
+            interpreter.allocate_tensors()
+        else:
+            target_size = (int(input_details[0]['shape'][2]),
+                           int(input_details[0]['shape'][1]))
+    if fused:
+        print("ℹ️ Modelo com pré-processamento embutido (entrada uint8)")
+
     print("📊 Carregando dados de teste...")
 
     # Carregar dados de teste
@@ -104,7 +128,8 @@ def evaluate_tflite_model(model_path, test_data_dir, max_samples_per_class=50):
         print(f"{class_name}: {len(class_images)} imagens")
 
         for img_path in class_images:
-            image = load_and_preprocess_image(img_path)
+            image = load_and_preprocess_image(
+                img_path, target_size, normalize=not fused)
             if image is not None:
                 test_images.append(image)
                 test_labels.append(class_name)
@@ -128,7 +153,7 @@ def evaluate_tflite_model(model_path, test_data_dir, max_samples_per_class=50):
 
     for i, image in enumerate(test_images):
         # Preparar entrada
-        input_data = np.expand_dims(image, axis=0).astype(np.float32)
+        input_data = np.expand_dims(image, axis=0).astype(input_dtype)
 
         # Fazer predição
         interpreter.set_tensor(input_details[0]['index'], input_data)
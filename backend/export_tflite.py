@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Exportação de modelos para TensorFlow Lite com pré-processamento embutido
+O grafo exportado recebe a imagem crua (uint8, HxWx3) e faz conversão,
+redimensionamento e normalização internamente, igual ao treinamento
+"""
+
+import os
+import json
+import argparse
+import tensorflow as tf
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODELS_DIR = os.path.join(BASE_DIR, 'models')
+
+IMG_SIZE = 224
+
+# Normalizações suportadas
+# rescale:  x / 255 (ImageDataGenerator(rescale=1./255) dos scripts de treino)
+# imagenet: (x / 255 - média) / desvio, como o app.py fazia em numpy
+# none:     valores 0-255 (modelos que já incluem seu próprio preprocess_input)
+NORMALIZATIONS = ('rescale', 'imagenet', 'none')
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+IMAGENET_STD = [0.229, 0.224, 0.225]
+
+
+def input_shape(input_size, dynamic):
+    """Forma da entrada exportada (None = dimensão variável)"""
+    return [None, None, None, 3] if dynamic else [None, input_size, input_size, 3]
+
+
+class FusedPreprocessingModel(tf.Module):
+    """Envolve o modelo Keras com cast, resize e normalização no grafo"""
+
+    def __init__(self, model, img_size, normalization):
+        super().__init__()
+        self.model = model
+        self.img_size = img_size
+        self.normalization = normalization
+
+    def preprocess(self, image):
+        x = tf.cast(image, tf.float32)
+        if image.shape[1] != self.img_size or image.shape[2] != self.img_size:
+            x = tf.image.resize(x, (self.img_size, self.img_size))
+
+        if self.normalization == 'rescale':
+            x = x / 255.0
+        elif self.normalization == 'imagenet':
+            x = (x / 255.0 - tf.constant(IMAGENET_MEAN)) / tf.constant(IMAGENET_STD)
+        return x
+
+    @tf.function
+    def serve(self, image):
+        return self.model(self.preprocess(image), training=False)
+
+
+def export_fused_model(keras_path, output_path, normalization='rescale',
+                       input_size=IMG_SIZE, dynamic=False, quantize=True):
+    """
+    Converte o modelo .h5 em TFLite com entrada uint8 [N, H, W, 3]; o lote é
+    variável para que a TTA do app.py rode todas as vistas em um só invoke.
+    Com dynamic=True a entrada aceita qualquer H e W e o resize fica no grafo.
+    """
+    model = tf.keras.models.load_model(keras_path, compile=False)
+    fused = FusedPreprocessingModel(model, IMG_SIZE, normalization)
+
+    shape = input_shape(input_size, dynamic)
+    concrete = fused.serve.get_concrete_function(
+        tf.TensorSpec(shape, tf.uint8, name='image'))
+
+    converter = tf.lite.TFLiteConverter.from_concrete_functions(
+        [concrete], fused)
+    if quantize:
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    tflite_model = converter.convert()
+
+    with open(output_path, 'wb') as f:
+        f.write(tflite_model)
+    print(f"Modelo TensorFlow Lite (pré-processamento embutido) salvo em: {output_path}")
+
+
+def write_model_info(keras_path, output_path, normalization, input_size, dynamic):
+    """Grava o model_info do modelo exportado, copiando as categorias do original"""
+    stem = os.path.splitext(os.path.basename(keras_path))[0]
+    suffix = stem[len('insect_classifier'):] if stem.startswith('insect_classifier') else ''
+    source_info = os.path.join(MODELS_DIR, f'model_info{suffix}.json')
+
+    info = {}
+    if os.path.exists(source_info):
+        with open(source_info, 'r', encoding='utf-8') as f:
+            info = json.load(f)
+
+    out_stem = os.path.splitext(os.path.basename(output_path))[0]
+    out_suffix = out_stem[len('insect_classifier'):] \
+        if out_stem.startswith('insect_classifier') else f'_{out_stem}'
+    info.update({
+        'input_type': 'uint8',
+        'input_shape': input_shape(input_size, dynamic),
+        'preprocessing': f'fused_{normalization}'
+    })
+
+    info_path = os.path.join(os.path.dirname(output_path), f'model_info{out_suffix}.json')
+    with open(info_path, 'w', encoding='utf-8') as f:
+        json.dump(info, f, indent=2, ensure_ascii=False)
+    print(f"Informações do modelo salvas em: {info_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Exporta modelo .h5 para TFLite com pré-processamento embutido')
+    parser.add_argument('--model', default=os.path.join(MODELS_DIR, 'insect_classifier.h5'),
+                        help='Modelo Keras (.h5)')
+    parser.add_argument('--output',
+                        help='Arquivo .tflite de saída (padrão: <modelo>_fused.tflite)')
+    parser.add_argument('--normalization', choices=NORMALIZATIONS, default='rescale',
+                        help='Normalização usada no treinamento')
+    parser.add_argument('--input-size', type=int, default=IMG_SIZE,
+                        help='Lado da imagem de entrada (uint8)')
+    parser.add_argument('--dynamic', action='store_true',
+                        help='Entrada de tamanho variável, com resize no grafo')
+    parser.add_argument('--no-quantize', action='store_true',
+                        help='Não aplicar tf.lite.Optimize.DEFAULT')
+
+    args = parser.parse_args()
+
+    output = args.output or os.path.splitext(args.model)[0] + '_fused.tflite'
+    export_fused_model(args.model, output, args.normalization, args.input_size,
+                       args.dynamic, not args.no_quantize)
+    write_model_info(args.model, output, args.normalization,
+                     args.input_size, args.dynamic)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,441 @@
+"""
+Índices pré-agregados sobre os feedbacks dos usuários
+Permitem consultar acurácia por região sem percorrer todos os registros
+"""
+
+import os
+import json
+import math
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: só o lock entre threads
+    fcntl = None
+
+# Tamanho do tile em graus (~1 km no equador), adequado para mapas por fazenda
+TILE_DEGREES = 0.01
+
+# Tile usado para feedbacks sem localização
+NO_LOCATION_TILE = 'none'
+
+
+def extract_coordinates(location) -> Optional[Tuple[float, float]]:
+    """Extrai (lat, lon) do campo location do feedback"""
+    if not isinstance(location, dict):
+        return None
+
+    lat = location.get('latitude', location.get('lat'))
+    lon = location.get('longitude', location.get('lng', location.get('lon')))
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        return None
+
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+
+def tile_for(lat: float, lon: float, tile_degrees: float = TILE_DEGREES) -> Tuple[int, int]:
+    """Índices (linha, coluna) do tile que contém o ponto"""
+    return math.floor(lat / tile_degrees), math.floor(lon / tile_degrees)
+
+
+def parse_bbox(bbox: str) -> Tuple[float, float, float, float]:
+    """Converte 'min_lon,min_lat,max_lon,max_lat' em tupla de floats"""
+    parts = [float(p) for p in bbox.split(',')]
+    if len(parts) != 4:
+        raise ValueError('bbox deve ter 4 valores: min_lon,min_lat,max_lon,max_lat')
+    min_lon, min_lat, max_lon, max_lat = parts
+    if min_lon > max_lon or min_lat > max_lat:
+        raise ValueError('bbox com limites invertidos')
+    return min_lon, min_lat, max_lon, max_lat
+
+
+class _PersistentIndex(ABC):
+    """
+    Base dos índices pré-agregados: estado em memória persistido em JSON,
+    relido quando outro worker do gunicorn altera o arquivo. As alterações
+    (reler, somar, salvar) acontecem sob um flock no arquivo <índice>.lock,
+    para que workers concorrentes não percam incrementos uns dos outros.
+    """
+
+    def __init__(self, index_file: str):
+        self.index_file = index_file
+        self.lock_file = f'{index_file}.lock'
+        self.lock = threading.Lock()
+        self.record_count = 0
+        self._version = None
+        self._empty()
+
+    @abstractmethod
+    def _empty(self):
+        """Zera o estado em memória"""
+
+    @abstractmethod
+    def _add(self, feedback: Dict):
+        """Soma um feedback ao estado em memória"""
+
+    @abstractmethod
+    def _state(self) -> Dict:
+        """Estado a ser salvo em JSON"""
+
+    @abstractmethod
+    def _restore(self, data: Dict) -> bool:
+        """Restaura o estado salvo; retorna False se o formato não for compatível"""
+
+    @contextmanager
+    def _exclusive(self):
+        """Lock entre threads e, onde houver fcntl, entre processos"""
+        with self.lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.lock_file, 'a') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _rebuild(self, feedbacks: List[Dict]):
+        self._empty()
+        self.record_count = 0
+        for feedback in feedbacks:
+            self._add(feedback)
+            self.record_count += 1
+        self._save()
+
+    def rebuild(self, feedbacks: List[Dict]):
+        """Reconstrói o índice a partir de todos os feedbacks"""
+        with self._exclusive():
+            self._rebuild(feedbacks)
+
+    def load(self, feedback_file: str):
+        """
+        Carrega o índice do disco; reconstrói se não existir ou estiver
+        desatualizado em relação ao arquivo de feedbacks
+        """
+        feedbacks = None
+        if os.path.exists(feedback_file):
+            with open(feedback_file, 'r', encoding='utf-8') as f:
+                feedbacks = json.load(f)
+
+        with self._exclusive():
+            self._reload_if_changed()
+            if feedbacks is not None and len(feedbacks) != self.record_count:
+                self._rebuild(feedbacks)
+
+    def _reload_if_changed(self):
+        """Relê o arquivo se outro worker o atualizou"""
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                # Cada gravação troca o arquivo (os.replace): inode novo
+                stat = os.fstat(f.fileno())
+                version = (stat.st_ino, stat.st_mtime_ns)
+                if version == self._version:
+                    return
+                data = json.load(f)
+        except FileNotFoundError:
+            self._empty()
+            self.record_count = 0
+            self._version = None
+            return
+        if self._restore(data):
+            self.record_count = data.get('record_count', 0)
+        else:
+            self._empty()
+            self.record_count = 0
+        self._version = version
+
+    def _save(self):
+        tmp_file = f'{self.index_file}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(dict(self._state(), record_count=self.record_count),
+                      f, ensure_ascii=False)
+        os.replace(tmp_file, self.index_file)
+        stat = os.stat(self.index_file)
+        self._version = (stat.st_ino, stat.st_mtime_ns)
+
+    def add(self, feedback: Dict):
+        """Atualiza o índice com um novo feedback"""
+        with self._exclusive():
+            self._reload_if_changed()
+            self._add(feedback)
+            self.record_count += 1
+            self._save()
+
+
+class FeedbackSpatialIndex(_PersistentIndex):
+    """
+    Índice espacial em grade sobre os feedbacks.
+    Para cada tile guarda contagens por dia e por classe prevista
+    ([corretos, total]), atualizadas a cada novo feedback.
+    """
+
+    def __init__(self, index_file: str, tile_degrees: float = TILE_DEGREES):
+        self.tile_degrees = tile_degrees
+        super().__init__(index_file)
+
+    def _empty(self):
+        self.tiles = {}
+
+    def _state(self):
+        return {'tile_degrees': self.tile_degrees, 'tiles': self.tiles}
+
+    def _restore(self, data):
+        if data.get('tile_degrees') != self.tile_degrees:
+            return False
+        self.tiles = data.get('tiles', {})
+        return True
+
+    def _add(self, feedback: Dict):
+        coords = extract_coordinates(feedback.get('location'))
+        if coords is None:
+            key = NO_LOCATION_TILE
+        else:
+            row, col = tile_for(*coords, self.tile_degrees)
+            key = f'{row},{col}'
+
+        day = feedback.get('timestamp', '')[:10]
+        counts = self.tiles.setdefault(key, {}).setdefault(day, {}).setdefault(
+            feedback['predicted_class'], [0, 0])
+        counts[0] += int(feedback.get('user_feedback') == 'correct')
+        counts[1] += 1
+
+    def _tiles_in_bbox(self, bbox):
+        min_lon, min_lat, max_lon, max_lat = bbox
+        min_row, min_col = tile_for(min_lat, min_lon, self.tile_degrees)
+        max_row, max_col = tile_for(max_lat, max_lon, self.tile_degrees)
+
+        # Enumerar a grade só quando for menor que o número de tiles ocupados
+        span = (max_row - min_row + 1) * (max_col - min_col + 1)
+        if span <= len(self.tiles):
+            for row in range(min_row, max_row + 1):
+                for col in range(min_col, max_col + 1):
+                    key = f'{row},{col}'
+                    if key in self.tiles:
+                        yield key
+            return
+
+        for key in self.tiles:
+            if key == NO_LOCATION_TILE:
+                continue
+            row, col = (int(v) for v in key.split(','))
+            if min_row <= row <= max_row and min_col <= col <= max_col:
+                yield key
+
+    def query(self, bbox=None, since: Optional[str] = None, per_tile: bool = False) -> Dict:
+        """
+        Acurácia agregada dentro do bbox (min_lon,min_lat,max_lon,max_lat)
+        e a partir da data `since` (ISO 8601, granularidade diária).
+        Datas inválidas geram ValueError
+        """
+        since_day = parse_timestamp(since, 'since').strftime('%Y-%m-%d') if since else ''
+
+        with self.lock:
+            self._reload_if_changed()
+            keys = list(self._tiles_in_bbox(bbox)) if bbox else list(self.tiles)
+
+            total = correct = 0
+            class_accuracy = {}
+            tiles = {}
+            for key in keys:
+                tile_total = tile_correct = 0
+                for day, classes in self.tiles[key].items():
+                    if day < since_day:
+                        continue
+                    for class_name, (c, t) in classes.items():
+                        stats = class_accuracy.setdefault(
+                            class_name, {'correct': 0, 'total': 0})
+                        stats['correct'] += c
+                        stats['total'] += t
+                        tile_correct += c
+                        tile_total += t
+
+                total += tile_total
+                correct += tile_correct
+                if per_tile and tile_total and key != NO_LOCATION_TILE:
+                    row, col = (int(v) for v in key.split(','))
+                    tiles[key] = {
+                        'bbox': [round(v * self.tile_degrees, 6)
+                                 for v in (col, row, col + 1, row + 1)],
+                        'total': tile_total,
+                        'accuracy_rate': round(tile_correct / tile_total * 100, 2)
+                    }
+
+        for stats in class_accuracy.values():
+            stats['accuracy_rate'] = round(
+                stats['correct'] / stats['total'] * 100, 2) if stats['total'] else 0
+
+        result = {
+            'total_feedbacks': total,
+            'accuracy_rate': round(correct / total * 100, 2) if total else 0,
+            'class_accuracy': class_accuracy
+        }
+        if per_tile:
+            result['tile_degrees'] = self.tile_degrees
+            result['tiles'] = tiles
+        return result
+
+
+# Buckets horários são mantidos por este número de dias; depois disso só os diários
+HOURLY_RETENTION_DAYS = 14
+
+# Passo e formato da chave de cada granularidade (prefixos do timestamp ISO)
+SERIES_STEPS = {
+    'hour': (timedelta(hours=1), '%Y-%m-%dT%H'),
+    'day': (timedelta(days=1), '%Y-%m-%d')
+}
+
+# Limite de buckets de uma série (a série é preenchida com zeros)
+MAX_SERIES_POINTS = 5000
+
+
+def parse_timestamp(value: str, name: str = 'data') -> datetime:
+    """
+    Converte uma data ISO 8601 para datetime sem fuso, no mesmo relógio dos
+    timestamps dos feedbacks (datetime.now() do servidor, UTC no container).
+    Datas com fuso ('Z', '-03:00') são convertidas; valores inválidos geram ValueError.
+    """
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError(f'{name} ausente')
+    text = value.strip()
+    if text.endswith(('Z', 'z')):
+        text = text[:-1] + '+00:00'
+    try:
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        raise ValueError(f'{name} inválido: {value}')
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+
+class FeedbackRollups(_PersistentIndex):
+    """
+    Agregados por hora e por dia, por classe prevista e por versão do modelo.
+    Cada bucket guarda [corretos, total] para as chaves '_all',
+    'class:<classe>' e 'model:<modelo>'.
+    """
+
+    def __init__(self, index_file: str, hourly_retention_days: int = HOURLY_RETENTION_DAYS):
+        self.hourly_retention_days = hourly_retention_days
+        super().__init__(index_file)
+
+    def _empty(self):
+        self.buckets = {'hour': {}, 'day': {}}
+        self.compacted_at = None
+
+    def _state(self):
+        return {'buckets': self.buckets, 'compacted_at': self.compacted_at}
+
+    def _restore(self, data):
+        if 'buckets' not in data:
+            return False
+        self.buckets = data['buckets']
+        self.compacted_at = data.get('compacted_at')
+        return True
+
+    def _add(self, feedback: Dict):
+        timestamp = feedback.get('timestamp', '')
+        correct = int(feedback.get('user_feedback') == 'correct')
+        keys = ('_all', f"class:{feedback['predicted_class']}",
+                f"model:{feedback.get('model') or 'unknown'}")
+
+        for granularity, bucket in (('hour', timestamp[:13]), ('day', timestamp[:10])):
+            counts = self.buckets[granularity].setdefault(bucket, {})
+            for key in keys:
+                c = counts.setdefault(key, [0, 0])
+                c[0] += correct
+                c[1] += 1
+
+    def compact(self, now: Optional[datetime] = None):
+        """Remove buckets horários além da retenção (os diários já os contêm)"""
+        now = now or datetime.now()
+        cutoff = (now - timedelta(days=self.hourly_retention_days)
+                  ).isoformat()[:13]
+
+        with self._exclusive():
+            self._reload_if_changed()
+            hourly = self.buckets['hour']
+            expired = [bucket for bucket in hourly if bucket < cutoff]
+            for bucket in expired:
+                del hourly[bucket]
+            self.compacted_at = now.isoformat()
+            self._save()
+        return len(expired)
+
+    def series(self, start: str, end: str, granularity: Optional[str] = None,
+               class_name: Optional[str] = None, model: Optional[str] = None) -> Dict:
+        """
+        Série temporal de volume e acurácia entre start e end (ISO 8601), com
+        todos os buckets do intervalo (os sem feedback têm total 0).
+        Sem granularidade explícita usa 'hour' para intervalos de até 2 dias
+        ainda dentro da retenção horária, e 'day' nos demais casos.
+        Filtra por class_name ou por model (os dois juntos geram ValueError).
+        """
+        start_time = parse_timestamp(start, 'start')
+        end_time = parse_timestamp(end, 'end')
+        if len(end.strip()) == 10:
+            # Só a data: o dia final entra inteiro
+            end_time += timedelta(days=1, microseconds=-1)
+        if end_time < start_time:
+            raise ValueError('end anterior a start')
+
+        if granularity is None:
+            retention_start = datetime.now() - timedelta(days=self.hourly_retention_days)
+            granularity = 'hour' if end_time - start_time <= timedelta(days=2) and \
+                start_time >= retention_start else 'day'
+        if granularity not in ('hour', 'day'):
+            raise ValueError("granularity deve ser 'hour' ou 'day'")
+
+        step, bucket_format = SERIES_STEPS[granularity]
+        bucket_time = start_time.replace(minute=0, second=0, microsecond=0)
+        if granularity == 'day':
+            bucket_time = bucket_time.replace(hour=0)
+        if (end_time - bucket_time) // step >= MAX_SERIES_POINTS:
+            raise ValueError(
+                f'intervalo com mais de {MAX_SERIES_POINTS} buckets; use granularity=day')
+
+        if model and class_name:
+            # Os agregados são por classe ou por modelo, não pela combinação
+            raise ValueError('use class ou model, não os dois')
+        if model:
+            key = f'model:{model}'
+        elif class_name:
+            key = f'class:{class_name}'
+        else:
+            key = '_all'
+
+        with self.lock:
+            self._reload_if_changed()
+            buckets = self.buckets[granularity]
+            points = []
+            while bucket_time <= end_time:
+                bucket = bucket_time.strftime(bucket_format)
+                correct, total = buckets.get(bucket, {}).get(key, (0, 0))
+                points.append({
+                    'bucket': bucket,
+                    'total': total,
+                    'correct': correct,
+                    'accuracy_rate': round(correct / total * 100, 2) if total else 0
+                })
+                bucket_time += step
+
+        total = sum(p['total'] for p in points)
+        correct = sum(p['correct'] for p in points)
+        return {
+            'granularity': granularity,
+            'start': start_time.isoformat(),
+            'end': end_time.isoformat(),
+            'series_key': key,
+            'total_feedbacks': total,
+            'accuracy_rate': round(correct / total * 100, 2) if total else 0,
+            'points': points
+        }
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Gerador de Miniaturas das Galerias
+Cria, ao lado de cada imagemNN.jpg, uma pirâmide de miniaturas (128/320/640 px)
+em <especie>/thumbs/, usando todos os núcleos e pulando imagens inalteradas
+"""
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from PIL import Image
+
+from disk_lru import temp_path
+from server_tuning import available_cpus
+
+# Configurar UTF-8 no Windows
+try:
+    sys.stdout.reconfigure(encoding='utf-8', errors='replace')
+    sys.stderr.reconfigure(encoding='utf-8', errors='replace')
+except Exception:
+    pass
+
+BASE_DIR = Path(__file__).resolve().parent
+
+THUMBNAIL_SIZES = (128, 320, 640)
+THUMBS_DIRNAME = 'thumbs'
+THUMBS_INDEX = 'index.json'
+
+
+def default_galerias_dir() -> Path:
+    """Mesma regra do app.py: galerias dentro do backend (Docker) ou na raiz"""
+    docker_dir = BASE_DIR / 'galerias'
+    return docker_dir if docker_dir.exists() else BASE_DIR.parent / 'galerias'
+
+
+def thumbnail_name(image_name: str, size: int) -> str:
+    """imagem01.jpg -> imagem01_320.jpg"""
+    stem, _ = os.path.splitext(image_name)
+    return f'{stem}_{size}.jpg'
+
+
+def load_thumbs_index(species_dir: Path) -> dict:
+    index_file = species_dir / THUMBS_DIRNAME / THUMBS_INDEX
+    if not index_file.exists():
+        return {}
+    with open(index_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def build_pyramid(source: str, thumbs_dir: str, sizes, quality: int) -> dict:
+    """Gera as miniaturas de uma imagem (executado nos processos do pool)"""
+    with open(source, 'rb') as f:
+        data = f.read()
+    source_hash = hashlib.sha256(data).hexdigest()
+
+    thumbnails = {}
+    with Image.open(source) as img:
+        img = img.convert('RGB')
+        # Do maior para o menor: cada nível parte do anterior (menos pixels a reamostrar)
+        current = img
+        for size in sorted(sizes, reverse=True):
+            if current.width > size:
+                current = current.resize(
+                    (size, max(1, round(current.height * size / current.width))),
+                    Image.LANCZOS)
+            name = thumbnail_name(os.path.basename(source), size)
+            tmp_path = os.path.join(thumbs_dir, f'{name}.tmp')
+            current.save(tmp_path, 'JPEG', quality=quality, optimize=True)
+            os.replace(tmp_path, os.path.join(thumbs_dir, name))
+            thumbnails[str(size)] = {
+                'file': name,
+                'width': current.width,
+                'height': current.height
+            }
+
+    return {'sha256': source_hash, 'thumbnails': thumbnails}
+
+
+def is_gallery_image(filename: str) -> bool:
+    """Mesmo critério do endpoint /images/<species>"""
+    lower = filename.lower()
+    return lower.startswith('imagem') and lower.endswith('.jpg')
+
+
+def generate_all(galerias_dir: Path, sizes=THUMBNAIL_SIZES, quality: int = 82,
+                 workers: int = None, force: bool = False) -> dict:
+    """Gera as pirâmides de todas as espécies, pulando imagens inalteradas"""
+    stats = {'images': 0, 'generated': 0, 'skipped': 0, 'errors': 0}
+    sizes = tuple(sorted(sizes))
+
+    jobs = {}
+    indexes = {}
+    for species_dir in sorted(p for p in galerias_dir.iterdir() if p.is_dir()):
+        thumbs_dir = species_dir / THUMBS_DIRNAME
+        thumbs_dir.mkdir(exist_ok=True)
+        index = load_thumbs_index(species_dir)
+        indexes[species_dir] = index
+
+        for image in sorted(species_dir.iterdir()):
+            if not is_gallery_image(image.name):
+                continue
+            stats['images'] += 1
+            entry = index.get(image.name)
+            stat = image.stat()
+
+            # Só recalcula o hash quando tamanho/mtime mudaram
+            if not force and entry and entry.get('sizes') == list(sizes) and \
+                    all((thumbs_dir / t['file']).exists() for t in entry['thumbnails'].values()):
+                if entry.get('size') == stat.st_size and entry.get('mtime_ns') == stat.st_mtime_ns:
+                    stats['skipped'] += 1
+                    continue
+                with open(image, 'rb') as f:
+                    if hashlib.sha256(f.read()).hexdigest() == entry['sha256']:
+                        entry.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+                        stats['skipped'] += 1
+                        continue
+
+            jobs[(species_dir, image.name)] = (str(image), str(thumbs_dir), stat)
+
+    # Respeita a cota de CPU do cgroup (os.cpu_count() vê todas as CPUs do host)
+    with ProcessPoolExecutor(max_workers=workers or available_cpus()) as executor:
+        futures = {
+            executor.submit(build_pyramid, source, thumbs_dir, sizes, quality): key
+            for key, (source, thumbs_dir, _) in jobs.items()
+        }
+        for future in as_completed(futures):
+            species_dir, image_name = futures[future]
+            stat = jobs[(species_dir, image_name)][2]
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"Erro ao gerar miniaturas de {species_dir.name}/{image_name}: {e}")
+                stats['errors'] += 1
+                continue
+            result.update(sizes=list(sizes), size=stat.st_size,
+                          mtime_ns=stat.st_mtime_ns)
+            indexes[species_dir][image_name] = result
+            stats['generated'] += 1
+
+    for species_dir, index in indexes.items():
+        # Remover entradas de imagens que não existem mais
+        for image_name in [n for n in index if not (species_dir / n).exists()]:
+            del index[image_name]
+        # Escrita atômica: /images/<espécie>?srcset=1 pode estar lendo o índice
+        index_file = str(species_dir / THUMBS_DIRNAME / THUMBS_INDEX)
+        tmp_file = temp_path(index_file)
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(index, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_file, index_file)
+        except OSError:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise
+
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Gera miniaturas multi-resolução das galerias')
+    parser.add_argument('--galerias-dir', default=str(default_galerias_dir()),
+                        help='Diretório das galerias')
+    parser.add_argument('--sizes', default=','.join(str(s) for s in THUMBNAIL_SIZES),
+                        help='Larguras das miniaturas, ex.: 128,320,640')
+    parser.add_argument('--quality', type=int, default=82,
+                        help='Qualidade JPEG')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Processos (padrão: CPUs disponíveis, respeitando a cota do cgroup)')
+    parser.add_argument('--force', action='store_true',
+                        help='Regera todas as miniaturas')
+
+    args = parser.parse_args()
+
+    galerias_dir = Path(args.galerias_dir)
+    if not galerias_dir.exists():
+        print(f"Diretório de galerias não encontrado: {galerias_dir}")
+        return
+
+    start = datetime.now()
+    stats = generate_all(galerias_dir, [int(s) for s in args.sizes.split(',')],
+                         args.quality, args.workers, args.force)
+
+    print("\n" + "="*50)
+    print("MINIATURAS")
+    print("="*50)
+    print(f"Imagens: {stats['images']}")
+    print(f"Geradas: {stats['generated']}")
+    print(f"Inalteradas (puladas): {stats['skipped']}")
+    print(f"Erros: {stats['errors']}")
+    print(f"Tempo: {(datetime.now() - start).total_seconds():.1f}s")
+    print("="*50)
+
+
+if __name__ == '__main__':
+    main()
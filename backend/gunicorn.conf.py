@@ -0,0 +1,9 @@
+# Configuração do gunicorn: usa o resultado de `python server_tuning.py`
+# (server_tuning.json) quando existir, limitado às CPUs do cgroup atual
+from server_tuning import load_tuning
+
+tuning = load_tuning()
+
+workers = tuning.get('workers', 1)
+threads = tuning.get('threads', 1)
+worker_class = tuning.get('worker_class', 'sync')
@@ -0,0 +1,227 @@
+"""
+Estado persistente da coleta do iNaturalist (SQLite)
+Registra páginas já consultadas, observações processadas, status de cada foto
+e classes concluídas, para que uma coleta interrompida seja retomada do ponto
+em que parou sem repetir chamadas à API nem verificações no disco.
+Guarda também a marca d'água (updated_since) de cada termo para o modo incremental.
+
+As gravações de fotos e observações são agrupadas em transações: o commit
+acontece junto com a página seguinte da busca (ou a cada COMMIT_EVERY
+gravações); uma interrupção perde no máximo esse lote, refeito na retomada
+"""
+
+import json
+import zlib
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    term TEXT NOT NULL,
+    quality_grade TEXT NOT NULL,
+    per_page INTEGER NOT NULL,
+    since TEXT NOT NULL,
+    cursor INTEGER NOT NULL,
+    results BLOB NOT NULL,
+    fetched_at TEXT NOT NULL,
+    PRIMARY KEY (term, quality_grade, per_page, since, cursor)
+);
+CREATE TABLE IF NOT EXISTS observations (
+    id INTEGER PRIMARY KEY,
+    class_name TEXT NOT NULL,
+    record BLOB NOT NULL,
+    processed_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS observations_class ON observations (class_name);
+CREATE TABLE IF NOT EXISTS photos (
+    url TEXT PRIMARY KEY,
+    observation_id INTEGER,
+    path TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 1,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS classes (
+    class_name TEXT PRIMARY KEY,
+    completed_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS watermarks (
+    term TEXT NOT NULL,
+    quality_grade TEXT NOT NULL,
+    updated_since TEXT NOT NULL,
+    recorded_at TEXT NOT NULL,
+    PRIMARY KEY (term, quality_grade)
+);
+"""
+
+# Status de foto
+PHOTO_DONE = 'done'
+PHOTO_FAILED = 'failed'
+
+# Máximo de gravações pendentes antes de um commit
+COMMIT_EVERY = 200
+
+UPSERT_PHOTO = (
+    'INSERT INTO photos VALUES (?, ?, ?, ?, 1, ?) '
+    'ON CONFLICT(url) DO UPDATE SET status=excluded.status, '
+    'path=excluded.path, attempts=attempts + 1, updated_at=excluded.updated_at')
+
+
+def _pack(value) -> bytes:
+    return zlib.compress(json.dumps(value, ensure_ascii=False).encode('utf-8'))
+
+
+def _unpack(blob: bytes):
+    return json.loads(zlib.decompress(blob).decode('utf-8'))
+
+
+class HarvestState:
+    """Banco SQLite de estado da coleta, compartilhado entre threads"""
+
+    def __init__(self, db_path: str):
+        self.db_path = str(db_path)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        # Bancos sem a coluna since: as páginas são só cache, recriar a tabela
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(pages)')]
+        if columns and 'since' not in columns:
+            self.conn.execute('DROP TABLE pages')
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+        self.pending = 0
+
+    def _execute(self, sql: str, params=(), commit: bool = False):
+        """Grava; o commit fica para o lote, salvo se commit=True"""
+        with self.lock:
+            self.conn.execute(sql, params)
+            self._written(1, commit)
+
+    def _written(self, count: int, commit: bool):
+        """Contabiliza gravações pendentes e faz o commit do lote (chamar com self.lock)"""
+        self.pending += count
+        if commit or self.pending >= COMMIT_EVERY:
+            self.conn.commit()
+            self.pending = 0
+
+    def flush(self):
+        """Confirma as gravações pendentes"""
+        with self.lock:
+            if self.pending:
+                self.conn.commit()
+                self.pending = 0
+
+    def _query(self, sql: str, params=()) -> List[tuple]:
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def reset(self):
+        """
+        Descarta o progresso registrado (nova coleta do zero).
+        As marcas d'água do modo incremental são mantidas.
+        """
+        with self.lock:
+            for table in ('pages', 'observations', 'photos', 'classes'):
+                self.conn.execute(f'DELETE FROM {table}')
+            self.conn.commit()
+            self.pending = 0
+
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
+
+    # Páginas da busca (cursor 0 = primeira página, since '' = coleta completa)
+
+    def get_page(self, term: str, quality_grade: str, per_page: int,
+                 cursor: Optional[int], since: Optional[str] = None) -> Optional[List[Dict]]:
+        rows = self._query(
+            'SELECT results FROM pages WHERE term=? AND quality_grade=? '
+            'AND per_page=? AND since=? AND cursor=?',
+            (term, quality_grade, per_page, since or '', cursor or 0))
+        return _unpack(rows[0][0]) if rows else None
+
+    def save_page(self, term: str, quality_grade: str, per_page: int,
+                  cursor: Optional[int], results: List[Dict], since: Optional[str] = None):
+        """Grava a página e confirma o lote pendente (um commit por página)"""
+        self._execute(
+            'INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (term, quality_grade, per_page, since or '', cursor or 0,
+             _pack(results), datetime.now().isoformat()), commit=True)
+
+    # Marcas d'água do modo incremental
+
+    def get_watermark(self, term: str, quality_grade: str) -> Optional[str]:
+        rows = self._query(
+            'SELECT updated_since FROM watermarks WHERE term=? AND quality_grade=?',
+            (term, quality_grade))
+        return rows[0][0] if rows else None
+
+    def set_watermark(self, term: str, quality_grade: str, updated_since: str):
+        self._execute(
+            'INSERT OR REPLACE INTO watermarks VALUES (?, ?, ?, ?)',
+            (term, quality_grade, updated_since, datetime.now().isoformat()), commit=True)
+
+    # Observações processadas
+
+    def get_observation(self, observation_id: int) -> Optional[Dict]:
+        rows = self._query('SELECT record FROM observations WHERE id=?',
+                           (observation_id,))
+        return _unpack(rows[0][0]) if rows else None
+
+    def save_observation(self, record: Dict, photos: List[Tuple[str, str, str]] = ()):
+        """Grava a observação e o status das suas fotos (url, caminho, status) juntos"""
+        now = datetime.now().isoformat()
+        with self.lock:
+            self.conn.executemany(UPSERT_PHOTO, [
+                (url, record['observation_id'], path, status, now)
+                for url, path, status in photos])
+            self.conn.execute(
+                'INSERT OR REPLACE INTO observations VALUES (?, ?, ?, ?)',
+                (record['observation_id'], record['class'], _pack(record), now))
+            self._written(len(photos) + 1, commit=False)
+
+    def class_observations(self, class_name: str) -> List[Dict]:
+        rows = self._query(
+            'SELECT record FROM observations WHERE class_name=? ORDER BY id DESC',
+            (class_name,))
+        return [_unpack(row[0]) for row in rows]
+
+    # Fotos
+
+    def get_photo(self, url: str) -> Optional[Dict]:
+        rows = self._query(
+            'SELECT status, path, attempts FROM photos WHERE url=?', (url,))
+        if not rows:
+            return None
+        status, path, attempts = rows[0]
+        return {'status': status, 'path': path, 'attempts': attempts}
+
+    # Classes concluídas
+
+    def is_class_complete(self, class_name: str) -> bool:
+        return bool(self._query(
+            'SELECT 1 FROM classes WHERE class_name=?', (class_name,)))
+
+    def mark_class_complete(self, class_name: str):
+        self._execute('INSERT OR REPLACE INTO classes VALUES (?, ?)',
+                      (class_name, datetime.now().isoformat()), commit=True)
+
+    def _count(self, sql: str) -> int:
+        """Resultado de um SELECT COUNT(*) (chamar com self.lock)"""
+        return self.conn.execute(sql).fetchone()[0]
+
+    def summary(self) -> Dict:
+        with self.lock:
+            return {
+                'pages': self._count('SELECT COUNT(*) FROM pages'),
+                'observations': self._count('SELECT COUNT(*) FROM observations'),
+                'photos_done': self._count(
+                    f"SELECT COUNT(*) FROM photos WHERE status='{PHOTO_DONE}'"),
+                'photos_failed': self._count(
+                    f"SELECT COUNT(*) FROM photos WHERE status='{PHOTO_FAILED}'"),
+                'classes_completed': self._count('SELECT COUNT(*) FROM classes')
+            }
@@ -0,0 +1,105 @@
+"""
+Cache em disco das respostas JSON da API do iNaturalist
+Chave = endpoint + parâmetros; entradas comprimidas (gzip) com TTL, revalidação
+condicional (ETag/Last-Modified), limite de tamanho com remoção LRU e modo offline
+"""
+
+import os
+import json
+import gzip
+import time
+import hashlib
+from urllib.parse import urlencode
+from typing import Dict, Optional
+from disk_lru import DiskLRU, temp_path
+
+
+class ResponseCache(DiskLRU):
+    """
+    Cache LRU em disco (DiskLRU): o mtime do arquivo marca o último acesso e as
+    entradas menos recentes saem quando o total passa de max_bytes.
+    """
+
+    def __init__(self, cache_dir: str, ttl: float = 86400,
+                 max_bytes: int = 500 * 1024 * 1024, offline: bool = False):
+        super().__init__(cache_dir, max_bytes)
+        self.ttl = ttl
+        self.offline = offline
+        self.stats.update({'hits': 0, 'revalidated': 0, 'misses': 0})
+
+    @staticmethod
+    def key(url: str, params: Dict) -> str:
+        # Booleanos normalizados como na query string (True -> 'true')
+        query = urlencode(sorted(
+            (k, str(v).lower() if isinstance(v, bool) else str(v))
+            for k, v in (params or {}).items()))
+        return hashlib.sha256(f'{url}?{query}'.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + '.json.gz')
+
+    def lookup(self, url: str, params: Dict) -> Optional[Dict]:
+        """Entrada armazenada (fresca ou não) ou None"""
+        path = self._path(self.key(url, params))
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self.touch(path)
+        return entry
+
+    def is_fresh(self, entry: Dict) -> bool:
+        return time.time() - entry['stored_at'] < self.ttl
+
+    def hit(self, entry: Dict) -> Dict:
+        with self.lock:
+            self.stats['hits'] += 1
+        return entry['body']
+
+    def miss(self):
+        with self.lock:
+            self.stats['misses'] += 1
+
+    @staticmethod
+    def conditional_headers(entry: Optional[Dict]) -> Dict[str, str]:
+        """Cabeçalhos para revalidar uma entrada vencida"""
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def revalidated(self, url: str, params: Dict, entry: Dict) -> Dict:
+        """Resposta 304: a entrada continua válida por mais um TTL"""
+        entry['stored_at'] = time.time()
+        self._write(self.key(url, params), entry)
+        with self.lock:
+            self.stats['revalidated'] += 1
+        return entry['body']
+
+    def store(self, url: str, params: Dict, body, headers=None):
+        headers = headers or {}
+        self._write(self.key(url, params), {
+            'url': url,
+            'params': params,
+            'stored_at': time.time(),
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'body': body
+        })
+
+    def _write(self, key: str, entry: Dict):
+        path = self._path(key)
+        tmp_path = temp_path(path)
+        with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=6) as f:
+            json.dump(entry, f, ensure_ascii=False)
+        size = os.path.getsize(tmp_path)
+        try:
+            previous = os.path.getsize(path)
+        except OSError:
+            previous = 0
+        os.replace(tmp_path, path)
+        self._added(path, size, previous)
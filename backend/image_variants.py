@@ -0,0 +1,109 @@
+"""
+Variantes redimensionadas/transcodificadas das imagens das galerias
+Geradas no primeiro acesso e guardadas em um cache LRU em disco com tamanho limitado
+"""
+
+import os
+import hashlib
+from typing import Optional, Tuple
+from PIL import Image, UnidentifiedImageError, features
+from disk_lru import DiskLRU, temp_path
+
+# Larguras servidas; a pedida é arredondada para a próxima da lista
+# (evita uma variante por pixel e limita o trabalho por requisição)
+ALLOWED_WIDTHS = (64, 128, 240, 320, 480, 640, 800, 1080, 1600)
+
+FORMATS = {
+    'webp': ('WEBP', 'image/webp', '.webp'),
+    'avif': ('AVIF', 'image/avif', '.avif'),
+    'jpeg': ('JPEG', 'image/jpeg', '.jpg'),
+    'png': ('PNG', 'image/png', '.png')
+}
+
+
+def snap_width(width: int) -> int:
+    """Menor largura permitida que seja >= a pedida"""
+    for allowed in ALLOWED_WIDTHS:
+        if allowed >= width:
+            return allowed
+    return ALLOWED_WIDTHS[-1]
+
+
+def negotiate_format(requested: Optional[str], accept_header: str, source_path: str) -> str:
+    """
+    Escolhe o formato de saída: o pedido em fmt=, ou com fmt=auto o melhor
+    formato aceito pelo cliente (cabeçalho Accept)
+    """
+    if requested and requested != 'auto':
+        if requested not in FORMATS:
+            raise ValueError(f'Formato não suportado: {requested}')
+        if requested == 'avif' and not features.check('avif'):
+            raise ValueError('Formato avif indisponível neste servidor')
+        return requested
+
+    accept = accept_header or ''
+    if requested == 'auto':
+        if 'image/avif' in accept and features.check('avif'):
+            return 'avif'
+        if 'image/webp' in accept:
+            return 'webp'
+    return 'png' if source_path.lower().endswith('.png') else 'jpeg'
+
+
+class ImageVariantCache(DiskLRU):
+    """
+    Cache LRU em disco das variantes (DiskLRU): o mtime do arquivo marca o
+    último acesso e as variantes menos recentes saem quando o total passa de max_bytes.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int, quality: int = 80):
+        super().__init__(cache_dir, max_bytes)
+        self.quality = quality
+        self.stats.update({'hits': 0, 'misses': 0})
+
+    def _variant_path(self, source_path: str, width: int, fmt: str) -> str:
+        stat = os.stat(source_path)
+        # A chave inclui tamanho e mtime da origem: imagem alterada gera nova variante
+        key = hashlib.sha1(
+            f'{source_path}|{stat.st_size}|{stat.st_mtime_ns}|{width}|{fmt}|{self.quality}'
+            .encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key + FORMATS[fmt][2])
+
+    def get(self, source_path: str, width: int, fmt: str) -> Tuple[str, str]:
+        """
+        Retorna (caminho da variante, mimetype), gerando-a se necessário.
+        Origem que não é imagem gera ValueError
+        """
+        path = self._variant_path(source_path, width, fmt)
+
+        if self.touch(path):
+            with self.lock:
+                self.stats['hits'] += 1
+            return path, FORMATS[fmt][1]
+
+        tmp_path = temp_path(path)
+        try:
+            with Image.open(source_path) as img:
+                if fmt in ('jpeg', 'webp', 'avif') and img.mode not in ('RGB', 'L'):
+                    img = img.convert('RGB')
+                if img.width > width:
+                    img.thumbnail((width, img.height * width // img.width + 1), Image.LANCZOS)
+                img.save(tmp_path, FORMATS[fmt][0], quality=self.quality)
+        except UnidentifiedImageError:
+            raise ValueError('o arquivo não é uma imagem')
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        size = os.path.getsize(tmp_path)
+        try:
+            # Outro worker pode ter gerado a mesma variante ao mesmo tempo
+            previous = os.path.getsize(path)
+        except OSError:
+            previous = 0
+        os.replace(tmp_path, path)
+
+        with self.lock:
+            self.stats['misses'] += 1
+        self._added(path, size, previous)
+        return path, FORMATS[fmt][1]
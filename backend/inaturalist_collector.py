@@ -11,16 +11,23 @@ import time
 import requests
 import argparse
 from pathlib import Path
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import List, Dict, Optional, Tuple
 import logging
 from urllib.parse import urlencode
 from PIL import Image
 import io
+import re
 import hashlib
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed
 import threading
 
+from rate_limiter import RateLimiter
+from harvest_state import HarvestState, PHOTO_DONE, PHOTO_FAILED
+from http_cache import ResponseCache
+from taxon_resolver import ANIMALIA_TAXON_ID, TaxonResolver, ancestor_ids
+from prefilter import MetadataPrefilter
+
 # Configurar logging
 logging.basicConfig(
     level=logging.INFO,
@@ -137,11 +144,113 @@ SCIENTIFIC_NAME_MAPPING = {
     'Dolichovespula': 'vespa_predadora'
 }
 
+# Palavras (tokens exatos) do nome comum, usadas quando o nome científico não resolve
+COMMON_NAME_MAPPING = {
+    'spider': 'aranhas',
+    'aranha': 'aranhas',
+    'ladybug': 'joaninhas',
+    'joaninha': 'joaninhas',
+    'dragonfly': 'libelulas',
+    'libélula': 'libelulas',
+    'wasp': 'vespa_predadora',
+    'vespa': 'vespa_predadora'
+}
+
+# Qualificadores que mudam a classe do nome comum (ex.: "parasitoid wasp")
+COMMON_NAME_OVERRIDES = {
+    'wasp': {'parasitoid': 'vespa_parasitoide', 'ichneumon': 'vespa_parasitoide'},
+    'vespa': {'parasitoide': 'vespa_parasitoide', 'icneumonídeo': 'vespa_parasitoide'}
+}
+
+
+# Busca por táxon: termos com este prefixo viram taxon_id= na API
+TAXON_QUERY_PREFIX = 'taxon_id:'
+
+# Dimensão mínima (largura e altura) aceita para as imagens baixadas
+MIN_IMAGE_SIZE = 100
+
+# Tentativas de uma foto que falhou antes de desistir dela entre execuções
+MAX_PHOTO_ATTEMPTS = 3
+
+# Resolução de treino (train_model.py redimensiona para 224x224)
+TRAINING_RESOLUTION = 224
+
+# Tamanhos de foto do iNaturalist: maior lado de cada variante (square é recorte 75x75)
+PHOTO_SIZES = {
+    'square': 75,
+    'small': 240,
+    'medium': 500,
+    'large': 1024,
+    'original': 2048
+}
+_PHOTO_SIZE_RE = re.compile(r'/(square|thumb|small|medium|large|original)\.(\w+)(\?.*)?$')
+
+
+def select_photo_size(photo: Dict, target: int = TRAINING_RESOLUTION) -> str:
+    """
+    Menor variante cujo menor lado atinge a resolução de treino, pelas dimensões
+    do original; se o original for menor que isso, a que o entrega por inteiro
+    """
+    dimensions = photo.get('original_dimensions') or {}
+    width, height = dimensions.get('width'), dimensions.get('height')
+    if not width or not height:
+        return 'medium'  # menor lado >= 224 até proporção ~2,2:1
+
+    longest, shortest = max(width, height), min(width, height)
+    for size in ('small', 'medium', 'large', 'original'):
+        scale = min(1.0, PHOTO_SIZES[size] / longest)
+        if shortest * scale >= target or PHOTO_SIZES[size] >= longest:
+            return size
+    return 'original'
+
+
+def photo_url_for_size(photo_url: str, size: str) -> str:
+    """Troca a variante na URL da foto (.../square.jpg -> .../medium.jpg)"""
+    return _PHOTO_SIZE_RE.sub(
+        lambda m: f'/{size}.{m.group(2)}{m.group(3) or ""}', photo_url)
+
+
+def validate_image_bytes(content: bytes) -> Tuple[bool, str]:
+    """
+    Valida em memória uma imagem baixada, em uma única passada: as dimensões
+    vêm do cabeçalho (rejeita pequenas sem decodificar) e depois verify()
+    """
+    try:
+        with Image.open(io.BytesIO(content)) as img:
+            width, height = img.size
+            if width < MIN_IMAGE_SIZE or height < MIN_IMAGE_SIZE:
+                return False, f"imagem muito pequena: {width}x{height}"
+            img.verify()
+    except Exception as e:
+        return False, f"imagem inválida: {e}"
+    return True, ''
+
+
+def write_file_atomic(path: Path, content: bytes):
+    """Grava em arquivo temporário e renomeia (nunca deixa arquivo parcial)"""
+    tmp_path = path.with_name(
+        f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
 
 class iNaturalistCollector:
     """Coletor de dados do iNaturalist"""
 
-    def __init__(self, output_dir: str = "enhanced_insect_data", api_key: Optional[str] = None):
+    def __init__(self, output_dir: str = "enhanced_insect_data", api_key: Optional[str] = None,
+                 resume: bool = False, incremental: bool = False,
+                 response_cache: Optional[ResponseCache] = None,
+                 search_by_taxon: bool = False,
+                 prefilter: Optional[MetadataPrefilter] = None,
+                 photo_size: str = 'auto'):
         self.base_url = "https://api.inaturalist.org/v1"
         self.output_dir = Path(output_dir)
         self.api_key = api_key
@@ -154,9 +263,43 @@ class iNaturalistCollector:
         # Criar diretórios de saída
         self._create_output_directories()
 
-        # Controle de rate limiting
-        self.last_request_time = 0
-        self.min_request_interval = 0.1  # 100ms entre requests
+        # Estado persistente da coleta; sem resume a coleta começa do zero
+        # (as marcas d'água do modo incremental são preservadas)
+        self.resume = resume
+        self.incremental = incremental
+        self.state = HarvestState(self.output_dir / "metadata" / "harvest_state.db")
+        if not resume:
+            self.state.reset()
+
+        # Resolução táxon -> classe (ids conhecidos persistidos entre execuções)
+        self.taxon_ids_file = self.output_dir / "metadata" / "taxon_ids.json"
+        self.taxon_resolver = TaxonResolver(
+            SCIENTIFIC_NAME_MAPPING, COMMON_NAME_MAPPING,
+            common_name_overrides=COMMON_NAME_OVERRIDES)
+        self.taxon_resolver.load_ids(self.taxon_ids_file)
+
+        # Busca por taxon_id= (ids de cada classe resolvidos uma vez e guardados)
+        self.search_by_taxon = search_by_taxon
+        self.class_taxa_file = self.output_dir / "metadata" / "class_taxa.json"
+        self.class_taxa = None
+        # Classes com alguma consulta de táxon que falhou (não vão para o cache)
+        self.partial_class_taxa = set()
+        self.class_taxa_learned = False
+
+        # Variante das fotos a baixar ('auto' = menor que atende ao treino)
+        if photo_size != 'auto' and photo_size not in PHOTO_SIZES:
+            raise ValueError(f"Tamanho de foto inválido: {photo_size}")
+        self.photo_size = photo_size
+
+        # Filtro por metadados antes do download e cota de fotos por classe
+        self.prefilter = prefilter or MetadataPrefilter(min_dimension=MIN_IMAGE_SIZE)
+
+        # Cache em disco das respostas da API (opcional; offline = só cache)
+        self.response_cache = response_cache
+
+        # Controle de rate limiting (token bucket por classe de endpoint)
+        self.rate_limiter = RateLimiter()
+        self.max_retries = 3
 
         # Estatísticas
         self.stats = {
@@ -165,12 +308,24 @@ class iNaturalistCollector:
             'successful_downloads': 0,
             'failed_downloads': 0,
             'duplicates_skipped': 0,
-            'quality_filtered': 0
+            'quality_filtered': 0,
+            'duplicate_observations': 0,
+            'duplicate_photos': 0,
+            'downloads_avoided': 0,
+            'quota_skipped': 0,
+            'offline_skipped': 0
         }
 
         # Lock para thread safety
         self.lock = threading.Lock()
 
+        # Observações e fotos já agendadas nesta execução (entre termos e classes)
+        self.seen_observation_ids = set()
+        self.seen_photo_ids = set()
+
+        # Classes cuja busca parou por falha da API (não são marcadas como concluídas)
+        self.incomplete_classes = set()
+
     def _create_output_directories(self):
         """Cria diretórios de saída para cada classe"""
         for class_name in TARGET_CLASSES:
@@ -180,64 +335,160 @@ class iNaturalistCollector:
         # Diretório para metadados
         (self.output_dir / "metadata").mkdir(parents=True, exist_ok=True)
 
-    def _rate_limit(self):
-        """Implementa rate limiting para respeitar limites da API"""
-        current_time = time.time()
-        time_since_last = current_time - self.last_request_time
-
-        if time_since_last < self.min_request_interval:
-            time.sleep(self.min_request_interval - time_since_last)
-
-        self.last_request_time = time.time()
+    def _rate_limit(self, kind: str = 'api'):
+        """Aguarda uma ficha do balde da classe de endpoint (thread-safe)"""
+        self.rate_limiter.acquire(kind)
 
     def _make_request(self, endpoint: str, params: Dict) -> Optional[Dict]:
         """Faz requisição para a API do iNaturalist com rate limiting"""
-        self._rate_limit()
-
         url = f"{self.base_url}/{endpoint}"
 
-        try:
-            response = self.session.get(url, params=params, timeout=30)
-            response.raise_for_status()
-            return response.json()
-
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Erro na requisição para {url}: {e}")
+        cache = self.response_cache
+        cached = cache.lookup(url, params) if cache else None
+        if cached is not None and (cache.offline or cache.is_fresh(cached)):
+            return cache.hit(cached)
+        if cache and cache.offline:
+            cache.miss()
+            logger.warning(f"Modo offline: resposta não está no cache ({url})")
             return None
 
-    def search_observations(self, taxon_name: str, quality_grade: str = "research",
-                            per_page: int = 200, max_pages: int = 10) -> List[Dict]:
-        """Busca observações por nome científico"""
-        observations = []
+        for attempt in range(self.max_retries):
+            self._rate_limit('api')
+            try:
+                response = self.session.get(
+                    url, params=params, timeout=30,
+                    headers=ResponseCache.conditional_headers(cached))
+                pause = self.rate_limiter.observe(
+                    'api', response.status_code, response.headers)
+                if pause is not None and attempt < self.max_retries - 1:
+                    logger.warning(
+                        f"API limitou a requisição ({response.status_code}), "
+                        f"nova tentativa em {pause:.1f}s")
+                    continue
+                if response.status_code == 304 and cached is not None:
+                    return cache.revalidated(url, params, cached)
+                response.raise_for_status()
+                data = response.json()
+                if cache:
+                    cache.miss()
+                    cache.store(url, params, data, response.headers)
+                return data
 
-        for page in range(1, max_pages + 1):
-            params = {
-                'q': taxon_name,
-                'quality_grade': quality_grade,
-                'has_photos': True,
-                'per_page': per_page,
-                'page': page,
-                'order': 'desc',
-                'order_by': 'created_at'
-            }
+            except requests.exceptions.RequestException as e:
+                logger.error(f"Erro na requisição para {url}: {e}")
+                return None
 
-            logger.info(f"Buscando página {page} para {taxon_name}...")
-            data = self._make_request('observations', params)
+        return None
 
-            if not data or 'results' not in data:
-                logger.warning(
-                    f"Nenhum resultado encontrado para {taxon_name} na página {page}")
-                break
+    def _search_params(self, taxon_name: str, quality_grade: str, per_page: int,
+                       id_below: Optional[int] = None, since: Optional[str] = None) -> Dict:
+        """
+        Parâmetros da busca de observações na API. A paginação é por cursor
+        (id_below, ordem decrescente de id), sem o limite de offset de page=.
+        Com since, só observações criadas ou atualizadas depois dessa data.
+        """
+        params = {
+            'quality_grade': quality_grade,
+            'has_photos': True,
+            'per_page': per_page,
+            'order': 'desc',
+            'order_by': 'id'
+        }
+        if taxon_name.startswith(TAXON_QUERY_PREFIX):
+            params['taxon_id'] = taxon_name[len(TAXON_QUERY_PREFIX):]
+        else:
+            params['q'] = taxon_name
+        if id_below is not None:
+            params['id_below'] = id_below
+        if since:
+            params['updated_since'] = since
+        return params
+
+    @staticmethod
+    def _next_cursor(page_observations: List[Dict], per_page: int) -> Optional[int]:
+        """Cursor da próxima página (menor id recebido) ou None se for a última"""
+        if len(page_observations) < per_page:
+            return None
+        ids = [obs['id'] for obs in page_observations if obs.get('id')]
+        return min(ids) if ids else None
+
+    def _fetch_page(self, taxon_name: str, quality_grade: str, per_page: int,
+                    cursor: Optional[int], since: Optional[str] = None) -> Optional[Dict]:
+        """Página da busca: do estado salvo (retomada) ou da API"""
+        results = self.state.get_page(taxon_name, quality_grade, per_page, cursor, since)
+        if results is not None:
+            return {'results': results}
+
+        data = self._make_request(
+            'observations',
+            self._search_params(taxon_name, quality_grade, per_page, cursor, since))
+        if data and 'results' in data:
+            self.state.save_page(taxon_name, quality_grade, per_page, cursor,
+                                 data['results'], since)
+        return data
+
+    def _search_window(self, taxon_name: str, quality_grade: str = "research"):
+        """
+        (since, início) da busca de um termo. No modo incremental since é a marca
+        d'água da última coleta completa do termo; o início vira a nova marca.
+        """
+        if not self.incremental:
+            return None, None
+        started = datetime.now(timezone.utc).isoformat(timespec='seconds')
+        return self.state.get_watermark(taxon_name, quality_grade), started
+
+    def iter_observation_pages(self, taxon_name: str, quality_grade: str = "research",
+                               per_page: int = 200, max_pages: Optional[int] = 10,
+                               since: Optional[str] = None, progress: Optional[Dict] = None):
+        """
+        Gera as páginas de observações. A próxima página é pedida em segundo
+        plano assim que o cursor é conhecido, enquanto a atual é processada
+        (no máximo uma página adiantada). progress['exhausted'] indica se
+        todas as páginas foram percorridas (max_pages=None: sem limite) e
+        progress['failed'] se a busca parou porque uma página não pôde ser obtida.
+        """
+        with ThreadPoolExecutor(max_workers=1) as prefetcher:
+            future = prefetcher.submit(
+                self._fetch_page, taxon_name, quality_grade, per_page, None, since)
+
+            page = 0
+            while max_pages is None or page < max_pages:
+                page += 1
+                logger.info(f"Buscando página {page} para {taxon_name}...")
+                data = future.result()
+
+                if not data or 'results' not in data:
+                    logger.warning(
+                        f"Falha ao obter a página {page} de {taxon_name}; busca interrompida")
+                    if progress is not None:
+                        progress['failed'] = True
+                    return
+
+                page_observations = data['results']
+                cursor = self._next_cursor(page_observations, per_page)
+                if cursor is None and progress is not None:
+                    progress['exhausted'] = True
+                if cursor is not None and (max_pages is None or page < max_pages):
+                    future = prefetcher.submit(
+                        self._fetch_page, taxon_name, quality_grade, per_page,
+                        cursor, since)
+                else:
+                    cursor = None
 
-            page_observations = data['results']
-            observations.extend(page_observations)
+                logger.info(
+                    f"Encontradas {len(page_observations)} observações na página {page}")
+                yield page_observations
 
-            # Se retornou menos que o esperado, provavelmente é a última página
-            if len(page_observations) < per_page:
-                break
+                if cursor is None:
+                    return
 
-            logger.info(
-                f"Encontradas {len(page_observations)} observações na página {page}")
+    def search_observations(self, taxon_name: str, quality_grade: str = "research",
+                            per_page: int = 200, max_pages: int = 10) -> List[Dict]:
+        """Busca observações por nome científico"""
+        observations = []
+        for page_observations in self.iter_observation_pages(
+                taxon_name, quality_grade, per_page, max_pages):
+            observations.extend(page_observations)
 
         logger.info(
             f"Total de {len(observations)} observações encontradas para {taxon_name}")
@@ -252,130 +503,72 @@ class iNaturalistCollector:
             return data['results'][0]
         return None
 
-    def classify_observation(self, observation: Dict) -> Optional[str]:
-        """Classifica uma observação baseada no táxon"""
-        if 'taxon' not in observation:
-            return None
-
-        taxon = observation['taxon']
-
-        # Tentar mapear pelo nome científico
-        scientific_name = taxon.get('name', '')
-        for sci_name, class_name in SCIENTIFIC_NAME_MAPPING.items():
-            if sci_name.lower() in scientific_name.lower():
-                return class_name
-
-        # Tentar mapear pelo nome comum
-        common_names = taxon.get('preferred_common_name', '')
-        if common_names:
-            common_lower = common_names.lower()
-            if 'spider' in common_lower or 'aranha' in common_lower:
-                return 'aranhas'
-            elif 'ladybug' in common_lower or 'joaninha' in common_lower:
-                return 'joaninhas'
-            elif 'dragonfly' in common_lower or 'libélula' in common_lower:
-                return 'libelulas'
-            elif 'wasp' in common_lower or 'vespa' in common_lower:
-                if 'parasitoid' in common_lower or 'ichneumon' in common_lower:
-                    return 'vespa_parasitoide'
-                else:
-                    return 'vespa_predadora'
+    @property
+    def offline(self) -> bool:
+        """Modo offline: sem acesso à API nem aos servidores de fotos"""
+        return bool(self.response_cache and self.response_cache.offline)
 
-        return None
+    def classify_observation(self, observation: Dict) -> Optional[str]:
+        """Classifica uma observação baseada no táxon (id, ancestrais ou nomes)"""
+        return self.taxon_resolver.resolve(observation.get('taxon'))
+
+    def verify_image(self, content: bytes) -> Tuple[bool, str]:
+        """
+        Valida os bytes de uma imagem na própria thread de download: lê só o
+        cabeçalho e roda verify(), barato demais para compensar copiar os
+        bytes para outro processo
+        """
+        return validate_image_bytes(content)
+
+    def close(self):
+        """Salva os ids de táxons aprendidos e fecha o banco de estado"""
+        self.taxon_resolver.save_ids(self.taxon_ids_file)
+        self.state.close()
 
     def download_image(self, photo_url: str, output_path: Path) -> bool:
-        """Baixa uma imagem da URL fornecida"""
-        max_retries = 3
-        retry_delay = 1.0
-
-        for attempt in range(max_retries):
+        """Baixa uma imagem, valida em memória e grava somente se aceita"""
+        for attempt in range(self.max_retries):
             try:
+                self._rate_limit('photos')
                 response = self.session.get(photo_url, timeout=30)
+                if self.rate_limiter.observe('photos', response.status_code,
+                                             response.headers) is not None:
+                    # A pausa já foi aplicada ao balde; tentar de novo
+                    continue
                 response.raise_for_status()
-
-                # Verificar se é realmente uma imagem
-                content_type = response.headers.get('content-type', '')
-                if not content_type.startswith('image/'):
-                    logger.warning(f"URL não é uma imagem: {photo_url}")
-                    return False
-
-                # Salvar imagem com retry em caso de conflito
-                for save_attempt in range(max_retries):
-                    try:
-                        # Usar modo exclusivo para evitar conflitos
-                        with open(output_path, 'xb') as f:
-                            f.write(response.content)
-                        break
-                    except FileExistsError:
-                        # Arquivo já existe, pular
-                        return True
-                    except PermissionError:
-                        if save_attempt < max_retries - 1:
-                            time.sleep(retry_delay)
-                            continue
-                        else:
-                            logger.warning(
-                                f"Erro de permissão ao salvar {output_path}")
-                            return False
-
-                # Verificar se a imagem é válida (com retry)
-                for verify_attempt in range(max_retries):
-                    try:
-                        # Aguardar um pouco para garantir que o arquivo foi fechado
-                        time.sleep(0.1)
-
-                        with Image.open(output_path) as img:
-                            img.verify()
-
-                        # Verificar tamanho mínimo
-                        with Image.open(output_path) as img:
-                            if img.size[0] < 100 or img.size[1] < 100:
-                                logger.warning(
-                                    f"Imagem muito pequena: {output_path}")
-                                try:
-                                    os.remove(output_path)
-                                except:
-                                    pass
-                                return False
-
-                        return True
-
-                    except (OSError, PermissionError) as e:
-                        if verify_attempt < max_retries - 1:
-                            time.sleep(retry_delay)
-                            continue
-                        else:
-                            logger.warning(
-                                f"Erro ao verificar imagem {output_path}: {e}")
-                            try:
-                                os.remove(output_path)
-                            except:
-                                pass
-                            return False
-                    except Exception as e:
-                        logger.warning(f"Imagem inválida {output_path}: {e}")
-                        try:
-                            os.remove(output_path)
-                        except:
-                            pass
-                        return False
-
-            except Exception as e:
-                if attempt < max_retries - 1:
+            except requests.exceptions.RequestException as e:
+                if attempt < self.max_retries - 1:
                     logger.warning(
                         f"Tentativa {attempt + 1} falhou para {photo_url}: {e}")
-                    time.sleep(retry_delay)
+                    time.sleep(2 ** attempt)
                     continue
-                else:
-                    logger.error(
-                        f"Erro ao baixar {photo_url} após {max_retries} tentativas: {e}")
-                    return False
+                logger.error(
+                    f"Erro ao baixar {photo_url} após {self.max_retries} tentativas: {e}")
+                return False
+
+            # Verificar se é realmente uma imagem
+            content_type = response.headers.get('content-type', '')
+            if not content_type.startswith('image/'):
+                logger.warning(f"URL não é uma imagem: {photo_url}")
+                return False
+
+            valid, reason = self.verify_image(response.content)
+            if not valid:
+                logger.warning(f"{reason}: {photo_url}")
+                return False
+
+            try:
+                write_file_atomic(output_path, response.content)
+            except OSError as e:
+                logger.warning(f"Erro ao salvar {output_path}: {e}")
+                return False
+            return True
 
         return False
 
-    def process_observation(self, observation: Dict, class_name: str) -> Dict:
-        """Processa uma observação e baixa suas imagens"""
-        result = {
+    def _observation_record(self, observation: Dict, class_name: str) -> Dict:
+        """Estrutura de metadados de uma observação processada"""
+        return {
             'observation_id': observation.get('id'),
             'class': class_name,
             'taxon_name': observation.get('taxon', {}).get('name', ''),
@@ -387,76 +580,220 @@ class iNaturalistCollector:
             'metadata': observation
         }
 
-        photos = observation.get('photos', [])
-        if not photos:
-            return result
-
-        class_dir = self.output_dir / "raw_data" / class_name
-
-        for i, photo in enumerate(photos):
+    def _image_output_path(self, class_name: str, observation: Dict,
+                           index: int, photo_url: str) -> Path:
+        """Gera nome único para a imagem de uma observação"""
+        image_hash = hashlib.md5(photo_url.encode()).hexdigest()[:8]
+        filename = f"{class_name}_{observation['id']}_{index}_{image_hash}.jpg"
+        return self.output_dir / "raw_data" / class_name / filename
+
+    def _photo_needs_download(self, result: Dict, photo_url: str, output_path: Path) -> bool:
+        """
+        Consulta o estado da coleta (sem acessar o disco) para saber se a foto
+        ainda precisa ser baixada; fotos já baixadas entram no resultado
+        """
+        record = self.state.get_photo(photo_url)
+        if record is None:
+            # Foto desconhecida pelo estado: verificar o disco
+            if not output_path.exists():
+                return True
+            record = {'status': PHOTO_DONE, 'path': str(output_path)}
+
+        if record['status'] == PHOTO_DONE:
+            result['images'].append(record['path'])
+            with self.lock:
+                self.stats['duplicates_skipped'] += 1
+            return False
+        return record['attempts'] < MAX_PHOTO_ATTEMPTS
+
+    def _record_photo(self, result: Dict, photo_url: str, output_path: Path,
+                      ok: bool) -> Tuple[str, str, str]:
+        """
+        Atualiza resultado e estatísticas após o download de uma foto. Retorna
+        o status da foto, gravado no estado junto com a observação
+        """
+        if ok:
+            result['images'].append(str(output_path))
+            with self.lock:
+                self.stats['successful_downloads'] += 1
+                self.stats['total_images'] += 1
+        else:
+            self.prefilter.release(result['class'])
+            with self.lock:
+                self.stats['failed_downloads'] += 1
+        return photo_url, str(output_path), PHOTO_DONE if ok else PHOTO_FAILED
+
+    def _accept_observation(self, observation: Dict, class_name: str) -> bool:
+        """
+        Decide se a observação deve ser processada: classe correta, metadados
+        aceitos pelo pré-filtro e ainda não agendada nesta execução
+        """
+        if self.classify_observation(observation) != class_name:
+            return False
+        reason = self.prefilter.check_observation(observation)
+        if reason:
+            logger.debug(f"Observação {observation.get('id')} descartada: {reason}")
+            with self.lock:
+                self.stats['quality_filtered'] += 1
+            return False
+        return self._claim_observation(observation)
+
+    def _claim_observation(self, observation: Dict) -> bool:
+        """
+        Reserva a observação para esta execução. Falso se ela já foi agendada
+        (mesma observação devolvida por outro termo de busca)
+        """
+        observation_id = observation.get('id')
+        with self.lock:
+            if observation_id in self.seen_observation_ids:
+                self.stats['duplicate_observations'] += 1
+                self.stats['downloads_avoided'] += len(observation.get('photos', []))
+                return False
+            self.seen_observation_ids.add(observation_id)
+            return True
+
+    def _plan_photos(self, observation: Dict, class_name: str) -> List[Tuple[int, str]]:
+        """
+        Fotos da observação a agendar: (índice, url na variante escolhida).
+        Roda no loop principal, antes de submeter o trabalho, para que fotos
+        repetidas e descartadas pelos metadados não ocupem um worker e para que
+        a vaga na cota da classe seja reservada antes de quota_full ser consultado
+        """
+        planned = []
+        for i, photo in enumerate(observation.get('photos', [])):
             photo_url = photo.get('url', '')
             if not photo_url:
                 continue
+            size = select_photo_size(photo) if self.photo_size == 'auto' else self.photo_size
+            photo_url = photo_url_for_size(photo_url, size)
+
+            # A mesma foto pode estar ligada a mais de uma observação
+            photo_key = photo.get('id') or photo_url
+            with self.lock:
+                if photo_key in self.seen_photo_ids:
+                    self.stats['duplicate_photos'] += 1
+                    self.stats['downloads_avoided'] += 1
+                    continue
+                self.seen_photo_ids.add(photo_key)
 
-            # Gerar nome único para a imagem
-            image_hash = hashlib.md5(photo_url.encode()).hexdigest()[:8]
-            filename = f"{class_name}_{observation['id']}_{i}_{image_hash}.jpg"
-            output_path = class_dir / filename
-
-            # Pular se já existe
-            if output_path.exists():
+            # Metadados da foto (dimensões do original, licença, sinalizações)
+            reason = self.prefilter.check_photo(photo)
+            if reason:
+                logger.debug(f"Foto {photo_key} descartada: {reason}")
                 with self.lock:
-                    self.stats['duplicates_skipped'] += 1
+                    self.stats['quality_filtered'] += 1
                 continue
 
-            # Baixar imagem
-            if self.download_image(photo_url, output_path):
-                result['images'].append(str(output_path))
-                with self.lock:
-                    self.stats['successful_downloads'] += 1
-                    self.stats['total_images'] += 1
-            else:
+            if not self.prefilter.reserve(class_name):
                 with self.lock:
-                    self.stats['failed_downloads'] += 1
+                    self.stats['quota_skipped'] += 1
+                continue
 
+            planned.append((i, photo_url))
+        return planned
+
+    def _photo_jobs(self, observation: Dict, class_name: str, result: Dict,
+                    planned: List[Tuple[int, str]]) -> List[Tuple[str, Path]]:
+        """
+        Fotos planejadas que ainda precisam ser baixadas: (url, caminho).
+        Consulta o estado e o disco (executado no worker); fotos que não serão
+        baixadas nem aproveitadas devolvem a vaga reservada na cota
+        """
+        jobs = []
+        for i, photo_url in planned:
+            output_path = self._image_output_path(
+                class_name, observation, i, photo_url)
+
+            # Pular se já foi baixada (ou falhou vezes demais)
+            images_before = len(result['images'])
+            if self._photo_needs_download(result, photo_url, output_path):
+                if self.offline:
+                    # Offline: só entram as fotos que já estão no disco
+                    self.prefilter.release(class_name)
+                    with self.lock:
+                        self.stats['offline_skipped'] += 1
+                    continue
+                jobs.append((photo_url, output_path))
+            elif len(result['images']) == images_before:
+                # Desistência (falhou vezes demais): não ocupa a cota
+                self.prefilter.release(class_name)
+        return jobs
+
+    def process_observation(self, observation: Dict, class_name: str,
+                            planned: Optional[List[Tuple[int, str]]] = None) -> Dict:
+        """Processa uma observação e baixa suas imagens (planned: de _plan_photos)"""
+        if planned is None:
+            planned = self._plan_photos(observation, class_name)
+        result = self._observation_record(observation, class_name)
+
+        photos = [
+            self._record_photo(result, photo_url, output_path,
+                               self.download_image(photo_url, output_path))
+            for photo_url, output_path in self._photo_jobs(
+                observation, class_name, result, planned)
+        ]
+
+        self.state.save_observation(result, photos)
         return result
 
     def collect_data_for_class(self, class_name: str, max_observations: int = 1000) -> List[Dict]:
         """Coleta dados para uma classe específica"""
         logger.info(f"Coletando dados para classe: {class_name}")
+        self.learn_class_taxa()
 
         # Buscar termos de busca para esta classe
-        search_terms = self._get_search_terms_for_class(class_name)
-
-        all_observations = []
-
-        for term in search_terms:
-            logger.info(f"Buscando por: {term}")
-            observations = self.search_observations(term, max_pages=5)
-
-            # Filtrar observações para esta classe
-            class_observations = []
-            for obs in observations:
-                if self.classify_observation(obs) == class_name:
-                    class_observations.append(obs)
-
-            all_observations.extend(class_observations)
+        search_terms = self._search_terms(class_name)
 
-            # Limitar número total
-            if len(all_observations) >= max_observations:
-                break
-
-        # Processar observações
         processed_data = []
+        watermarks = []
+        walks = []
 
         # Reduzir workers para evitar conflitos no Windows
         with ThreadPoolExecutor(max_workers=2) as executor:
             futures = []
 
-            for obs in all_observations[:max_observations]:
-                future = executor.submit(
-                    self.process_observation, obs, class_name)
-                futures.append(future)
+            # As observações de cada página entram na fila de download assim que
+            # chegam, enquanto a próxima página é buscada em segundo plano
+            for term in search_terms:
+                logger.info(f"Buscando por: {term}")
+                since, started = self._search_window(term)
+                progress = {'exhausted': False}
+                walks.append((term, progress))
+                if started:
+                    watermarks.append((term, since, started, progress))
+                # Incremental: percorrer todo o delta (sem limite de páginas nem de
+                # observações) para poder avançar a marca
+                max_pages = None if self.incremental else 5
+                limit = None if since else max_observations
+                for page_observations in self.iter_observation_pages(
+                        term, max_pages=max_pages, since=since, progress=progress):
+                    for obs in page_observations:
+                        if (limit is not None and len(futures) >= limit) or \
+                                self.prefilter.quota_full(class_name):
+                            break
+                        if not self._accept_observation(obs, class_name):
+                            continue
+                        # Observação já processada em uma execução anterior
+                        done = self.state.get_observation(obs.get('id'))
+                        if done is not None:
+                            future = Future()
+                            future.set_result(done)
+                            futures.append(future)
+                            continue
+                        # Fotos repetidas ou descartadas saem antes de ocupar um worker
+                        planned = self._plan_photos(obs, class_name)
+                        if not planned:
+                            continue
+                        futures.append(executor.submit(
+                            self.process_observation, obs, class_name, planned))
+
+                    # Limitar número total (observações ou cota de fotos da classe)
+                    if (limit is not None and len(futures) >= limit) or \
+                            self.prefilter.quota_full(class_name):
+                        break
+                if (limit is not None and len(futures) >= limit) or \
+                        self.prefilter.quota_full(class_name):
+                    break
 
             for future in as_completed(futures):
                 try:
@@ -466,16 +803,137 @@ class iNaturalistCollector:
                         with self.lock:
                             self.stats['total_observations'] += 1
 
-                    # Pequeno delay para reduzir conflitos
-                    time.sleep(0.1)
-
                 except Exception as e:
                     logger.error(f"Erro ao processar observação: {e}")
 
+        # Confirmar o último lote de gravações da classe e os ids aprendidos
+        # (close() pode nunca ser chamado, ex.: collect_insect_data.py)
+        self.state.flush()
+        self.taxon_resolver.save_ids(self.taxon_ids_file)
+        self._advance_watermarks(watermarks)
+        self._check_walks(class_name, walks)
+
         logger.info(
             f"Coletadas {len(processed_data)} observações com imagens para {class_name}")
         return processed_data
 
+    def _advance_watermarks(self, watermarks: List, quality_grade: str = "research"):
+        """
+        Avança a marca d'água dos termos cujo delta foi percorrido por inteiro.
+        Na primeira coleta incremental de um termo (sem marca) o início da busca
+        vira a linha de base, mesmo que ela tenha parado no limite de observações
+        """
+        for term, since, started, progress in watermarks:
+            if progress.get('failed'):
+                logger.warning(
+                    f"Busca de '{term}' interrompida por falha; marca d'água mantida")
+            elif progress['exhausted'] or since is None:
+                if since is None:
+                    logger.info(f"Marca d'água inicial de '{term}': {started}")
+                self.state.set_watermark(term, quality_grade, started)
+            else:
+                logger.warning(
+                    f"Delta de '{term}' não foi percorrido por inteiro; "
+                    f"marca d'água mantida")
+
+    def _check_walks(self, class_name: str, walks: List):
+        """
+        Registra se a classe foi percorrida por completo: termos que pararam por
+        falha da API deixam a classe pendente para a retomada (--resume)
+        """
+        failed = [term for term, progress in walks if progress.get('failed')]
+        with self.lock:
+            if failed:
+                self.incomplete_classes.add(class_name)
+            else:
+                self.incomplete_classes.discard(class_name)
+        if failed:
+            logger.warning(
+                f"Classe {class_name} incompleta (falha em {', '.join(failed)}); "
+                f"não será marcada como concluída")
+
+    def is_class_collected(self, class_name: str) -> bool:
+        """A busca da classe chegou ao fim, ao limite ou à cota (sem falhas)"""
+        return class_name not in self.incomplete_classes
+
+    def _resolve_class_taxon_ids(self, class_name: str) -> List[int]:
+        """
+        Ids do iNaturalist dos nomes científicos da classe, mantendo só os mais
+        gerais (ex.: Araneae cobre Salticidae, Thomisidae...)
+        """
+        resolved = {}
+        for name, mapped_class in SCIENTIFIC_NAME_MAPPING.items():
+            if mapped_class != class_name:
+                continue
+            data = self._make_request('taxa', {'q': name, 'is_active': True, 'per_page': 30})
+            if data is None:
+                # Falha na API: resultado parcial, a classe não vai para o cache
+                self.partial_class_taxa.add(class_name)
+                continue
+            for taxon in data.get('results', []):
+                ancestors = ancestor_ids(taxon)
+                if taxon.get('name', '').lower() == name.lower() and \
+                        ANIMALIA_TAXON_ID in ancestors:
+                    resolved[taxon['id']] = set(ancestors)
+                    self.taxon_resolver.learn(taxon['id'], class_name)
+                    break
+            else:
+                logger.warning(f"Táxon não encontrado no iNaturalist: {name}")
+
+        return sorted(taxon_id for taxon_id, ancestors in resolved.items()
+                      if not any(other != taxon_id and other in ancestors
+                                 for other in resolved))
+
+    def resolve_class_taxa(self, class_names: Optional[List[str]] = None) -> Dict[str, List[int]]:
+        """Resolve (uma única vez, com cache em disco) os taxon_ids de cada classe"""
+        if self.class_taxa is None:
+            self.class_taxa = {}
+            if self.class_taxa_file.exists():
+                with open(self.class_taxa_file, 'r', encoding='utf-8') as f:
+                    self.class_taxa = json.load(f).get('classes', {})
+
+        missing = [name for name in (class_names or TARGET_CLASSES)
+                   if name not in self.class_taxa]
+        for class_name in missing:
+            self.class_taxa[class_name] = self._resolve_class_taxon_ids(class_name)
+            logger.info(f"Táxons de {class_name}: {self.class_taxa[class_name]}")
+
+        if missing:
+            # Classes resolvidas pela metade são consultadas de novo na próxima execução
+            cached = {name: ids for name, ids in self.class_taxa.items()
+                      if name not in self.partial_class_taxa}
+            with open(self.class_taxa_file, 'w', encoding='utf-8') as f:
+                json.dump({'resolved_at': datetime.now().isoformat(),
+                           'classes': cached}, f, indent=2, ensure_ascii=False)
+        return self.class_taxa
+
+    def learn_class_taxa(self):
+        """
+        Registra no resolvedor os taxon_ids de todas as classes antes de
+        classificar qualquer observação, para que a busca por texto também
+        resolva pelos ancestrais (ex.: Cycloneda sanguinea -> Coccinellidae)
+        """
+        if self.class_taxa_learned:
+            return
+        for class_name, taxon_ids in self.resolve_class_taxa().items():
+            for taxon_id in taxon_ids:
+                self.taxon_resolver.learn(taxon_id, class_name)
+        self.class_taxa_learned = True
+        self.taxon_resolver.save_ids(self.taxon_ids_file)
+
+    def _search_terms(self, class_name: str) -> List[str]:
+        """
+        Consultas da classe: uma única busca por taxon_id= (modo por táxon)
+        ou os termos de texto livre (q=)
+        """
+        if self.search_by_taxon:
+            taxon_ids = self.resolve_class_taxa([class_name]).get(class_name)
+            if taxon_ids:
+                return [TAXON_QUERY_PREFIX + ','.join(str(i) for i in taxon_ids)]
+            logger.warning(
+                f"Sem taxon_ids para {class_name}; usando busca por texto")
+        return self._get_search_terms_for_class(class_name)
+
     def _get_search_terms_for_class(self, class_name: str) -> List[str]:
         """Retorna termos de busca para uma classe específica"""
         search_terms = {
@@ -504,6 +962,14 @@ class iNaturalistCollector:
         metadata_file = self.output_dir / \
             "metadata" / f"{class_name}_metadata.json"
 
+        # Incremental: juntar às observações já salvas (as novas prevalecem)
+        if self.incremental and metadata_file.exists():
+            with open(metadata_file, 'r', encoding='utf-8') as f:
+                previous = json.load(f).get('observations', [])
+            new_ids = {obs['observation_id'] for obs in data}
+            data = data + [obs for obs in previous
+                           if obs['observation_id'] not in new_ids]
+
         metadata = {
             'class_name': class_name,
             'collection_date': datetime.now().isoformat(),
@@ -524,11 +990,21 @@ class iNaturalistCollector:
         all_data = {}
 
         for class_name in TARGET_CLASSES:
+            if self.state.is_class_complete(class_name):
+                # Retomada: classe concluída em uma execução anterior
+                logger.info(f"Classe já concluída, pulando: {class_name}")
+                all_data[class_name] = [
+                    obs for obs in self.state.class_observations(class_name)
+                    if obs['images']][:max_observations_per_class]
+                continue
+
             try:
                 data = self.collect_data_for_class(
                     class_name, max_observations_per_class)
                 all_data[class_name] = data
                 self.save_metadata(class_name, data)
+                if self.is_class_collected(class_name):
+                    self.state.mark_class_complete(class_name)
 
                 # Pequena pausa entre classes
                 time.sleep(2)
@@ -552,6 +1028,9 @@ class iNaturalistCollector:
             'total_classes': len(TARGET_CLASSES),
             'classes_collected': list(all_data.keys()),
             'statistics': self.stats,
+            'rate_limits': self.rate_limiter.summary(),
+            'harvest_state': self.state.summary(),
+            'http_cache': self.response_cache.stats if self.response_cache else None,
             'class_summary': {}
         }
 
@@ -576,6 +1055,12 @@ class iNaturalistCollector:
         print(f"Downloads bem-sucedidos: {self.stats['successful_downloads']}")
         print(f"Downloads falharam: {self.stats['failed_downloads']}")
         print(f"Duplicatas ignoradas: {self.stats['duplicates_skipped']}")
+        print(f"Observações repetidas entre buscas: {self.stats['duplicate_observations']}")
+        print(f"Fotos repetidas: {self.stats['duplicate_photos']}")
+        print(f"Downloads redundantes evitados: {self.stats['downloads_avoided']}")
+        print(f"Fora da cota por classe: {self.stats['quota_skipped']}")
+        if self.offline:
+            print(f"Não baixadas (offline): {self.stats['offline_skipped']}")
         print(f"Filtradas por qualidade: {self.stats['quality_filtered']}")
         print("="*50)
 
@@ -591,26 +1076,88 @@ def main():
                         help='Máximo de observações por classe')
     parser.add_argument('--api-key',
                         help='Chave da API do iNaturalist (opcional)')
+    parser.add_argument('--resume', action='store_true',
+                        help='Retomar a coleta anterior a partir do estado salvo')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Buscar só observações criadas/atualizadas desde a última coleta')
+    parser.add_argument('--http-cache', action='store_true',
+                        help='Guardar as respostas da API em <output-dir>/http_cache')
+    parser.add_argument('--cache-ttl', type=float, default=86400,
+                        help='Validade das respostas em cache (segundos)')
+    parser.add_argument('--cache-max-mb', type=int, default=500,
+                        help='Tamanho máximo do cache de respostas (MB)')
+    parser.add_argument('--offline', action='store_true',
+                        help='Usar somente respostas do cache e fotos já baixadas, sem acessar a rede')
+    parser.add_argument('--taxon-search', action='store_true',
+                        help='Buscar por taxon_id= (ids resolvidos uma vez e guardados)')
+    parser.add_argument('--min-photo-size', type=int, default=MIN_IMAGE_SIZE,
+                        help='Menor lado aceito da foto original (pré-filtro)')
+    parser.add_argument('--licenses',
+                        help='Licenças aceitas, ex.: cc0,cc-by,cc-by-nc (padrão: todas)')
+    parser.add_argument('--min-identifications', type=int, default=0,
+                        help='Mínimo de identificações da observação')
+    parser.add_argument('--allow-flagged', action='store_true',
+                        help='Aceitar observações/fotos sinalizadas')
+    parser.add_argument('--class-quota', type=int,
+                        help='Máximo de fotos por classe')
+    parser.add_argument('--photo-size', default='auto',
+                        choices=['auto'] + list(PHOTO_SIZES),
+                        help='Variante das fotos (auto: menor que atende a 224 px)')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='Usar o coletor assíncrono (aiohttp)')
+    parser.add_argument('--api-concurrency', type=int, default=2,
+                        help='Requisições simultâneas à API (modo --async)')
+    parser.add_argument('--download-concurrency', type=int, default=16,
+                        help='Downloads de fotos simultâneos (modo --async)')
 
     args = parser.parse_args()
 
     # Criar coletor
-    collector = iNaturalistCollector(args.output_dir, args.api_key)
-
-    if args.target_class:
-        if args.target_class not in TARGET_CLASSES:
-            print(f"Classe inválida: {args.target_class}")
-            print(f"Classes disponíveis: {', '.join(TARGET_CLASSES)}")
-            return
-
-        # Coletar dados para uma classe específica
-        data = collector.collect_data_for_class(
-            args.target_class, args.max_observations)
-        collector.save_metadata(args.target_class, data)
-        collector.print_stats()
-    else:
-        # Coletar dados para todas as classes
-        collector.collect_all_data(args.max_observations)
+    response_cache = None
+    if args.http_cache or args.offline:
+        response_cache = ResponseCache(Path(args.output_dir) / "http_cache",
+                                       ttl=args.cache_ttl,
+                                       max_bytes=args.cache_max_mb * 1024 * 1024,
+                                       offline=args.offline)
+
+    collector = iNaturalistCollector(args.output_dir, args.api_key, resume=args.resume,
+                                     incremental=args.incremental,
+                                     response_cache=response_cache,
+                                     search_by_taxon=args.taxon_search,
+                                     prefilter=MetadataPrefilter(
+                                         min_dimension=args.min_photo_size,
+                                         licenses=args.licenses.split(',') if args.licenses else None,
+                                         quality_grades=['research'],
+                                         min_identifications=args.min_identifications,
+                                         allow_flagged=args.allow_flagged,
+                                         class_quota=args.class_quota),
+                                     photo_size=args.photo_size)
+
+    if args.target_class and args.target_class not in TARGET_CLASSES:
+        print(f"Classe inválida: {args.target_class}")
+        print(f"Classes disponíveis: {', '.join(TARGET_CLASSES)}")
+        return
+
+    try:
+        if args.use_async:
+            from async_harvester import AsyncHarvester
+
+            harvester = AsyncHarvester(collector,
+                                       api_concurrency=args.api_concurrency,
+                                       download_concurrency=args.download_concurrency)
+            classes = [args.target_class] if args.target_class else TARGET_CLASSES
+            harvester.run(classes, args.max_observations)
+        elif args.target_class:
+            # Coletar dados para uma classe específica
+            data = collector.collect_data_for_class(
+                args.target_class, args.max_observations)
+            collector.save_metadata(args.target_class, data)
+            collector.print_stats()
+        else:
+            # Coletar dados para todas as classes
+            collector.collect_all_data(args.max_observations)
+    finally:
+        collector.close()
 
 
 if __name__ == '__main__':
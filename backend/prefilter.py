@@ -0,0 +1,80 @@
+"""
+Pré-filtro de observações e fotos do iNaturalist pelos metadados
+Descarta antes do download o que seria rejeitado depois (dimensões originais,
+licença, sinalizações, grau de qualidade, número de identificações) e aplica
+uma cota de fotos por classe
+"""
+
+import threading
+from typing import Dict, Iterable, Optional
+
+
+class MetadataPrefilter:
+    """Regras aplicadas às observações e fotos antes de agendar downloads"""
+
+    def __init__(self, min_dimension: int = 100,
+                 licenses: Optional[Iterable[str]] = None,
+                 quality_grades: Optional[Iterable[str]] = None,
+                 min_identifications: int = 0,
+                 allow_flagged: bool = False,
+                 class_quota: Optional[int] = None):
+        self.min_dimension = min_dimension
+        # Licenças aceitas em minúsculas ('cc-by', 'cc0'...); 'none' = sem licença
+        self.licenses = {l.lower() for l in licenses} if licenses else None
+        self.quality_grades = set(quality_grades) if quality_grades else None
+        self.min_identifications = min_identifications
+        self.allow_flagged = allow_flagged
+        self.class_quota = class_quota
+
+        self.lock = threading.Lock()
+        self.scheduled = {}
+
+    def _license_ok(self, license_code: Optional[str]) -> bool:
+        if self.licenses is None:
+            return True
+        return (license_code or 'none').lower() in self.licenses
+
+    def check_observation(self, observation: Dict) -> Optional[str]:
+        """Motivo para descartar a observação, ou None se aceita"""
+        if self.quality_grades and observation.get('quality_grade') not in self.quality_grades:
+            return f"grau de qualidade {observation.get('quality_grade')}"
+        if observation.get('identifications_count', 0) < self.min_identifications:
+            return f"{observation.get('identifications_count', 0)} identificações"
+        if not self.allow_flagged and observation.get('flags'):
+            return 'observação sinalizada'
+        return None
+
+    def check_photo(self, photo: Dict) -> Optional[str]:
+        """Motivo para descartar a foto, ou None se aceita"""
+        if not self.allow_flagged and photo.get('flags'):
+            return 'foto sinalizada'
+        if not self._license_ok(photo.get('license_code')):
+            return f"licença {photo.get('license_code')}"
+
+        # Dimensões do original (quando informadas pela API)
+        dimensions = photo.get('original_dimensions') or {}
+        width, height = dimensions.get('width'), dimensions.get('height')
+        if width and height and min(width, height) < self.min_dimension:
+            return f"original pequeno: {width}x{height}"
+        return None
+
+    def quota_full(self, class_name: str) -> bool:
+        if self.class_quota is None:
+            return False
+        with self.lock:
+            return self.scheduled.get(class_name, 0) >= self.class_quota
+
+    def reserve(self, class_name: str) -> bool:
+        """Ocupa uma vaga da cota da classe (False se a cota acabou)"""
+        with self.lock:
+            count = self.scheduled.get(class_name, 0)
+            if self.class_quota is not None and count >= self.class_quota:
+                return False
+            self.scheduled[class_name] = count + 1
+            return True
+
+    def release(self, class_name: str):
+        """Devolve a vaga de um download que falhou"""
+        with self.lock:
+            if self.scheduled.get(class_name):
+                self.scheduled[class_name] -= 1
@@ -0,0 +1,164 @@
+"""
+Limitador de taxa (token bucket) compartilhado pelos coletores
+Seguro entre threads e tarefas asyncio, com um balde por classe de endpoint
+(API e CDN de fotos), respeito a Retry-After/429 e ajuste adaptativo da taxa
+"""
+
+import os
+import time
+import asyncio
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+# Taxas padrão (requisições/segundo) e rajadas por classe de endpoint.
+# A API do iNaturalist pede no máximo ~60 requisições por minuto.
+DEFAULT_LIMITS = {
+    'api': {
+        'rate': float(os.environ.get('INAT_API_RATE', '1.0')),
+        'burst': int(os.environ.get('INAT_API_BURST', '3'))
+    },
+    'photos': {
+        'rate': float(os.environ.get('INAT_PHOTO_RATE', '20.0')),
+        'burst': int(os.environ.get('INAT_PHOTO_BURST', '20'))
+    }
+}
+
+# Códigos que indicam limitação pelo servidor
+THROTTLE_STATUSES = (429, 503)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Segundos indicados em Retry-After (número ou data HTTP)"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class TokenBucket:
+    """
+    Balde de fichas com reserva: cada chamada reserva uma ficha sob um lock
+    curto e recebe quanto deve esperar, de modo que threads e tarefas asyncio
+    compartilham o mesmo balde sem segurar o lock durante a espera.
+
+    A taxa é adaptativa (AIMD): cai pela metade a cada limitação do servidor
+    e volta a subir gradualmente, até a taxa configurada, com as respostas OK.
+    """
+
+    def __init__(self, rate: float, burst: int = 1, min_rate: Optional[float] = None,
+                 recovery: float = 0.05):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate or rate / 16
+        self.capacity = max(1, burst)
+        self.recovery = recovery
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+        self.stats = {'acquired': 0, 'throttled': 0, 'waited_seconds': 0.0}
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _reserve(self) -> float:
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+
+            wait = max(0.0, -self.tokens / self.rate)
+            wait += max(0.0, self.blocked_until - now)
+            self.stats['acquired'] += 1
+            self.stats['waited_seconds'] += wait
+            return wait
+
+    def acquire(self):
+        """Bloqueia a thread até haver ficha disponível"""
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """Versão para asyncio: não bloqueia o loop de eventos"""
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def throttled(self, retry_after: Optional[float] = None) -> float:
+        """
+        Registra uma limitação do servidor (429/503). Reduz a taxa e pausa o
+        balde por Retry-After (ou pelo tempo de uma ficha na nova taxa).
+        Retorna a pausa aplicada, em segundos.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate / 2)
+            pause = retry_after if retry_after is not None else 1.0 / self.rate
+            self.blocked_until = max(self.blocked_until, now + pause)
+            self.tokens = min(self.tokens, 0.0)
+            self.stats['throttled'] += 1
+            return pause
+
+    def succeeded(self):
+        """Resposta OK: recupera a taxa aos poucos (aumento aditivo)"""
+        if self.rate >= self.max_rate:
+            return
+        with self.lock:
+            self._refill(time.monotonic())
+            self.rate = min(self.max_rate, self.rate + self.max_rate * self.recovery)
+
+
+class RateLimiter:
+    """Conjunto de baldes por classe de endpoint ('api', 'photos')"""
+
+    def __init__(self, limits: Optional[Dict[str, Dict]] = None):
+        limits = limits or DEFAULT_LIMITS
+        self.buckets = {
+            name: TokenBucket(config['rate'], config.get('burst', 1))
+            for name, config in limits.items()
+        }
+
+    def bucket(self, kind: str) -> TokenBucket:
+        return self.buckets[kind]
+
+    def acquire(self, kind: str):
+        self.buckets[kind].acquire()
+
+    async def acquire_async(self, kind: str):
+        await self.buckets[kind].acquire_async()
+
+    def observe(self, kind: str, status: int, headers=None) -> Optional[float]:
+        """
+        Ajusta o balde pela resposta recebida. Retorna a pausa aplicada se o
+        servidor limitou a requisição (para o chamador tentar de novo), ou None.
+        """
+        bucket = self.buckets[kind]
+        if status in THROTTLE_STATUSES:
+            retry_after = parse_retry_after((headers or {}).get('Retry-After'))
+            return bucket.throttled(retry_after)
+        if status < 400:
+            bucket.succeeded()
+        return None
+
+    def summary(self) -> Dict[str, Dict]:
+        return {
+            name: dict(bucket.stats, rate=round(bucket.rate, 3),
+                       waited_seconds=round(bucket.stats['waited_seconds'], 1))
+            for name, bucket in self.buckets.items()
+        }
@@ -0,0 +1,161 @@
+"""
+Profiler estatístico por amostragem para workers em produção
+Amostra periodicamente as pilhas das threads que estão atendendo requisições
+(sys._current_frames) e gera um arquivo no formato "collapsed stacks"
+(flamegraph.pl / speedscope)
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+# Seções nativas em andamento por thread (ex.: interpreter.invoke),
+# que não aparecem como frames Python
+_native_sections = {}
+
+# Threads atendendo uma requisição no momento
+_request_threads = set()
+
+# Frames em que uma thread está apenas esperando (fila, lock, socket), ignorados
+# quando todas as threads são amostradas
+IDLE_FRAMES = {
+    ('threading.py', 'wait'),
+    ('threading.py', '_wait_for_tstate_lock'),
+    ('queue.py', 'get'),
+    ('selectors.py', 'select'),
+    ('socket.py', 'accept'),
+    ('socketserver.py', 'serve_forever'),
+}
+
+
+def request_started():
+    """Marca a thread atual como atendendo uma requisição"""
+    _request_threads.add(threading.get_ident())
+
+
+def request_finished():
+    _request_threads.discard(threading.get_ident())
+
+
+@contextmanager
+def native_section(label):
+    """Marca a thread atual como executando código nativo `label`"""
+    thread_id = threading.get_ident()
+    _native_sections[thread_id] = label
+    try:
+        yield
+    finally:
+        _native_sections.pop(thread_id, None)
+
+
+class SamplingProfiler:
+    """
+    Amostrador de pilhas com overhead baixo, executado em uma thread própria.
+    Por padrão só amostra as threads dentro de uma requisição; com
+    all_threads=True amostra todas, exceto as paradas em IDLE_FRAMES.
+    """
+
+    def __init__(self, duration: float, interval: float = 0.005,
+                 output_path: str = None, all_threads: bool = False):
+        self.duration = duration
+        self.interval = interval
+        self.output_path = output_path
+        self.all_threads = all_threads
+        self.samples = Counter()
+        self.total_samples = 0
+        self.idle_samples = 0
+        self.native_samples = Counter()
+        self.started_at = None
+        self.finished_at = None
+        self.thread = None
+
+    def start(self):
+        """Inicia a amostragem em segundo plano"""
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        self.started_at = time.time()
+        deadline = time.perf_counter() + self.duration
+
+        while time.perf_counter() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if not self._is_active(thread_id, frame):
+                    self.idle_samples += 1
+                    continue
+                stack = self._collapse(frame)
+                native = _native_sections.get(thread_id)
+                if native:
+                    stack = f"{stack};[native] {native}"
+                    self.native_samples[native] += 1
+                self.samples[stack] += 1
+                self.total_samples += 1
+            time.sleep(self.interval)
+
+        self.finished_at = time.time()
+
+        if self.output_path:
+            # Escrita atômica: o arquivo só aparece quando estiver completo.
+            # O resumo (amostras ociosas e nativas) vai antes, ao lado do collapsed
+            self._write(self.summary_path, json.dumps(self.summary(), indent=2))
+            self._write(self.output_path, self.collapsed())
+
+    @property
+    def summary_path(self):
+        return f"{self.output_path}.json" if self.output_path else None
+
+    @staticmethod
+    def _write(path, content):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def _is_active(self, thread_id, frame):
+        if thread_id in _native_sections:
+            return True
+        if not self.all_threads:
+            return thread_id in _request_threads
+        code = frame.f_code
+        return (os.path.basename(code.co_filename), code.co_name) not in IDLE_FRAMES
+
+    @staticmethod
+    def _collapse(frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(
+                f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def collapsed(self):
+        """Retorna as pilhas no formato collapsed ("a;b;c <contagem>")"""
+        lines = [f"{stack} {count}" for stack,
+                 count in self.samples.most_common()]
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        return {
+            'pid': os.getpid(),
+            'duration': self.duration,
+            'interval': self.interval,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'all_threads': self.all_threads,
+            'total_samples': self.total_samples,
+            'idle_samples': self.idle_samples,
+            'native_samples': dict(self.native_samples)
+        }
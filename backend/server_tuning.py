@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Ajuste automático de workers do gunicorn, threads por worker e num_threads do TFLite
+Executa benchmarks do /classify local com cada combinação e grava a melhor
+configuração em server_tuning.json, lida pelo gunicorn.conf.py e pelo app.py
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import itertools
+import subprocess
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TUNING_FILE = os.environ.get(
+    'SERVER_TUNING_FILE', os.path.join(BASE_DIR, 'server_tuning.json'))
+
+
+def available_cpus() -> int:
+    """
+    CPUs efetivamente disponíveis: afinidade do processo limitada pela
+    cota de CPU do cgroup (v2: cpu.max, v1: cpu.cfs_quota_us/cpu.cfs_period_us)
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    quota = None
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            limit, period = f.read().split()
+        if limit != 'max':
+            quota = int(limit) / int(period)
+    except (OSError, ValueError):
+        try:
+            with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f:
+                limit = int(f.read())
+            with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as f:
+                period = int(f.read())
+            if limit > 0:
+                quota = limit / period
+        except (OSError, ValueError):
+            pass
+
+    if quota is not None:
+        cpus = min(cpus, max(1, math.ceil(quota)))
+    return cpus
+
+
+def load_tuning() -> dict:
+    """
+    Configuração ajustada, reduzida se a máquina atual tiver menos CPUs
+    do que aquela em que o ajuste foi feito. Vazio se não houver ajuste.
+    """
+    if not os.path.exists(TUNING_FILE):
+        return {}
+    with open(TUNING_FILE, 'r', encoding='utf-8') as f:
+        tuning = json.load(f)
+
+    cpus = available_cpus()
+    workers = min(tuning.get('workers', 1), cpus)
+    tflite_threads = tuning.get('tflite_threads')
+    if tflite_threads:
+        tflite_threads = max(1, min(tflite_threads, cpus // workers))
+
+    return dict(tuning, workers=workers, tflite_threads=tflite_threads)
+
+
+def _wait_ready(url: str, timeout: float) -> bool:
+    import requests
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(url, timeout=2).status_code == 200:
+                return True
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def benchmark(workers: int, threads: int, tflite_threads: int, image_path: str,
+              duration: float, port: int, model: str = None) -> dict:
+    """Sobe o gunicorn com a combinação e mede vazão e latência do /classify"""
+    import requests
+
+    # Os parâmetros de linha de comando têm precedência sobre o gunicorn.conf.py
+    env = dict(os.environ, TFLITE_NUM_THREADS=str(tflite_threads),
+               QUALITY_GATE_ENABLED='0')
+    command = [
+        sys.executable, '-m', 'gunicorn', 'app:app',
+        '--bind', f'127.0.0.1:{port}',
+        '--workers', str(workers),
+        '--threads', str(threads),
+        '--worker-class', 'gthread' if threads > 1 else 'sync',
+        '--timeout', '300',
+        '--log-level', 'warning'
+    ]
+    server = subprocess.Popen(command, cwd=BASE_DIR, env=env)
+    base_url = f'http://127.0.0.1:{port}'
+
+    try:
+        if not _wait_ready(f'{base_url}/species', timeout=120):
+            raise RuntimeError('Servidor não respondeu')
+
+        with open(image_path, 'rb') as f:
+            image_bytes = f.read()
+        params = {'tta': 'off'}
+        if model:
+            params['model'] = model
+
+        def client(deadline):
+            session = requests.Session()
+            latencies = []
+            errors = 0
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                response = session.post(f'{base_url}/classify', params=params,
+                                        files={'image': ('image.jpg', image_bytes)})
+                if response.status_code == 200:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+            return latencies, errors
+
+        # Aquecimento (carga do modelo em todos os workers)
+        warmup = time.perf_counter() + 2
+        with ThreadPoolExecutor(max_workers=workers * threads) as executor:
+            list(executor.map(client, [warmup] * (workers * threads)))
+
+        # Concorrência do cliente = capacidade do servidor
+        concurrency = workers * threads
+        deadline = time.perf_counter() + duration
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(client, [deadline] * concurrency))
+
+        latencies = sorted(l for r in results for l in r[0])
+        errors = sum(r[1] for r in results)
+        if not latencies:
+            raise RuntimeError('Nenhuma requisição bem-sucedida')
+
+        return {
+            'workers': workers,
+            'threads': threads,
+            'tflite_threads': tflite_threads,
+            'requests_per_second': round(len(latencies) / duration, 2),
+            'p50_ms': round(latencies[len(latencies) // 2] * 1000, 1),
+            'p95_ms': round(latencies[int(len(latencies) * 0.95)] * 1000, 1),
+            'errors': errors
+        }
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def candidate_configs(cpus: int):
+    """Combinações a testar, sem ultrapassar 2x as CPUs disponíveis"""
+    worker_options = sorted({1, max(1, cpus // 2), cpus})
+    thread_options = (1, 2, 4)
+    tflite_options = sorted({1, 2, cpus})
+
+    for workers, threads, tflite_threads in itertools.product(
+            worker_options, thread_options, tflite_options):
+        if workers * tflite_threads <= cpus * 2:
+            yield workers, threads, tflite_threads
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Ajusta workers/threads do servidor para esta máquina')
+    parser.add_argument('--image', required=True,
+                        help='Imagem usada nas requisições de teste')
+    parser.add_argument('--duration', type=float, default=15,
+                        help='Segundos de medição por combinação')
+    parser.add_argument('--port', type=int, default=5055,
+                        help='Porta local usada nos testes')
+    parser.add_argument('--model', help='Modelo do registro a testar (opcional)')
+    parser.add_argument('--max-p95-ms', type=float,
+                        help='Descartar combinações com p95 acima deste valor')
+    parser.add_argument('--output', default=TUNING_FILE,
+                        help='Arquivo de saída')
+
+    args = parser.parse_args()
+
+    cpus = available_cpus()
+    print(f"CPUs disponíveis (afinidade/cgroup): {cpus}")
+
+    results = []
+    for workers, threads, tflite_threads in candidate_configs(cpus):
+        print(f"Testando workers={workers} threads={threads} "
+              f"tflite_threads={tflite_threads}...")
+        try:
+            result = benchmark(workers, threads, tflite_threads, args.image,
+                               args.duration, args.port, args.model)
+        except Exception as e:
+            print(f"   Falhou: {e}")
+            continue
+        print(f"   {result['requests_per_second']} req/s, "
+              f"p50 {result['p50_ms']} ms, p95 {result['p95_ms']} ms")
+        results.append(result)
+
+    eligible = [r for r in results
+                if args.max_p95_ms is None or r['p95_ms'] <= args.max_p95_ms]
+    if not eligible:
+        print("Nenhuma combinação válida encontrada")
+        return
+
+    best = max(eligible, key=lambda r: (r['requests_per_second'], -r['p95_ms']))
+    tuning = {
+        'workers': best['workers'],
+        'threads': best['threads'],
+        'worker_class': 'gthread' if best['threads'] > 1 else 'sync',
+        'tflite_threads': best['tflite_threads'],
+        'tuned_at': datetime.now().isoformat(),
+        'tuned_cpus': cpus,
+        'best': best,
+        'results': results
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(tuning, f, indent=2, ensure_ascii=False)
+
+    print(f"\nMelhor configuração: workers={best['workers']} threads={best['threads']} "
+          f"tflite_threads={best['tflite_threads']} ({best['requests_per_second']} req/s)")
+    print(f"Configuração salva em: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
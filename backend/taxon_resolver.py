@@ -0,0 +1,144 @@
+"""
+Resolução de táxons do iNaturalist para as classes do projeto
+Mapas pré-compilados com consulta O(1): id do táxon e ids dos ancestrais
+(ancestor_ids/ancestry das observações) e, como alternativa, tokens exatos do
+nome científico e do nome comum, sem comparações por substring
+"""
+
+import os
+import re
+import json
+import threading
+from typing import Dict, List, Optional
+
+from disk_lru import temp_path
+
+# Id do reino Animalia no iNaturalist (descarta homônimos de plantas/fungos)
+ANIMALIA_TAXON_ID = 1
+
+_TOKEN_RE = re.compile(r"[^\W\d_]+", re.UNICODE)
+
+
+def _tokens(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def ancestor_ids(taxon: Dict) -> List[int]:
+    """Ids dos ancestrais, do mais geral ao mais específico"""
+    ids = taxon.get('ancestor_ids')
+    if ids:
+        return [int(i) for i in ids]
+    ancestry = taxon.get('ancestry') or ''
+    return [int(i) for i in ancestry.split('/') if i.isdigit()]
+
+
+class TaxonResolver:
+    """
+    Resolve o táxon de uma observação para uma classe:
+    1. id do táxon; 2. ancestrais, do mais específico ao mais geral;
+    3. nome científico exato ou gênero (primeiro token); 4. nome comum por
+    token exato (núcleo do nome primeiro). Os passos por nome só valem para
+    táxons de Animalia (ex.: o gênero de plantas Harmonia não é joaninha);
+    táxons resolvidos pelo nome têm o id memorizado, para que descendentes
+    sejam resolvidos pelos ancestrais.
+    """
+
+    def __init__(self, scientific_names: Dict[str, str],
+                 common_names: Optional[Dict[str, str]] = None,
+                 taxon_ids: Optional[Dict[int, str]] = None,
+                 common_name_overrides: Optional[Dict[str, Dict[str, str]]] = None):
+        self.names = {name.lower(): class_name
+                      for name, class_name in scientific_names.items()}
+        self.common_tokens = {token.lower(): class_name
+                              for token, class_name in (common_names or {}).items()}
+        # token do nome comum -> {token qualificador: classe}
+        # ex.: 'wasp' + 'parasitoid' -> vespa_parasitoide
+        self.common_overrides = {
+            token.lower(): {q.lower(): c for q, c in qualifiers.items()}
+            for token, qualifiers in (common_name_overrides or {}).items()
+        }
+        self.taxon_ids = dict(taxon_ids or {})
+        self.lock = threading.Lock()
+        self.dirty = False
+
+    def learn(self, taxon_id: int, class_name: str):
+        with self.lock:
+            if self.taxon_ids.get(taxon_id) != class_name:
+                self.taxon_ids[taxon_id] = class_name
+                self.dirty = True
+
+    def _resolve_name(self, scientific_name: str) -> Optional[str]:
+        name = scientific_name.strip().lower()
+        if not name:
+            return None
+        class_name = self.names.get(name)
+        if class_name is None:
+            # Espécies e subespécies: gênero = primeiro token
+            genus = name.split(' ', 1)[0]
+            class_name = self.names.get(genus)
+        return class_name
+
+    def _resolve_common_name(self, common_name: str) -> Optional[str]:
+        tokens = _tokens(common_name)
+        if not tokens:
+            return None
+        token_set = set(tokens)
+        # Em inglês o núcleo do nome é a última palavra ("spider wasp" é vespa,
+        # "wasp spider" é aranha); em português, a primeira ("vespa-aranha")
+        for token in [tokens[-1], tokens[0]] + tokens[1:-1]:
+            class_name = self.common_tokens.get(token)
+            if class_name is None:
+                continue
+            for qualifier, override in self.common_overrides.get(token, {}).items():
+                if qualifier in token_set:
+                    return override
+            return class_name
+        return None
+
+    def resolve(self, taxon: Dict) -> Optional[str]:
+        if not taxon:
+            return None
+
+        taxon_id = taxon.get('id')
+        class_name = self.taxon_ids.get(taxon_id)
+        if class_name:
+            return class_name
+
+        ancestors = ancestor_ids(taxon)
+        for ancestor_id in reversed(ancestors):
+            class_name = self.taxon_ids.get(ancestor_id)
+            if class_name:
+                return class_name
+
+        if ANIMALIA_TAXON_ID not in ancestors:
+            return None
+
+        class_name = self._resolve_name(taxon.get('name', ''))
+        if class_name:
+            if taxon_id:
+                self.learn(taxon_id, class_name)
+            return class_name
+
+        return self._resolve_common_name(taxon.get('preferred_common_name') or '')
+
+    # Persistência dos ids aprendidos/resolvidos
+
+    def load_ids(self, path: str):
+        if not os.path.exists(path):
+            return
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        with self.lock:
+            for taxon_id, class_name in data.get('taxon_ids', {}).items():
+                self.taxon_ids.setdefault(int(taxon_id), class_name)
+
+    def save_ids(self, path: str):
+        with self.lock:
+            if not self.dirty:
+                return
+            data = {'taxon_ids': {str(k): v for k, v in sorted(self.taxon_ids.items())}}
+            self.dirty = False
+        tmp_path = temp_path(str(path))
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)
@@ -0,0 +1,80 @@
+"""
+Testes do manifesto de assets e do delta entre versões (asset_manifest.py)
+Execute: python -m pytest test_asset_manifest.py
+"""
+
+import os
+import threading
+
+from asset_manifest import AssetManifest
+
+
+def make_manifest(tmp_path):
+    galerias = tmp_path / 'galerias'
+    (galerias / 'aranhas' / 'thumbs').mkdir(parents=True)
+    (galerias / 'aranhas' / 'imagem01.jpg').write_bytes(b'a1')
+    (galerias / 'aranhas' / 'imagem02.jpg').write_bytes(b'a2')
+    (galerias / 'aranhas' / 'thumbs' / 'imagem01_128.jpg').write_bytes(b't')
+    (galerias / 'aranhas' / 'notas.txt').write_text('ignorado')
+    manifest = AssetManifest(
+        [{'dir': str(galerias), 'url_prefix': '/galerias',
+          'extensions': ('.jpg', '.json'), 'exclude_dirs': ('thumbs',)}],
+        state_dir=str(tmp_path / 'state'), refresh_interval=0)
+    return manifest, galerias
+
+
+def test_manifesto_lista_assets_filtrados(tmp_path):
+    manifest, _ = make_manifest(tmp_path)
+    current = manifest.current()
+    assert sorted(current['assets']) == [
+        '/galerias/aranhas/imagem01.jpg', '/galerias/aranhas/imagem02.jpg']
+    assert current['assets']['/galerias/aranhas/imagem01.jpg']['size'] == 2
+
+
+def test_versao_depende_so_do_conteudo(tmp_path):
+    manifest, _ = make_manifest(tmp_path)
+    version = manifest.current()['version']
+    assert manifest.current()['version'] == version
+
+
+def test_delta_entre_versoes(tmp_path):
+    manifest, galerias = make_manifest(tmp_path)
+    old_version = manifest.current()['version']
+
+    (galerias / 'aranhas' / 'imagem01.jpg').write_bytes(b'a1 alterada')
+    os.remove(galerias / 'aranhas' / 'imagem02.jpg')
+    (galerias / 'aranhas' / 'imagem03.jpg').write_bytes(b'a3')
+
+    delta = manifest.delta(old_version)
+    assert delta['from_version'] == old_version
+    assert delta['to_version'] == manifest.current()['version'] != old_version
+    assert list(delta['added']) == ['/galerias/aranhas/imagem03.jpg']
+    assert list(delta['changed']) == ['/galerias/aranhas/imagem01.jpg']
+    assert delta['removed'] == ['/galerias/aranhas/imagem02.jpg']
+
+
+def test_delta_versao_desconhecida(tmp_path):
+    manifest, _ = make_manifest(tmp_path)
+    assert manifest.delta('0123456789abcdef') is None
+    assert manifest.delta('../hash_cache') is None
+
+
+def test_escritas_concorrentes_nao_colidem(tmp_path):
+    path = str(tmp_path / 'estado.json')
+    errors = []
+
+    def write(value):
+        try:
+            for _ in range(50):
+                AssetManifest._write_json(path, {'value': value})
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert not list(tmp_path.glob('*.tmp'))
@@ -0,0 +1,218 @@
+"""
+Testes dos índices pré-agregados de feedback (feedback_index.py)
+Execute: python -m pytest test_feedback_index.py
+"""
+
+import multiprocessing
+from datetime import datetime, timedelta
+
+import pytest
+
+from feedback_index import (FeedbackRollups, FeedbackSpatialIndex, _PersistentIndex,
+                            extract_coordinates, parse_bbox, parse_timestamp, tile_for)
+
+
+def feedback(predicted_class='joaninhas', correct=True, timestamp='2026-10-01T10:30:00',
+             lat=None, lon=None, model=None):
+    return {
+        'predicted_class': predicted_class,
+        'user_feedback': 'correct' if correct else 'incorrect',
+        'timestamp': timestamp,
+        'model': model,
+        'location': {'latitude': lat, 'longitude': lon} if lat is not None else {}
+    }
+
+
+def test_parse_bbox():
+    assert parse_bbox('-48.1,-22.5,-47.9,-22.3') == (-48.1, -22.5, -47.9, -22.3)
+
+
+@pytest.mark.parametrize('bbox', ['1,2,3', '1,2,3,4,5', 'a,b,c,d', '3,0,1,1', '0,3,1,1'])
+def test_parse_bbox_invalido(bbox):
+    with pytest.raises(ValueError):
+        parse_bbox(bbox)
+
+
+def test_extract_coordinates():
+    assert extract_coordinates({'lat': '-22.1', 'lng': '-47.5'}) == (-22.1, -47.5)
+    assert extract_coordinates({'latitude': 91, 'longitude': 0}) is None
+    assert extract_coordinates({'latitude': None}) is None
+    assert extract_coordinates('sem localização') is None
+
+
+def test_tile_for_negativos():
+    # floor, não truncamento: -0.005 fica no tile -1
+    assert tile_for(-0.005, 0.005) == (-1, 0)
+
+
+def test_query_por_bbox_e_data(tmp_path):
+    index = FeedbackSpatialIndex(str(tmp_path / 'index.json'))
+    index.add(feedback(lat=-22.001, lon=-47.001))
+    index.add(feedback(correct=False, lat=-22.001, lon=-47.001))
+    index.add(feedback('aranhas', lat=10.0, lon=10.0))
+    index.add(feedback('aranhas', timestamp='2026-09-01T08:00:00', lat=-22.001, lon=-47.001))
+    index.add(feedback())
+
+    inside = index.query(parse_bbox('-47.5,-22.5,-46.5,-21.5'), per_tile=True)
+    assert inside['total_feedbacks'] == 3
+    assert inside['class_accuracy']['joaninhas'] == {
+        'correct': 1, 'total': 2, 'accuracy_rate': 50.0}
+    assert list(inside['tiles']) == ['-2201,-4701']
+
+    recent = index.query(parse_bbox('-47.5,-22.5,-46.5,-21.5'), since='2026-10-01')
+    assert recent['total_feedbacks'] == 2
+
+    everything = index.query()
+    assert everything['total_feedbacks'] == 5
+
+
+@pytest.mark.parametrize('since', ['ontem', '2026-13-01', '01/10/2026'])
+def test_query_since_invalido(tmp_path, since):
+    index = FeedbackSpatialIndex(str(tmp_path / 'index.json'))
+    with pytest.raises(ValueError):
+        index.query(since=since)
+
+
+def test_query_since_com_hora_e_fuso(tmp_path):
+    index = FeedbackSpatialIndex(str(tmp_path / 'index.json'))
+    index.add(feedback(timestamp='2026-09-30T10:00:00'))
+    index.add(feedback())
+    assert index.query(since='2026-10-01T08:00:00')['total_feedbacks'] == 1
+    assert index.query(since='2026-10-01T00:00:00Z')['total_feedbacks'] >= 1
+
+
+def test_query_bbox_grande_percorre_tiles_ocupados(tmp_path):
+    index = FeedbackSpatialIndex(str(tmp_path / 'index.json'))
+    index.add(feedback(lat=1.0, lon=1.0))
+    assert index.query(parse_bbox('-180,-90,180,90'))['total_feedbacks'] == 1
+
+
+def test_load_reconstroi_a_partir_dos_feedbacks(tmp_path):
+    import json
+    feedback_file = tmp_path / 'feedback_data.json'
+    feedback_file.write_text(json.dumps([feedback(lat=1.0, lon=1.0)] * 3))
+
+    index = FeedbackSpatialIndex(str(tmp_path / 'index.json'))
+    index.load(str(feedback_file))
+    assert index.query()['total_feedbacks'] == 3
+
+    # Outra instância (outro worker) lê o índice salvo sem reconstruir
+    other = FeedbackSpatialIndex(str(tmp_path / 'index.json'))
+    other.load(str(feedback_file))
+    assert other.record_count == 3
+
+
+def test_indice_abstrato():
+    with pytest.raises(TypeError):
+        _PersistentIndex('indice.json')
+
+
+def _add_many(index_file, count):
+    index = FeedbackSpatialIndex(index_file)
+    for _ in range(count):
+        index.add(feedback(lat=1.0, lon=1.0))
+
+
+def test_workers_concorrentes_nao_perdem_incrementos(tmp_path):
+    index_file = str(tmp_path / 'index.json')
+    workers = [multiprocessing.Process(target=_add_many, args=(index_file, 25))
+               for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+        assert worker.exitcode == 0
+
+    assert FeedbackSpatialIndex(index_file).query()['total_feedbacks'] == 100
+    assert not list(tmp_path.glob('*.tmp'))
+
+
+def rollups_with(tmp_path, *feedbacks):
+    rollups = FeedbackRollups(str(tmp_path / 'rollups.json'))
+    for item in feedbacks:
+        rollups.add(item)
+    return rollups
+
+
+def test_series_diaria_preenche_buckets_vazios(tmp_path):
+    rollups = rollups_with(
+        tmp_path,
+        feedback(timestamp='2026-10-01T10:00:00'),
+        feedback(correct=False, timestamp='2026-10-01T11:00:00'),
+        feedback('aranhas', timestamp='2026-10-03T09:00:00'))
+
+    series = rollups.series('2026-10-01', '2026-10-04', granularity='day')
+    assert [p['bucket'] for p in series['points']] == [
+        '2026-10-01', '2026-10-02', '2026-10-03', '2026-10-04']
+    assert [p['total'] for p in series['points']] == [2, 0, 1, 0]
+    assert series['points'][0]['accuracy_rate'] == 50.0
+    assert series['total_feedbacks'] == 3
+
+
+def test_series_horaria_por_classe_e_modelo(tmp_path):
+    rollups = rollups_with(
+        tmp_path,
+        feedback(timestamp='2026-10-01T10:05:00', model='optimized'),
+        feedback('aranhas', timestamp='2026-10-01T12:40:00', model='optimized'),
+        feedback('aranhas', timestamp='2026-10-01T12:50:00', model='default'))
+
+    series = rollups.series('2026-10-01T10:00:00', '2026-10-01T12:59:00',
+                            granularity='hour', class_name='aranhas')
+    assert series['series_key'] == 'class:aranhas'
+    assert [(p['bucket'], p['total']) for p in series['points']] == [
+        ('2026-10-01T10', 0), ('2026-10-01T11', 0), ('2026-10-01T12', 2)]
+
+    by_model = rollups.series('2026-10-01T10:00:00', '2026-10-01T12:59:00',
+                              granularity='hour', model='optimized')
+    assert by_model['total_feedbacks'] == 2
+
+
+def test_series_aceita_datas_com_fuso(tmp_path):
+    rollups = rollups_with(tmp_path, feedback(timestamp='2026-10-01T10:00:00'))
+    series = rollups.series('2026-10-01T00:00:00Z', '2026-10-02T00:00:00+00:00',
+                            granularity='day')
+    assert series['granularity'] == 'day'
+    assert datetime.fromisoformat(series['start']).tzinfo is None
+
+    # Sem granularidade: compara com datetime.now() sem erro de fuso
+    assert rollups.series('2026-10-01T00:00:00Z', '2026-10-01T06:00:00Z')['points']
+
+
+def test_series_granularidade_automatica(tmp_path):
+    rollups = rollups_with(tmp_path)
+    now = datetime.now()
+    recent = rollups.series((now - timedelta(hours=5)).isoformat(), now.isoformat())
+    assert recent['granularity'] == 'hour'
+    assert rollups.series('2020-01-01', '2020-01-02')['granularity'] == 'day'
+
+
+@pytest.mark.parametrize('start, end, granularity', [
+    ('bogus', '2026-10-02', 'day'),
+    ('2026-10-01', 'amanhã', None),
+    ('2026-10-05', '2026-10-01', 'day'),
+    ('2026-10-01', '2026-10-02', 'week'),
+    ('2000-01-01', '2026-10-01', 'hour'),
+])
+def test_series_parametros_invalidos(tmp_path, start, end, granularity):
+    with pytest.raises(ValueError):
+        rollups_with(tmp_path).series(start, end, granularity=granularity)
+
+
+def test_series_rejeita_classe_e_modelo_juntos(tmp_path):
+    with pytest.raises(ValueError):
+        rollups_with(tmp_path).series('2026-10-01', '2026-10-02', class_name='aranhas',
+                                      model='optimized')
+
+
+def test_parse_timestamp_converte_para_relogio_local():
+    local = datetime(2026, 10, 1, 12, 0).astimezone()
+    assert parse_timestamp(local.isoformat()) == datetime(2026, 10, 1, 12, 0)
+
+
+def test_compact_remove_buckets_horarios_antigos(tmp_path):
+    rollups = rollups_with(
+        tmp_path,
+        feedback(timestamp='2026-09-01T10:00:00'),
+        feedback(timestamp='2026-10-18T10:00:00'))
+    assert rollups.compact(now=datetime(2026, 10, 19)) == 1
+    assert rollups.series('2026-09-01', '2026-09-01', granularity='day')['total_feedbacks'] == 1
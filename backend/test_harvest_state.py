@@ -0,0 +1,85 @@
+"""
+Testes do estado persistente da coleta (harvest_state.py)
+Execute: python -m pytest test_harvest_state.py
+"""
+
+import sqlite3
+
+import harvest_state
+from harvest_state import PHOTO_DONE, PHOTO_FAILED, HarvestState
+
+
+def record(observation_id, class_name='joaninhas'):
+    return {'observation_id': observation_id, 'class': class_name, 'images': []}
+
+
+def committed(db_path, sql):
+    """Consulta por outra conexão: só enxerga o que já teve commit"""
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(sql).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_observacao_e_fotos_gravadas_juntas(tmp_path):
+    state = HarvestState(tmp_path / 'state.db')
+    state.save_observation(record(1), [
+        ('https://x/1/medium.jpg', '/dados/a.jpg', PHOTO_DONE),
+        ('https://x/2/medium.jpg', '/dados/b.jpg', PHOTO_FAILED)])
+    state.save_observation(record(1), [('https://x/2/medium.jpg', '/dados/b.jpg', PHOTO_FAILED)])
+
+    assert state.get_observation(1)['class'] == 'joaninhas'
+    assert state.get_photo('https://x/1/medium.jpg')['status'] == PHOTO_DONE
+    assert state.get_photo('https://x/2/medium.jpg')['attempts'] == 2
+    state.close()
+
+
+def test_commit_agrupado_por_pagina(tmp_path):
+    db_path = str(tmp_path / 'state.db')
+    state = HarvestState(db_path)
+    for observation_id in range(5):
+        state.save_observation(record(observation_id))
+    assert committed(db_path, 'SELECT COUNT(*) FROM observations') == 0
+
+    # A página seguinte confirma o lote pendente
+    state.save_page('Coccinellidae', 'research', 200, 0, [{'id': 1}])
+    assert committed(db_path, 'SELECT COUNT(*) FROM observations') == 5
+    assert state.pending == 0
+    state.close()
+
+
+def test_commit_ao_atingir_o_limite_do_lote(tmp_path, monkeypatch):
+    monkeypatch.setattr(harvest_state, 'COMMIT_EVERY', 3)
+    db_path = str(tmp_path / 'state.db')
+    state = HarvestState(db_path)
+    state.save_observation(record(1), [('u1', 'p1', PHOTO_DONE)])
+    assert committed(db_path, 'SELECT COUNT(*) FROM photos') == 0
+    state.save_observation(record(2))
+    assert committed(db_path, 'SELECT COUNT(*) FROM photos') == 1
+    state.close()
+
+
+def test_flush_e_close_confirmam_pendentes(tmp_path):
+    db_path = str(tmp_path / 'state.db')
+    state = HarvestState(db_path)
+    state.save_observation(record(1))
+    state.flush()
+    assert committed(db_path, 'SELECT COUNT(*) FROM observations') == 1
+
+    state.save_observation(record(2))
+    state.close()
+    assert committed(db_path, 'SELECT COUNT(*) FROM observations') == 2
+
+
+def test_reset_mantem_marcas_dagua(tmp_path):
+    state = HarvestState(tmp_path / 'state.db')
+    state.set_watermark('Araneae', 'research', '2026-10-01T00:00:00')
+    state.save_observation(record(1))
+    state.mark_class_complete('joaninhas')
+    state.reset()
+
+    assert state.get_observation(1) is None
+    assert not state.is_class_complete('joaninhas')
+    assert state.get_watermark('Araneae', 'research') == '2026-10-01T00:00:00'
+    state.close()
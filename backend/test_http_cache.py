@@ -0,0 +1,155 @@
+"""
+Testes do cache em disco das respostas da API (http_cache.py)
+Execute: python -m pytest test_http_cache.py
+"""
+
+import os
+
+import pytest
+
+import http_cache
+from http_cache import ResponseCache
+from inaturalist_collector import iNaturalistCollector
+
+URL = 'https://api.inaturalist.org/v1/observations'
+
+
+class Clock:
+    """Relógio de parede controlado pelo teste"""
+
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(http_cache.time, 'time', clock)
+    return clock
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None, headers=None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+
+    def json(self):
+        return self.body
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeSession:
+    """Registra os cabeçalhos enviados e responde com a resposta configurada"""
+
+    def __init__(self, response=None):
+        self.response = response
+        self.sent_headers = []
+
+    def get(self, url, params=None, timeout=None, headers=None):
+        if self.response is None:
+            pytest.fail('requisição à API com resposta em cache')
+        self.sent_headers.append(headers)
+        return self.response
+
+
+def test_chave_normaliza_parametros():
+    key = ResponseCache.key
+    assert key(URL, {'has_photos': True, 'per_page': 200}) == \
+        key(URL, {'per_page': '200', 'has_photos': 'true'})
+    assert key(URL, {'a': 1, 'b': 2}) == key(URL, {'b': 2, 'a': 1})
+    assert key(URL, {'has_photos': True}) != key(URL, {'has_photos': False})
+    assert key(URL, None) == key(URL, {})
+    assert key(URL, {}) != key(URL + '/1', {})
+
+
+def test_entrada_vence_apos_o_ttl(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path), ttl=60)
+    assert cache.lookup(URL, {'q': 'Araneae'}) is None
+
+    cache.store(URL, {'q': 'Araneae'}, {'results': [1]},
+                {'ETag': '"v1"', 'Last-Modified': 'Mon, 19 Oct 2026 10:00:00 GMT'})
+    entry = cache.lookup(URL, {'q': 'Araneae'})
+    assert cache.is_fresh(entry)
+    assert cache.hit(entry) == {'results': [1]}
+    assert cache.stats['hits'] == 1
+
+    clock.now += 61
+    assert not cache.is_fresh(entry)
+    assert ResponseCache.conditional_headers(entry) == {
+        'If-None-Match': '"v1"', 'If-Modified-Since': 'Mon, 19 Oct 2026 10:00:00 GMT'}
+    assert ResponseCache.conditional_headers(None) == {}
+
+
+def test_revalidacao_renova_a_entrada(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path), ttl=60)
+    cache.store(URL, {'q': 'Araneae'}, {'results': [1]}, {'ETag': '"v1"'})
+    clock.now += 61
+
+    entry = cache.lookup(URL, {'q': 'Araneae'})
+    assert cache.revalidated(URL, {'q': 'Araneae'}, entry) == {'results': [1]}
+    assert cache.stats['revalidated'] == 1
+
+    # A entrada gravada de novo vale por mais um TTL e mantém o ETag
+    renewed = cache.lookup(URL, {'q': 'Araneae'})
+    assert cache.is_fresh(renewed)
+    assert renewed['etag'] == '"v1"'
+    assert len(os.listdir(tmp_path)) == 1
+
+
+def test_resposta_304_pelo_coletor(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / 'cache'), ttl=60)
+    collector = iNaturalistCollector(str(tmp_path / 'dados'), response_cache=cache)
+    params = {'q': 'Araneae', 'has_photos': True}
+    cache.store(collector.base_url + '/observations', params, {'results': [1]},
+                {'ETag': '"v1"'})
+    clock.now += 61
+
+    collector.session = FakeSession(FakeResponse(304))
+    assert collector._make_request('observations', params) == {'results': [1]}
+    assert collector.session.sent_headers == [{'If-None-Match': '"v1"'}]
+
+    # Renovada pelo 304: a próxima consulta não vai à API
+    collector.session = FakeSession()
+    assert collector._make_request('observations', params) == {'results': [1]}
+    collector.close()
+
+
+def test_offline_serve_entradas_vencidas(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / 'cache'), ttl=60, offline=True)
+    collector = iNaturalistCollector(str(tmp_path / 'dados'), response_cache=cache)
+    collector.session = FakeSession()
+    cache.store(collector.base_url + '/observations', {'q': 'Araneae'}, {'results': [1]})
+    clock.now += 10 * 86400
+
+    assert collector._make_request('observations', {'q': 'Araneae'}) == {'results': [1]}
+    assert collector._make_request('observations', {'q': 'Odonata'}) is None
+    assert cache.stats['hits'] == 1 and cache.stats['misses'] == 1
+    collector.close()
+
+
+def test_remove_as_menos_acessadas_acima_do_limite(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_bytes=10 ** 9)
+    # Conteúdo pouco compressível: cada entrada ocupa alguns KB no disco
+    for i in range(3):
+        cache.store(URL, {'page': i}, {'results': os.urandom(4096).hex()})
+    sizes = [os.path.getsize(cache._path(cache.key(URL, {'page': i}))) for i in range(3)]
+
+    # Acessos em ordem: a página 1 é a menos recente
+    for age, page in ((300, 1), (200, 0), (100, 2)):
+        path = cache._path(cache.key(URL, {'page': page}))
+        mtime = os.path.getmtime(path) - age
+        os.utime(path, (mtime, mtime))
+
+    cache.max_bytes = sum(sizes) + sizes[0] // 2
+    cache.store(URL, {'page': 3}, {'results': os.urandom(4096).hex()})
+
+    assert cache.lookup(URL, {'page': 1}) is None
+    assert cache.lookup(URL, {'page': 3}) is not None
+    assert cache.stats['evictions'] >= 1
+    assert cache.total_bytes <= cache.max_bytes
@@ -0,0 +1,41 @@
+"""
+Testes do filtro de qualidade usado antes da inferência (image_quality.py)
+Execute: python -m pytest test_image_quality.py
+"""
+
+import numpy as np
+
+from image_quality import ImageQualityValidator
+
+
+def validator():
+    return ImageQualityValidator(min_size=(64, 64), max_blur_threshold=30.0,
+                                 min_brightness=0.08, max_brightness=0.95)
+
+
+def textured(level=128, amplitude=60, size=128):
+    rng = np.random.default_rng(0)
+    noise = rng.integers(-amplitude, amplitude, size=(size, size))
+    return np.clip(level + noise, 0, 255).astype(np.uint8)
+
+
+def test_imagem_nitida_aceita():
+    result = validator().assess_gray(textured(), (1024, 768))
+    assert result['valid'] and result['reasons'] == []
+
+
+def test_motivos_de_rejeicao():
+    assert validator().assess_gray(np.full((128, 128), 128, np.uint8),
+                                   (1024, 768))['reasons'] == ['too_blurry']
+    assert 'too_dark' in validator().assess_gray(textured(5, amplitude=15), (1024, 768))['reasons']
+    assert 'too_bright' in validator().assess_gray(textured(250, amplitude=15), (1024, 768))['reasons']
+    assert validator().assess_gray(textured(), (32, 900))['reasons'] == ['too_small']
+
+
+def test_importacao_sem_efeitos_colaterais(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    import importlib
+    import image_quality
+    importlib.reload(image_quality)
+    # Nada de data_processor.log nem outros arquivos no diretório do servidor
+    assert not list(tmp_path.iterdir())
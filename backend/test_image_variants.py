@@ -0,0 +1,91 @@
+"""
+Testes das variantes de imagem das galerias (image_variants.py / disk_lru.py)
+Execute: python -m pytest test_image_variants.py
+"""
+
+import os
+
+import pytest
+from PIL import Image
+
+from disk_lru import temp_path
+from image_variants import ALLOWED_WIDTHS, ImageVariantCache, negotiate_format, snap_width
+
+
+@pytest.mark.parametrize('requested, expected', [
+    (1, 64), (64, 64), (65, 128), (321, 480), (1600, 1600), (10 ** 6, 1600)])
+def test_snap_width(requested, expected):
+    assert snap_width(requested) == expected
+
+
+def test_negotiate_format():
+    assert negotiate_format('webp', '', 'a.jpg') == 'webp'
+    assert negotiate_format('auto', 'image/webp,*/*', 'a.jpg') == 'webp'
+    assert negotiate_format('auto', '*/*', 'a.jpg') == 'jpeg'
+    assert negotiate_format(None, 'image/webp', 'a.PNG') == 'png'
+    with pytest.raises(ValueError):
+        negotiate_format('gif', '', 'a.jpg')
+
+
+def make_image(path, size=(1000, 500)):
+    Image.new('RGB', size, (120, 80, 40)).save(path)
+    return str(path)
+
+
+def test_variante_gerada_e_reaproveitada(tmp_path):
+    cache = ImageVariantCache(str(tmp_path / 'cache'), 10 * 1024 * 1024)
+    source = make_image(tmp_path / 'imagem01.jpg')
+
+    path, mimetype = cache.get(source, 320, 'webp')
+    assert mimetype == 'image/webp'
+    with Image.open(path) as img:
+        assert img.width == 320
+    assert cache.get(source, 320, 'webp')[0] == path
+    assert cache.stats['hits'] == 1 and cache.stats['misses'] == 1
+
+
+def test_origem_que_nao_e_imagem(tmp_path):
+    cache = ImageVariantCache(str(tmp_path / 'cache'), 10 * 1024 * 1024)
+    listing = tmp_path / 'lista.json'
+    listing.write_text('[]')
+    with pytest.raises(ValueError):
+        cache.get(str(listing), 320, 'jpeg')
+    assert not os.listdir(cache.cache_dir)
+
+
+def test_variante_removida_e_gerada_de_novo(tmp_path):
+    cache = ImageVariantCache(str(tmp_path / 'cache'), 10 * 1024 * 1024)
+    source = make_image(tmp_path / 'imagem01.jpg')
+    path, _ = cache.get(source, 128, 'jpeg')
+    os.remove(path)
+    assert cache.get(source, 128, 'jpeg')[0] == path
+    assert os.path.exists(path)
+
+
+def test_lru_remove_as_menos_acessadas(tmp_path):
+    sources = [make_image(tmp_path / f'imagem{i}.png', (800, 800)) for i in range(4)]
+    cache = ImageVariantCache(str(tmp_path / 'cache'), 10 * 1024 * 1024)
+    paths = []
+    for i, source in enumerate(sources):
+        path, _ = cache.get(source, ALLOWED_WIDTHS[-1], 'png')
+        os.utime(path, (i, i))
+        paths.append(path)
+    # Limite para duas variantes: saem as duas acessadas há mais tempo
+    cache.max_bytes = os.path.getsize(paths[0]) * 2
+    cache._added(paths[-1], 0)
+
+    assert os.path.exists(paths[-1])
+    assert not os.path.exists(paths[0])
+    assert cache.total_bytes <= cache.max_bytes
+    assert cache.stats['evictions'] >= 1
+
+
+def test_temp_path_distinto_entre_processos_filhos(tmp_path):
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.write(write_fd, temp_path('variante.webp').encode('utf-8'))
+        os._exit(0)
+    os.waitpid(pid, 0)
+    child = os.read(read_fd, 1024).decode('utf-8')
+    assert child != temp_path('variante.webp')
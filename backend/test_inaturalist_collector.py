@@ -0,0 +1,223 @@
+"""
+Testes do coletor do iNaturalist (inaturalist_collector.py) sem acesso à rede:
+a API é substituída por páginas geradas no próprio teste
+Execute: python -m pytest test_inaturalist_collector.py
+"""
+
+import json
+
+import pytest
+
+from http_cache import ResponseCache
+from prefilter import MetadataPrefilter
+from inaturalist_collector import (iNaturalistCollector, photo_url_for_size,
+                                   select_photo_size)
+
+LADYBUG_TAXON = {'id': 48486, 'name': 'Coccinellidae', 'ancestor_ids': [1, 47120, 48486]}
+
+
+def observation(observation_id, photos=()):
+    return {'id': observation_id, 'quality_grade': 'research',
+            'taxon': dict(LADYBUG_TAXON), 'photos': list(photos)}
+
+
+def photo(photo_id, **fields):
+    return dict({'id': photo_id,
+                 'url': f'https://static.inaturalist.org/photos/{photo_id}/square.jpg'},
+                **fields)
+
+
+def fake_download(photo_url, output_path):
+    output_path.write_bytes(b'jpeg')
+    return True
+
+
+class FakeAPI:
+    """Responde às buscas de observações com ids decrescentes, em páginas"""
+
+    def __init__(self, total=210):
+        self.ids = list(range(total, 0, -1))
+        self.calls = []
+        self.failing_taxa = set()
+        self.failing_pages = False
+
+    def __call__(self, endpoint, params):
+        self.calls.append((endpoint, dict(params)))
+        if endpoint == 'taxa':
+            if params['q'] in self.failing_taxa:
+                return None
+            if params['q'] == 'Coccinellidae':
+                return {'results': [dict(LADYBUG_TAXON, ancestor_ids=[48460, 1, 47120])]}
+        if endpoint != 'observations' or params.get('q') != 'Coccinellidae':
+            return {'results': []}
+        below = params.get('id_below')
+        if below is not None and self.failing_pages:
+            return None
+        ids = [i for i in self.ids if below is None or i < below]
+        return {'results': [observation(i, [photo(i)]) for i in ids[:params['per_page']]]}
+
+    def observation_calls(self):
+        return [params for endpoint, params in self.calls
+                if endpoint == 'observations' and params.get('q') == 'Coccinellidae']
+
+
+
+@pytest.mark.parametrize('width, height, expected', [
+    (None, None, 'medium'),
+    (4000, 3000, 'medium'),
+    (200, 150, 'small'),
+    (4000, 1000, 'large'),
+    (20000, 2000, 'original'),
+])
+def test_select_photo_size(width, height, expected):
+    photo = {'original_dimensions': {'width': width, 'height': height}}
+    assert select_photo_size(photo) == expected
+
+
+def test_photo_url_for_size():
+    base = 'https://inaturalist-open-data.s3.amazonaws.com/photos/123'
+    assert photo_url_for_size(f'{base}/square.jpg', 'medium') == f'{base}/medium.jpg'
+    assert photo_url_for_size(f'{base}/square.jpeg?1545', 'large') == f'{base}/large.jpeg?1545'
+    assert photo_url_for_size('https://exemplo.org/foto.jpg', 'large') == \
+        'https://exemplo.org/foto.jpg'
+
+
+@pytest.fixture
+def make_collector(tmp_path, monkeypatch):
+    def make(**kwargs):
+        collector = iNaturalistCollector(str(tmp_path / 'dados'), **kwargs)
+        api = FakeAPI()
+        monkeypatch.setattr(collector, '_make_request', api)
+        monkeypatch.setattr(collector, 'download_image', fake_download)
+        collector.api = api
+        return collector
+    return make
+
+
+def test_primeira_coleta_incremental_grava_linha_de_base(make_collector):
+    collector = make_collector(incremental=True)
+    collector.collect_data_for_class('joaninhas', max_observations=5)
+
+    # Parou no limite de observações, mas a marca d'água inicial é gravada
+    assert len(collector.seen_observation_ids) == 5
+    assert collector.state.get_watermark('Coccinellidae', 'research') is not None
+    collector.close()
+
+
+def test_delta_percorrido_inteiro_sem_limite(make_collector):
+    collector = make_collector(incremental=True)
+    collector.state.set_watermark('Coccinellidae', 'research', '2026-01-01T00:00:00+00:00')
+    collector.collect_data_for_class('joaninhas', max_observations=5)
+
+    calls = collector.api.observation_calls()
+    assert len(calls) == 2
+    assert all(params['updated_since'] == '2026-01-01T00:00:00+00:00' for params in calls)
+    assert len(collector.seen_observation_ids) == 210
+    assert collector.state.get_watermark('Coccinellidae', 'research') > '2026-01-01'
+    collector.close()
+
+
+def test_delta_interrompido_mantem_a_marca(make_collector):
+    collector = make_collector(incremental=True)
+    collector.state.set_watermark('Coccinellidae', 'research', '2026-01-01T00:00:00+00:00')
+    since, started = collector._search_window('Coccinellidae')
+    collector._advance_watermarks(
+        [('Coccinellidae', since, started, {'exhausted': False})])
+    assert collector.state.get_watermark('Coccinellidae', 'research') == since
+    collector.close()
+
+
+def test_falha_na_pagina_deixa_a_classe_pendente(make_collector, monkeypatch):
+    monkeypatch.setattr('inaturalist_collector.time.sleep', lambda seconds: None)
+    collector = make_collector(incremental=True)
+    collector.api.failing_pages = True
+    collector.collect_all_data(max_observations_per_class=500)
+
+    # Só a primeira página de Coccinellidae chegou: joaninhas fica para a retomada
+    assert len(collector.seen_observation_ids) == 200
+    assert not collector.state.is_class_complete('joaninhas')
+    assert collector.state.get_watermark('Coccinellidae', 'research') is None
+    assert collector.state.is_class_complete('aranhas')
+    collector.close()
+
+
+def test_coleta_completa_sem_marca(make_collector):
+    collector = make_collector()
+    collector.collect_data_for_class('joaninhas', max_observations=5)
+    assert collector.state.get_watermark('Coccinellidae', 'research') is None
+    assert 'updated_since' not in collector.api.observation_calls()[0]
+    collector.close()
+
+
+
+def test_offline_serve_so_fotos_ja_baixadas(make_collector, tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path / 'cache'), offline=True)
+    collector = make_collector(response_cache=cache, photo_size='medium')
+    monkeypatch.setattr(collector, 'download_image',
+                        lambda *args: pytest.fail('download no modo offline'))
+    obs = observation(7, [
+        {'id': 1, 'url': 'https://static.inaturalist.org/photos/1/square.jpg'},
+        {'id': 2, 'url': 'https://static.inaturalist.org/photos/2/square.jpg'}])
+
+    # A primeira foto já está no disco
+    existing = collector._image_output_path(
+        'joaninhas', obs, 0, 'https://static.inaturalist.org/photos/1/medium.jpg')
+    existing.write_bytes(b'jpeg')
+
+    result = collector.process_observation(obs, 'joaninhas')
+    assert result['images'] == [str(existing)]
+    assert collector.stats['offline_skipped'] == 1
+    assert collector.prefilter.scheduled['joaninhas'] == 1
+    collector.close()
+
+
+def test_busca_por_texto_classifica_pelos_ancestrais(make_collector, tmp_path):
+    collector = make_collector()
+    cycloneda = {'id': 48505, 'name': 'Cycloneda sanguinea',
+                 'ancestor_ids': [48460, 1, 47120, 48486]}
+    collector.learn_class_taxa()
+    assert collector.classify_observation({'taxon': cycloneda}) == 'joaninhas'
+
+    # Ids gravados sem depender de close()
+    saved = json.loads((tmp_path / 'dados' / 'metadata' / 'taxon_ids.json').read_text())
+    assert saved['taxon_ids']['48486'] == 'joaninhas'
+
+    # Outra execução reaproveita class_taxa.json sem consultar a API
+    other = make_collector()
+    other.learn_class_taxa()
+    assert other.classify_observation({'taxon': cycloneda}) == 'joaninhas'
+    assert not [call for call in other.api.calls if call[0] == 'taxa']
+
+
+def test_classe_com_falha_na_api_nao_vai_para_o_cache(make_collector, tmp_path):
+    collector = make_collector()
+    collector.api.failing_taxa.add('Salticidae')
+    collector.learn_class_taxa()
+
+    cached = json.loads((tmp_path / 'dados' / 'metadata' / 'class_taxa.json').read_text())
+    assert 'aranhas' not in cached['classes']
+    assert cached['classes']['joaninhas'] == [48486]
+
+
+def test_fotos_repetidas_saem_antes_de_submeter(make_collector):
+    collector = make_collector(photo_size='medium')
+    first = observation(1, [photo(10), photo(11, flags=[{'flag': 'spam'}])])
+    second = observation(2, [photo(10)])
+
+    assert collector._plan_photos(first, 'joaninhas') == [
+        (0, 'https://static.inaturalist.org/photos/10/medium.jpg')]
+    assert collector._plan_photos(second, 'joaninhas') == []
+    assert collector.stats['duplicate_photos'] == 1
+    assert collector.stats['quality_filtered'] == 1
+    collector.close()
+
+
+def test_cota_reservada_antes_de_submeter(make_collector):
+    collector = make_collector(prefilter=MetadataPrefilter(class_quota=3))
+    data = collector.collect_data_for_class('joaninhas', max_observations=100)
+
+    # A cota para a busca logo após a terceira foto agendada
+    assert len(data) == 3
+    assert collector.prefilter.scheduled['joaninhas'] == 3
+    assert len(collector.seen_observation_ids) == 3
+    collector.close()
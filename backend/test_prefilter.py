@@ -0,0 +1,82 @@
+"""
+Testes do pré-filtro por metadados e da cota por classe (prefilter.py)
+Execute: python -m pytest test_prefilter.py
+"""
+
+import threading
+
+import pytest
+
+from prefilter import MetadataPrefilter
+
+
+@pytest.mark.parametrize('observation, reason', [
+    ({'quality_grade': 'casual'}, 'grau de qualidade casual'),
+    ({'quality_grade': 'research', 'identifications_count': 1}, '1 identificações'),
+    ({'quality_grade': 'research', 'identifications_count': 3, 'flags': [{'id': 1}]},
+     'observação sinalizada'),
+    ({'quality_grade': 'research', 'identifications_count': 2}, None),
+])
+def test_check_observation(observation, reason):
+    prefilter = MetadataPrefilter(quality_grades=['research'], min_identifications=2)
+    assert prefilter.check_observation(observation) == reason
+
+
+@pytest.mark.parametrize('photo, reason', [
+    ({'flags': [{'id': 1}]}, 'foto sinalizada'),
+    ({'license_code': 'cc-by-nc'}, 'licença cc-by-nc'),
+    ({'license_code': None}, 'licença None'),
+    ({'license_code': 'CC0', 'original_dimensions': {'width': 2000, 'height': 90}},
+     'original pequeno: 2000x90'),
+    ({'license_code': 'cc-by', 'original_dimensions': {'width': 2000, 'height': 1500}}, None),
+    ({'license_code': 'cc0'}, None),  # sem dimensões: decide após o download
+])
+def test_check_photo(photo, reason):
+    prefilter = MetadataPrefilter(licenses=['cc-by', 'CC0'])
+    assert prefilter.check_photo(photo) == reason
+
+
+def test_sem_regras_aceita_tudo():
+    prefilter = MetadataPrefilter()
+    assert prefilter.check_observation({'quality_grade': 'casual'}) is None
+    assert prefilter.check_photo({'license_code': None}) is None
+    assert prefilter.allow_flagged is False
+    assert MetadataPrefilter(allow_flagged=True).check_photo({'flags': [1]}) is None
+
+
+def test_cota_reserva_e_devolve():
+    prefilter = MetadataPrefilter(class_quota=2)
+    assert prefilter.reserve('aranhas') and prefilter.reserve('aranhas')
+    assert prefilter.quota_full('aranhas')
+    assert not prefilter.reserve('aranhas')
+    assert not prefilter.quota_full('joaninhas')
+
+    prefilter.release('aranhas')
+    assert not prefilter.quota_full('aranhas')
+    assert prefilter.reserve('aranhas')
+
+    # Devolver sem reserva não deixa a contagem negativa
+    prefilter.release('joaninhas')
+    assert prefilter.scheduled.get('joaninhas', 0) == 0
+
+
+def test_sem_cota_nunca_enche():
+    prefilter = MetadataPrefilter()
+    for _ in range(1000):
+        assert prefilter.reserve('aranhas')
+    assert not prefilter.quota_full('aranhas')
+
+
+def test_cota_entre_threads():
+    prefilter = MetadataPrefilter(class_quota=50)
+    granted = []
+
+    def reserve_many():
+        granted.extend(ok for ok in (prefilter.reserve('vespa') for _ in range(40)) if ok)
+
+    threads = [threading.Thread(target=reserve_many) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(granted) == 50
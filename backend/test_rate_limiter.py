@@ -0,0 +1,101 @@
+"""
+Testes do limitador de taxa compartilhado pelos coletores (rate_limiter.py)
+Execute: python -m pytest test_rate_limiter.py
+"""
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+
+import rate_limiter
+from rate_limiter import RateLimiter, TokenBucket, parse_retry_after
+
+
+class Clock:
+    """Relógio monotônico controlado pelo teste"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limiter.time, 'monotonic', clock)
+    return clock
+
+
+def test_rajada_sem_espera_e_depois_uma_ficha_por_intervalo(clock):
+    bucket = TokenBucket(rate=2.0, burst=3)
+    assert [bucket._reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket._reserve() == pytest.approx(0.5)
+    assert bucket._reserve() == pytest.approx(1.0)
+
+    # Depois de esperar as reservas, o balde volta a encher até a capacidade
+    clock.now += 10
+    assert bucket._reserve() == 0.0
+    assert bucket.stats['acquired'] == 6
+
+
+def test_limitacao_reduz_taxa_pela_metade_ate_o_minimo(clock):
+    bucket = TokenBucket(rate=8.0, burst=1, min_rate=1.0)
+    bucket.throttled()
+    assert bucket.rate == 4.0
+    for _ in range(5):
+        bucket.throttled()
+    assert bucket.rate == 1.0
+    assert bucket.stats['throttled'] == 6
+
+
+def test_retry_after_pausa_o_balde(clock):
+    bucket = TokenBucket(rate=10.0, burst=5)
+    assert bucket.throttled(retry_after=30) == 30
+    # Pausa do servidor mais uma ficha na taxa reduzida (5/s)
+    assert bucket._reserve() == pytest.approx(30.2)
+
+    clock.now += 31
+    assert bucket._reserve() == 0.0
+
+
+def test_respostas_ok_recuperam_a_taxa_aos_poucos(clock):
+    bucket = TokenBucket(rate=10.0, recovery=0.1)
+    bucket.throttled()
+    assert bucket.rate == 5.0
+    bucket.succeeded()
+    assert bucket.rate == pytest.approx(6.0)
+    for _ in range(10):
+        bucket.succeeded()
+    assert bucket.rate == 10.0
+
+
+def test_acquire_async_nao_bloqueia_sem_espera():
+    bucket = TokenBucket(rate=1.0, burst=2)
+    asyncio.run(bucket.acquire_async())
+    assert bucket.stats['acquired'] == 1
+
+
+def test_parse_retry_after():
+    assert parse_retry_after('120') == 120.0
+    assert parse_retry_after('-5') == 0.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after('depois') is None
+
+    when = datetime.now(timezone.utc) + timedelta(seconds=60)
+    assert 55 <= parse_retry_after(format_datetime(when, usegmt=True)) <= 60
+
+
+def test_rate_limiter_observe(clock):
+    limiter = RateLimiter({'api': {'rate': 4.0, 'burst': 1}})
+    assert limiter.observe('api', 200) is None
+    assert limiter.observe('api', 404) is None
+    assert limiter.observe('api', 429, {'Retry-After': '7'}) == 7.0
+    assert limiter.bucket('api').rate == 2.0
+
+    # 503 sem Retry-After pausa pelo tempo de uma ficha na nova taxa
+    assert limiter.observe('api', 503) == pytest.approx(1.0)
+    assert limiter.summary()['api']['throttled'] == 2
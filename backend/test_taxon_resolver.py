@@ -0,0 +1,115 @@
+"""
+Testes da resolução táxon -> classe (taxon_resolver.py)
+Execute: python -m pytest test_taxon_resolver.py
+"""
+
+import pytest
+
+from inaturalist_collector import (COMMON_NAME_MAPPING, COMMON_NAME_OVERRIDES,
+                                   SCIENTIFIC_NAME_MAPPING)
+from taxon_resolver import TaxonResolver, ancestor_ids
+
+COCCINELLIDAE_ID = 48486
+PLANTAE_ID = 47126
+
+
+def animal(**fields):
+    """Táxon de Animalia sem ancestrais conhecidos pelo resolvedor"""
+    return dict({'ancestor_ids': [48460, 1]}, **fields)
+
+
+@pytest.fixture
+def resolver():
+    return TaxonResolver(SCIENTIFIC_NAME_MAPPING, COMMON_NAME_MAPPING,
+                         common_name_overrides=COMMON_NAME_OVERRIDES)
+
+
+def test_ancestor_ids_aceita_lista_ou_ancestry():
+    assert ancestor_ids({'ancestor_ids': ['1', 47120]}) == [1, 47120]
+    assert ancestor_ids({'ancestry': '48460/1/47120'}) == [48460, 1, 47120]
+    assert ancestor_ids({}) == []
+
+
+def test_especie_resolvida_pelo_ancestral(resolver):
+    cycloneda = {'id': 48505, 'name': 'Cycloneda sanguinea',
+                 'ancestor_ids': [48460, 1, 47120, 372739, 47158, COCCINELLIDAE_ID]}
+    assert resolver.resolve(cycloneda) is None
+
+    resolver.learn(COCCINELLIDAE_ID, 'joaninhas')
+    assert resolver.resolve(cycloneda) == 'joaninhas'
+
+
+def test_ancestral_mais_especifico_prevalece(resolver):
+    resolver.learn(47336, 'vespa_predadora')
+    resolver.learn(47335, 'vespa_parasitoide')
+    taxon = {'id': 9, 'name': 'Sem nome', 'ancestor_ids': [1, 47336, 47335]}
+    assert resolver.resolve(taxon) == 'vespa_parasitoide'
+
+
+def test_nome_cientifico_e_genero(resolver):
+    assert resolver.resolve(animal(name='Coccinellidae')) == 'joaninhas'
+    assert resolver.resolve(animal(name='Harmonia axyridis')) == 'joaninhas'
+    assert resolver.resolve(animal(name='Orius insidiosus')) == 'percevejo_orius'
+
+
+@pytest.mark.parametrize('taxon', [
+    {'id': 4, 'name': 'Harmonia nutans', 'ancestor_ids': [48460, PLANTAE_ID]},
+    {'id': 4, 'name': 'Harmonia axyridis'},  # sem ancestrais: reino desconhecido
+    {'id': 4, 'name': 'Desconhecido', 'preferred_common_name': 'Wasp Spider',
+     'ancestor_ids': [48460, PLANTAE_ID]},
+])
+def test_nome_fora_de_animalia_nao_resolve(resolver, taxon):
+    assert resolver.resolve(taxon) is None
+    assert 4 not in resolver.taxon_ids
+    assert not resolver.dirty
+
+
+def test_nome_resolvido_memoriza_o_id(resolver):
+    resolver.resolve(animal(id=4, name='Coccinella septempunctata'))
+    assert resolver.taxon_ids[4] == 'joaninhas'
+    assert resolver.dirty
+    # Descendentes desconhecidos passam a ser resolvidos pelo ancestral
+    assert resolver.resolve({'id': 5, 'name': 'X', 'ancestor_ids': [1, 4]}) == 'joaninhas'
+
+
+@pytest.mark.parametrize('common_name, expected', [
+    ('Spider Wasp', 'vespa_predadora'),
+    ('Wasp Spider', 'aranhas'),
+    ('Parasitoid Wasp', 'vespa_parasitoide'),
+    ('vespa parasitoide', 'vespa_parasitoide'),
+    ('Joaninha-vermelha', 'joaninhas'),
+])
+def test_nome_comum_pelo_nucleo(resolver, common_name, expected):
+    taxon = animal(name='Desconhecido', preferred_common_name=common_name)
+    assert resolver.resolve(taxon) == expected
+
+
+@pytest.mark.parametrize('taxon', [
+    animal(name='Araneaeformis'),
+    animal(name='Harmoniella'),
+    animal(name='', preferred_common_name='Spiderwort'),
+    animal(name='', preferred_common_name='Waspish moth'),
+])
+def test_sem_falsos_positivos_por_substring(resolver, taxon):
+    assert resolver.resolve(taxon) is None
+
+
+def test_taxon_vazio(resolver):
+    assert resolver.resolve(None) is None
+    assert resolver.resolve({}) is None
+
+
+def test_ids_persistidos(resolver, tmp_path):
+    path = str(tmp_path / 'taxon_ids.json')
+    resolver.save_ids(path)
+    assert not (tmp_path / 'taxon_ids.json').exists()  # nada aprendido
+
+    resolver.learn(COCCINELLIDAE_ID, 'joaninhas')
+    resolver.save_ids(path)
+    assert not resolver.dirty
+
+    assert [p.name for p in tmp_path.iterdir()] == ['taxon_ids.json']
+
+    other = TaxonResolver(SCIENTIFIC_NAME_MAPPING)
+    other.load_ids(path)
+    assert other.taxon_ids == {COCCINELLIDAE_ID: 'joaninhas'}